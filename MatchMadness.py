@@ -10,24 +10,43 @@ In a multiplayer game, players take turn flipping cards to find matches. Each ma
 In a solo game, the player will try to flip as many cards as possible within the time limit (3 minutes). The game ends either when the timer finishes or when all cards are matched. 
 '''
 
+import time
+START_TIME = time.perf_counter()  #For the startup timings (before anything else is imported)
+
 import tkinter as tk
-from tkinter import messagebox
-import random
-import os 
+import argparse
+import json
+import math
+import os
+from card_cache import IMAGE_CACHE
+from prefetch import GENERATED_FOLDER, ThemePrefetcher
+from engine import GameEngine, DIFFICULTIES, SOLO_TIME_LIMIT, FLIP_IGNORED, FLIP_SECOND, MATCH
+from canvas_board import CanvasBoard
+from scheduler import FrameScheduler, CountdownTimer
+from ai import ComputerPlayer
+from spectate import GameStream
+from replay import ReplayRecorder, new_seed, seeded_engine
+from snapshot import SNAPSHOT_WRITER, load_snapshot, pack_snapshot, snapshot_path
+from telemetry import TELEMETRY
+from app_paths import data_path
+IMPORTS_DONE = time.perf_counter()
 
 
 #Constant variables
 
-#Grid size depending on difficulty of game
-DIFFICULTIES = {
-"Easy": (3,4), 
-"Medium": (4,4),
-"Hard": (5,6)
-}
-
 #Space between cards
 PADDING = 6 
 
+#Boards with at least this many cards are drawn on a single canvas instead of one button per card
+CANVAS_MIN_CARDS = 36
+
+#Largest card drawn on the canvas board, and the space it can use (window minus sidebar)
+CANVAS_CARD_SIZE = 90
+CANVAS_AREA = (860, 730)
+
+#Size card faces are shown at on the button boards (the theme images are scaled to it once and cached on disk)
+BUTTON_FACE_SIZE = 90
+
 #Turn label colours for multiplayer
 PLAYER_TURN_COLOURS = {
     1: "pale violet red",   #Player 1 = pink
@@ -35,30 +54,75 @@ PLAYER_TURN_COLOURS = {
 }
 
 
-#Timer for solo mode
-time_left = 180 
+#How long two flipped cards stay visible before a mismatch is flipped back (seconds)
+REVEAL_DELAY = 0.6
+
+#How often the end screen checks whether the game's statistics are ready (milliseconds)
+RESULTS_POLL_MS = 15
+
+#Computer opponent: which player it plays as, how well it plays (easy, medium, perfect), and the pause before each of its flips (seconds)
+COMPUTER_SEAT = 2
+COMPUTER_LEVEL = "perfect"
+COMPUTER_DELAY = 0.5
+
+#Theme, difficulty and player mode picked last time (in the data folder), restored once the menu is on screen
+LAST_SETTINGS_FILE = "last_settings.json"
 
 
 #Helper functions
-              
-#Loads an image file into a Tkinter PhotoImage
-def load_photo(path):
-    return tk.PhotoImage(file=path)
-
-#Returns a list of full paths for images in cards folder
-def list_image_files(folder: str):
-    endings = (".png", ".jpg") #valid file endings
-    files = []
-    for name in os.listdir(folder):
-        if name.lower().endswith(endings):
-            files.append(os.path.join(folder, name))
-    files.sort()
-    return files
 
+#Imports tkinter.messagebox on first use (only rules and warnings need it, not the first paint)
+def messagebox():
+    from tkinter import messagebox as module
+    return module
+
+#Reads the theme, difficulty and player mode picked last time (None if there are none)
+def load_last_settings():
+    try:
+        with open(data_path(LAST_SETTINGS_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+#Remembers the picked theme, difficulty and player mode for the next launch
+def save_last_settings(settings):
+    path = data_path(LAST_SETTINGS_FILE)
+    try:
+        with open(path + ".tmp", "w") as file:
+            json.dump(settings, file)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+
+#Timer label text for the seconds left, as mm:ss
+def format_timer(seconds_left):
+    mins, secs = divmod(seconds_left, 60)
+    return 'Timer: {:02d}:{:02d}'.format(mins, secs)
+
+#Size (width and height) card faces are shown at on a board
+def face_size(rows, cols):
+    if rows * cols < CANVAS_MIN_CARDS:
+        return BUTTON_FACE_SIZE
+    area_width, area_height = CANVAS_AREA
+    return min(CANVAS_CARD_SIZE, area_width // cols - PADDING, area_height // rows - PADDING)
+
+#A shuffled board with its card images, ready to be played
+class Deal:
+    #Constructor
+    def __init__(self, settings, engine, card_paths, card_images, face_paths, face_images, seed=None):
+        self.settings = settings  #(theme, difficulty, player mode, computer seat) the deal was made for
+        self.seed = seed  #Seed the board was shuffled with (None when the server deals)
+        self.engine = engine
+        self.card_paths = card_paths
+        self.card_images = card_images
+        self.face_paths = face_paths  #Image path per pair id
+        self.face_images = face_images  #Image per pair id
+        self.board_reset = False  #True once the previous game's cards were turned back under the end screen
+              
 #Controls Match Madness Game 
 class MatchMadness:
     #Constructor
-    def __init__(self, root):
+    def __init__(self, root, server=None, room="default", seed=None):
         self.root = root
         self.root.title("Match Madness")
         self.root.geometry("800x600")
@@ -68,62 +132,234 @@ class MatchMadness:
         self.selected_player = None
         self.timer_label = None
         self.timer_running = False  #Tracks if timer is running
+        self.countdown_timer = None
+        self.reveal_delay = REVEAL_DELAY
+        self.reveal_event = None  #Pending check_match for the two face up cards
+        self.computer_seat = None  #Player number played by the computer, None for two humans
+        self.computer = None
         self.game_completed = False  #Tracks if game was completed (vs time out)
+        self.engine = None
+        self.board_key = None  #(rows, cols, player mode) of the board widgets currently built
+        self.end_overlay = None  #End screen, built once per board and shown over it
+        self.next_deal = None  #Next game, dealt while the end screen is shown
+        self.last_start_predealt = False  #Whether the last game started from a pre-dealt board
+        self.play_again_times = {"predealt": [], "cold": []}  #Play Again latency in seconds
+
+        #Replay logs: every local game is dealt from a seed and its flips are recorded
+        self.fixed_seed = seed  #Deal every game from this seed (reproducing a bug report), None for random deals
+        self.seed = None  #Seed of the current game's deal (None when the server deals)
+        self.recorder = None  #ReplayRecorder of the current game
+        self.replay = None  #ReplayPlayer while a recorded game is played back
+
+        #The game in progress is saved on every change, so quitting mid-game can be resumed from the menu
+        self.faces_bundled = False  #Current game's faces come from the theme bundle (kept in the saved game)
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_game)
+
+        #Online multiplayer: the game server runs the rules, this window mirrors them
+        self.server_address = server  #"host:port", None to play multiplayer on this computer
+        self.room = room
+        self.client = None
+        self.seat = None  #Our player number in the online room
+        self.online_started = False  #Both players are in the room
         
-        #Screens
-        self.game_frame = tk.Frame(root)
+        #Loads theme images in the background while the player is in the menu
+        self.prefetcher = ThemePrefetcher(root)
+
+        #Owns every timed event (countdown, mismatch flip-back) and batches label updates per frame
+        self.scheduler = FrameScheduler(root)
+
+        #Live deltas of the game for spectators (lobby screens, tools)
+        self.stream = GameStream()
+
+        #Finished games are saved in the background, the end screen shows rank and records once they are
+        self.results_store = None  #Opened when the first game is saved
+        self.results_polling = False
+
+        #Screens (the game screen is built when the first game starts)
+        self.game_frame = None
+        self.startup_times = {"imports": IMPORTS_DONE - START_TIME, "tk": time.perf_counter() - START_TIME}
         self.menu = MenuFrame(root, self, players=self.selected_player)
+        self.startup_times["menu"] = time.perf_counter() - START_TIME
+        self.menu.menu_frame.bind("<Expose>", self.first_paint)
+        self.on_startup = None  #Called once the menu is on screen
+
+    #Runs when the menu is first drawn, then warms up what was picked last time while the player looks at it
+    def first_paint(self, event):
+        self.menu.menu_frame.unbind("<Expose>")
+        self.startup_times["first_paint"] = time.perf_counter() - START_TIME
+        self.root.after_idle(self.menu.restore_last_settings)
+        self.root.after_idle(lambda: self.menu.show_resume_button(os.path.exists(snapshot_path())))
+        if self.on_startup:
+            self.on_startup()
     
-    #Updates the timer display every second and ends the game when time runs out
-    def countdown(self):
-        global time_left
-        if self.timer_running and time_left > 0:
-            time_left -= 1 #decrease time by 1 second if time is left
-            mins, secs = divmod(time_left, 60)
-            timeFormat = '{:02d}:{:02d}'.format(mins, secs) #format the time according to the seconds
-            
-            if self.timer_label:
-                self.timer_label.config(text=f"Timer: {timeFormat}")
-                
-            #Call countdown again
-            self.root.after(1000, self.countdown)
-        elif time_left <= 0: #when time runs out
-            self.timer_running = False
-            self.game_completed = False  #Time ran out
-            self.end_game()
-            return
+    #Updates the timer display, called by the countdown timer every second
+    def countdown(self, seconds_left):
+        self.timer_text = format_timer(seconds_left)
+        self.stream.tick(seconds_left)
+        self.scheduler.update("timer", self.draw_timer)
+        self.save_snapshot()
+
+    #Draws the timer (batched by the scheduler, at most once per frame)
+    def draw_timer(self):
+        if self.timer_label:
+            self.timer_label.config(text=self.timer_text)
+
+    #Ends the game when time runs out
+    def time_up(self):
+        self.timer_running = False
+        if self.recorder:
+            self.recorder.time_up()
+        if self.replay is None:
+            TELEMETRY.time_up()
+
+        #Two cards flipped before time ran out still count
+        self.cancel_reveal()
+        if self.engine.awaiting_resolve():
+            result, idx1, idx2 = self.engine.resolve()
+            if result == MATCH:
+                self.stream.match(idx1, idx2, self.engine.current_player)
+            self.update_scores()
+
+        self.game_completed = self.engine.over  #Only completed if that last pair cleared the board
+        self.engine.end()
+        self.end_game()
                 
-    #Timer function
-    def timer(self):
-        global time_left 
-        time_left = 180
+    #Timer function, counts down against a fixed monotonic deadline so it never runs long (elapsed: seconds already used)
+    def timer(self, elapsed=0.0):
+        self.countdown_timer = CountdownTimer(self.scheduler, SOLO_TIME_LIMIT, self.countdown, self.time_up, group=self)
         self.timer_running = True
-        self.countdown() 
+        self.countdown_timer.start(elapsed)
 
-    #Starts the game with selected difficulty and theme
-    def start_game(self):
+    #Stops the timer and cancels this game's pending timed events
+    def stop_timed_events(self):
+        self.timer_running = False
+        if self.countdown_timer:
+            self.countdown_timer.stop()
+        self.cancel_reveal()
+        self.scheduler.cancel_group(self)
+
+    #Current game settings
+    def current_settings(self):
+        return (self.selected_theme, self.selected_difficulty, self.selected_player, self.computer_seat)
 
+    #Shuffles a new board for the current settings and attaches its card images
+    def deal_game(self):
         rows, cols = DIFFICULTIES[self.selected_difficulty]
         num_pairs = (rows*cols) // 2 
 
-        #Get image paths from selected theme
-        folder = f"Cards/{self.selected_theme}"
-        image_paths = list_image_files(folder)
+        #Get image paths from selected theme (theme bundle or folder, already opened in the background if it was prefetched)
+        #Each path shows a different picture, so pair ids are content identities: two cards match only if they look the same
+        image_paths = self.prefetcher.image_paths(self.selected_theme)
         selected_paths = image_paths[:num_pairs] #Only uses the necessary number of images
 
-        card_paths = selected_paths * 2 #Each image appears twice
-        random.shuffle(card_paths)
-
-        self.card_images = [load_photo(path) for path in card_paths]
+        #Boards with more pairs than the theme has different pictures get generated faces for the rest
+        size = face_size(rows, cols)
+        if len(selected_paths) < num_pairs:
+            selected_paths = selected_paths + self.prefetcher.generated_faces(self.selected_theme, num_pairs - len(selected_paths), size)
+
+        #Each face is decoded once, already scaled to the card size, and shared by both cards of its pair (cached across games)
+        face_images = IMAGE_CACHE.get_many(self.selected_theme, selected_paths, size=size,
+                                           decoder=self.prefetcher.decoder(self.selected_theme, size))
+
+        #Online the server deals: pair ids (and so images) are only known once a card is flipped
+        if self.is_online():
+            engine = GameEngine(rows, cols, players=2, pair_ids=[0] * (rows * cols))
+            unknown = [None] * (rows * cols)
+            return Deal(self.current_settings(), engine, list(unknown), list(unknown), selected_paths, face_images)
+
+        #Engine deals the board from a seed (so it can be replayed): each pair id (index into selected_paths) appears twice
+        if self.replay is not None:
+            seed = self.replay.seed
+        elif self.fixed_seed is not None:
+            seed = self.fixed_seed
+        else:
+            seed = new_seed()
+        players = 2 if self.selected_player == "Multiplayer" else 1
+        engine = seeded_engine(rows, cols, players, seed)
+        card_paths = [selected_paths[pair] for pair in engine.pairs]
+        card_images = [face_images[pair] for pair in engine.pairs]
+        return Deal(self.current_settings(), engine, card_paths, card_images, selected_paths, face_images, seed)
+
+    #Rebuilds a saved game's board from its snapshot (the face paths are in it, so the theme folder isn't listed)
+    def saved_deal(self, saved):
+        rows, cols = saved.rows, saved.cols
+        size = face_size(rows, cols)
+        read = self.prefetcher.reader(saved.theme, saved.bundled)
+        generated = sum(path.startswith(GENERATED_FOLDER) for path in saved.face_paths)
+        if generated:
+            self.prefetcher.generated_faces(saved.theme, generated, size, saved.face_paths, read)
+        face_images = IMAGE_CACHE.get_many(saved.theme, saved.face_paths, size=size,
+                                           decoder=self.prefetcher.decoder(saved.theme, size, read))
+        engine = saved.engine()
+        card_paths = [saved.face_paths[pair] for pair in engine.pairs]
+        card_images = [face_images[pair] for pair in engine.pairs]
+        return Deal(saved.settings(), engine, card_paths, card_images, saved.face_paths, face_images, saved.seed)
+
+    #Deals the next game while the end screen is shown, and turns the old cards back underneath it
+    def prepare_next_deal(self):
+        if self.next_deal is not None or self.engine is None or not self.engine.over or self.is_online() or self.replay is not None:
+            return  #Already dealt, a new game was started in the meantime, the server deals, or a replay ended
+        deal = self.deal_game()
+        rows, cols = DIFFICULTIES[self.selected_difficulty]
+        if (rows, cols, self.selected_player) == self.board_key and self.end_overlay is not None:
+            for index in self.engine.face_up_cards():
+                row, col = divmod(index, self.cols)
+                self.show_card_back(index, row, col)
+            deal.board_reset = True
+        self.next_deal = deal
+
+    #Drops the pre-dealt game (settings changed in the menu)
+    def cancel_next_deal(self):
+        self.next_deal = None
+
+    #Starts the game with selected difficulty and theme (or continues a saved game)
+    def start_game(self, saved=None):
+
+        #Use the pre-dealt game if it was made for the same settings, otherwise deal now
+        deal = self.next_deal
+        self.next_deal = None
+        self.last_start_predealt = deal is not None and deal.settings == self.current_settings()
+        if saved is not None:
+            deal = self.saved_deal(saved)
+        elif not self.last_start_predealt:
+            deal = self.deal_game()
+
+        #Cards left face up by the previous game (turned back over when the board is reused)
+        if self.engine and not deal.board_reset:
+            shown_before = self.engine.face_up_cards()
+        else:
+            shown_before = []
+
+        self.engine = deal.engine
+        self.card_paths = deal.card_paths
+        self.card_images = deal.card_images
+        self.face_paths = deal.face_paths
+        self.face_images = deal.face_images
+        self.seed = deal.seed
+        if saved is not None:
+            self.faces_bundled = saved.bundled
+        elif not self.is_online():
+            self.faces_bundled = self.prefetcher.is_bundled(self.selected_theme)
 
+        rows, cols = DIFFICULTIES[self.selected_difficulty]
         self.rows = rows
         self.cols = cols
-        self.card_paths = card_paths
-        self.current_player = 1 
-        self.scores = {1:0, 2:0} 
-
-        self.flipped_cards = []
-        self.matched_cards = [] 
+        seconds_used = saved.seconds_used if saved is not None else 0.0
+        seconds_left = math.ceil(SOLO_TIME_LIMIT - seconds_used) if self.selected_player == "Solo" else None
+        if saved is not None:
+            self.stream.restore(self.engine, seconds_left)
+        else:
+            self.stream.reset(rows, cols, self.engine.players, seconds_left)
+
+        #Record the game (a replay is already recorded, online games are dealt by the server, a saved game goes on in its log)
+        self.close_recorder()
+        if saved is not None and saved.replay_path:
+            self.recorder = ReplayRecorder(deal.seed, deal.settings, rows, cols, self.engine.players, path=saved.replay_path, resume=True)
+        elif deal.seed is not None and self.replay is None:
+            self.recorder = ReplayRecorder(deal.seed, deal.settings, rows, cols, self.engine.players)
+        if self.replay is None:
+            TELEMETRY.new_game(saved.game_id if saved is not None else None)
+        self.reveal_delay = REVEAL_DELAY / self.replay.speed if self.replay else REVEAL_DELAY
         
         #Resizes window based on difficulty to avoid cards being cut off 
         if self.selected_difficulty == "Easy":
@@ -135,15 +371,87 @@ class MatchMadness:
         
         #Hide menu & show game
         self.menu.menu_frame.pack_forget()
+        if self.game_frame is None:
+            self.game_frame = tk.Frame(self.root)
         self.game_frame.config(bg="peach puff")
         self.game_frame.pack(expand=True, fill="both")
 
-        #Build game screen first
-        self.build_game_screen()
+        #Reuse the board widgets when the grid and mode haven't changed, otherwise build them
+        if (rows, cols, self.selected_player) == self.board_key:
+            self.reset_game_screen(shown_before)
+        else:
+            self.build_game_screen()
+
+        #A saved game shows its face up cards and scores, and settles a turn that was waiting for the reveal delay
+        if saved is not None:
+            for index in self.engine.face_up_cards():
+                row, col = divmod(index, self.cols)
+                self.show_card_face(index, row, col)
+            self.update_scores()
+            if self.engine.awaiting_resolve():
+                self.reveal_event = self.scheduler.call_later(self.reveal_delay, self.check_match, "mismatch flip-back", group=self)
         
-        #Starts timer only for solo mode
-        if self.selected_player == "Solo":
-            self.timer()
+        #Starts timer only for solo mode (a replay shows the recorded time instead)
+        if self.selected_player == "Solo" and self.replay is None:
+            self.timer(seconds_used)
+            if saved is not None:
+                self.countdown(seconds_left)
+
+        #Online: join the room on the server, the game starts when the other player is there
+        if self.is_online():
+            self.join_server()
+
+        #Computer opponent starts each game with an empty memory (a replay plays its recorded moves instead)
+        if self.computer_seat and self.replay is None:
+            if self.computer is None or self.computer.level != COMPUTER_LEVEL:
+                self.computer = ComputerPlayer(COMPUTER_LEVEL)
+            self.computer.new_game(self.engine.num_cards // 2)
+            for index in (self.engine.first, self.engine.second):
+                if index >= 0:
+                    self.computer.observe(index, self.engine.pair_of(index))
+            self.schedule_computer_move()
+        else:
+            self.computer = None
+
+        #The new game replaces the saved one
+        if self.replay is None and not self.is_online():
+            self.menu.show_resume_button(False)
+            self.save_snapshot()
+
+    #Continues the saved game
+    def resume_game(self):
+        try:
+            saved = load_snapshot()
+        except ValueError:
+            saved = None
+        if (saved is None or saved.theme not in self.menu.theme_buttons or saved.difficulty not in DIFFICULTIES
+                or DIFFICULTIES[saved.difficulty] != (saved.rows, saved.cols)):
+            messagebox().showwarning("Can't resume", "The saved game could not be read.")
+            SNAPSHOT_WRITER.clear()
+            self.menu.show_resume_button(False)
+            return
+        self.cancel_next_deal()
+        self.selected_theme, self.selected_difficulty, self.selected_player, self.computer_seat = saved.settings()
+        self.menu.show_selection()
+        self.start_game(saved)
+
+    #Saves the game in progress (packed here, written in the background, rapid changes coalesced into one write)
+    def save_snapshot(self):
+        if self.engine is None or self.engine.over or self.replay is not None or self.is_online():
+            return
+        seconds_used = self.countdown_timer.elapsed() if self.selected_player == "Solo" and self.countdown_timer else 0.0
+        replay_path = None
+        if self.recorder:
+            self.recorder.flush()  #Records of the flips the snapshot holds are queued before it, so a resumed log has no gap
+            replay_path = self.recorder.path
+        SNAPSHOT_WRITER.save(pack_snapshot(self.engine, self.current_settings(), self.seed, seconds_used,
+                                           self.face_paths, self.faces_bundled, replay_path, TELEMETRY.game))
+
+    #Closes the window, with the game in progress saved first
+    def quit_game(self):
+        self.save_snapshot()
+        SNAPSHOT_WRITER.flush()
+        self.root.destroy()
 
     
     
@@ -152,6 +460,9 @@ class MatchMadness:
         #Clears existing buttons, text, etc from the game frame
         for widget in self.game_frame.winfo_children():
             widget.destroy() 
+        self.board_key = (self.rows, self.cols, self.selected_player)
+        self.end_overlay = None
+        self.timer_label = None
         
         #Left sidebar
         sidebar = tk.Frame(self.game_frame, bg="peach puff", width=200)
@@ -161,8 +472,8 @@ class MatchMadness:
         title = tk.Label(sidebar, text="Match Madness", font=("Times New Roman", 16, "bold"), bg="peach puff", fg="lightsalmon3")
         title.pack(pady=10)
 
-        info_label = tk.Label(sidebar, text=f"Theme: {self.selected_theme} \nDifficulty: {self.selected_difficulty}", font = ("Arial", 10), bg="peach puff", fg="lightsalmon3")
-        info_label.pack(pady=5)
+        self.info_label = tk.Label(sidebar, text=f"Theme: {self.selected_theme} \nDifficulty: {self.selected_difficulty}", font = ("Arial", 10), bg="peach puff", fg="lightsalmon3")
+        self.info_label.pack(pady=5)
 
         #Scores
         scores_title = tk.Label(sidebar, text="Scores:", font=("Arial", 12, "bold"), bg="peach puff", fg="lightsalmon3")
@@ -180,7 +491,7 @@ class MatchMadness:
         #Solo timer
         elif self.selected_player == "Solo":
             # Store reference for timer updates
-            self.timer_label = tk.Label(sidebar, text="Timer: 03:00", font=("Arial", 12), bg="peach puff", fg="lightsalmon3")
+            self.timer_label = tk.Label(sidebar, text=format_timer(SOLO_TIME_LIMIT), font=("Arial", 12), bg="peach puff", fg="lightsalmon3")
             self.timer_label.pack(pady=5)
             
             #solo score/match count 
@@ -191,10 +502,10 @@ class MatchMadness:
         if self.selected_player == "Multiplayer":
             self.turn_label = tk.Label(
                 sidebar,
-                text=f"Player {self.current_player}'s turn",
+                text=f"{self.player_name(self.engine.current_player)}'s turn",
                 font=("Arial", 14, "bold"),
                 bg="peach puff",
-                fg=PLAYER_TURN_COLOURS.get(self.current_player, "black"),
+                fg=PLAYER_TURN_COLOURS.get(self.engine.current_player, "black"),
             )
             self.turn_label.pack(pady=15)
         else:
@@ -204,7 +515,7 @@ class MatchMadness:
         rules_btn = tk.Button(sidebar, text="Rules", width=12,bg="lightsalmon2", fg="white", command=self.menu.show_rules)
         rules_btn.pack(pady=10)
 
-        quit_btn = tk.Button(sidebar, text="Quit", width=12,bg="indian red", fg="white", command=self.root.destroy)
+        quit_btn = tk.Button(sidebar, text="Quit", width=12,bg="indian red", fg="white", command=self.quit_game)
         quit_btn.pack(pady=5)
 
         #Card grid 
@@ -212,6 +523,14 @@ class MatchMadness:
         grid_frame.pack(side="right", expand=True, fill="both", padx=5, pady=5)
 
         self.card_buttons = []
+        self.canvas_board = None
+
+        #Big boards: one canvas for the whole grid
+        if self.rows * self.cols >= CANVAS_MIN_CARDS:
+            card_size = face_size(self.rows, self.cols)
+            self.canvas_board = CanvasBoard(grid_frame, self.rows, self.cols, self.flip_card, card_size=card_size, padding=PADDING)
+            self.canvas_board.pack(expand=True)
+            return
 
         for i in range(self.rows): #Setting up rows from user input
             row_buttons = []
@@ -225,184 +544,422 @@ class MatchMadness:
                 row_buttons.append(btn)
             self.card_buttons.append(row_buttons)
 
-    #Sets up ending/winner screen
-    def build_end_screen(self):
-        #Clears existing buttons, text, etc
-        for widget in self.game_frame.winfo_children():
-            widget.destroy() 
-
-        self.game_frame.config(bg="peach puff")
+    #Resets the existing board for a new game, only the cards that were face up are touched
+    def reset_game_screen(self, shown_before):
+        self.hide_end_screen()
+        self.info_label.config(text=f"Theme: {self.selected_theme} \nDifficulty: {self.selected_difficulty}")
+
+        for index in shown_before:
+            row, col = divmod(index, self.cols)
+            self.show_card_back(index, row, col)
+
+        self.update_scores()
+        if self.timer_label:
+            self.timer_label.config(text=format_timer(SOLO_TIME_LIMIT))
+        if self.turn_label:
+            self.turn_label.config(
+                text=f"{self.player_name(self.engine.current_player)}'s turn",
+                fg=PLAYER_TURN_COLOURS.get(self.engine.current_player, "black"),
+            )
 
+    #Sets up ending/winner screen (shown over the board so Play Again can reuse it)
+    def build_end_screen(self):
         #Stop timer if running
         self.timer_running = False
+        if self.countdown_timer:
+            self.countdown_timer.stop()
 
         #Determine winner/end message based on mode
+        scores = self.engine.scores
+        seconds = None  #Solo completion time
         if self.selected_player == "Solo":
             if self.game_completed:
                 winner_text = "Congratulations!"
-                #Calculate time taken (180 - time_left)
-                global time_left
-                time_taken = 180 - time_left
+                #Calculate time taken (whole seconds since the timer started)
+                seconds = self.replay.elapsed if self.replay else self.countdown_timer.elapsed()
+                time_taken = int(seconds)
                 mins, secs = divmod(time_taken, 60)
                 time_format = '{:02d}:{:02d}'.format(mins, secs)
-                result_text = f"Completed in: {time_format}\nPairs Matched: {self.scores[1]}"
+                result_text = f"Completed in: {time_format}\nPairs Matched: {scores[1]}"
             else:
                 winner_text = "Time's Up!"
-                result_text = f"Pairs Matched: {self.scores[1]}"
+                result_text = f"Pairs Matched: {scores[1]}"
         else:
             #Multiplayer mode
-            if self.scores[1] > self.scores[2]:
-                winner_text = "Player 1 Wins!"
-            elif self.scores[2] > self.scores[1]:
-                winner_text = "Player 2 Wins!"
+            winners = self.engine.winners()
+            if len(winners) == 1:
+                winner_text = f"{self.player_name(winners[0])} Wins!"
             else:
                 winner_text = "It's a Tie!"
-            result_text = f"Final Scores:\nPlayer 1: {self.scores[1]}\nPlayer 2: {self.scores[2]}"
+            result_text = f"Final Scores:\n{self.player_name(1)}: {scores[1]}\n{self.player_name(2)}: {scores[2]}"
 
-        title = tk.Label(self.game_frame, text="Game Over!", font=("Arial", 28, "bold"), bg="peach puff", fg="lightsalmon3")
-        title.pack(pady=30)
+        #Build the end screen widgets the first time this board ends
+        if self.end_overlay is None:
+            self.end_overlay = tk.Frame(self.game_frame, bg="peach puff")
 
-        # Winner/End message
-        winner_label = tk.Label(self.game_frame, text=winner_text, font=("Arial", 20), bg="peach puff", fg="lightsalmon3")
-        winner_label.pack(pady=10)
-        
-        #Final scores/time
-        scores_label = tk.Label(self.game_frame, text=result_text, 
-                               font=("Arial", 14), bg="peach puff", fg="lightsalmon3")
-        scores_label.pack(pady=20)
-        
-        #Buttons frame
-        btn_frame = tk.Frame(self.game_frame, bg="peach puff")
-        btn_frame.pack(pady=20)
-        
-        #Play again button
-        play_again_btn = tk.Button(btn_frame, text="Play Again", width=12, bg="PaleGreen3", fg="white",
-                                   command=self.play_again)
-        play_again_btn.pack(side="left", padx=10)
-        
-        #Main menu button
-        menu_btn = tk.Button(btn_frame, text="Main Menu", width=12, bg="lightsalmon2", fg="white",
-                            command=self.go_to_menu)
-        menu_btn.pack(side="left", padx=10)
-        
-        #Quit button
-        quit_btn = tk.Button(btn_frame, text="Quit", width=12, bg="indian red", fg="white",
-                            command=self.root.destroy)
-        quit_btn.pack(side="left", padx=10)
+            title = tk.Label(self.end_overlay, text="Game Over!", font=("Arial", 28, "bold"), bg="peach puff", fg="lightsalmon3")
+            title.pack(pady=30)
+
+            # Winner/End message
+            self.winner_label = tk.Label(self.end_overlay, font=("Arial", 20), bg="peach puff", fg="lightsalmon3")
+            self.winner_label.pack(pady=10)
+            
+            #Final scores/time
+            self.result_label = tk.Label(self.end_overlay, font=("Arial", 14), bg="peach puff", fg="lightsalmon3")
+            self.result_label.pack(pady=20)
+
+            #Rank, personal best or head to head record (filled in once the game is saved)
+            self.stats_label = tk.Label(self.end_overlay, font=("Arial", 12), bg="peach puff", fg="lightsalmon3")
+            self.stats_label.pack(pady=5)
+            
+            #Buttons frame
+            btn_frame = tk.Frame(self.end_overlay, bg="peach puff")
+            btn_frame.pack(pady=20)
+            
+            #Play again button
+            play_again_btn = tk.Button(btn_frame, text="Play Again", width=12, bg="PaleGreen3", fg="white",
+                                       command=self.play_again)
+            play_again_btn.pack(side="left", padx=10)
+            
+            #Main menu button
+            menu_btn = tk.Button(btn_frame, text="Main Menu", width=12, bg="lightsalmon2", fg="white",
+                                command=self.go_to_menu)
+            menu_btn.pack(side="left", padx=10)
+            
+            #Quit button
+            quit_btn = tk.Button(btn_frame, text="Quit", width=12, bg="indian red", fg="white",
+                                command=self.quit_game)
+            quit_btn.pack(side="left", padx=10)
+
+        self.winner_label.config(text=winner_text)
+        self.result_label.config(text=result_text)
+        self.stats_label.config(text="")
+        self.save_result(seconds)
+
+        #Cover the whole board
+        self.end_overlay.place(x=0, y=0, relwidth=1, relheight=1)
+        self.end_overlay.lift()
+
+        #Get the next game ready while the player reads the results
+        self.root.after_idle(self.prepare_next_deal)
+
+    #Returns the results store, opened the first time a game is saved (sqlite3 isn't needed to show the menu)
+    def results(self):
+        if self.results_store is None:
+            from results_store import ResultsStore
+            self.results_store = ResultsStore()
+        return self.results_store
+
+    #Saves the finished game in the results store (replays were saved when they were played)
+    def save_result(self, seconds):
+        from results_store import game_result, local_player
+        if self.replay is not None:
+            return
+        if self.selected_player == "Solo":
+            mode = "Solo"
+            players = [local_player()]
+        else:
+            mode = "Computer" if self.computer_seat else ("Online" if self.is_online() else "Multiplayer")
+            players = [self.result_name(1), self.result_name(2)]
+        result = game_result(self.selected_theme, self.selected_difficulty, mode, players, self.engine.scores[1:],
+                             self.game_completed, seconds, self.engine.moves, self.seed)
+        self.results().add(result, lambda statistics, engine=self.engine: self.show_result_stats(engine, statistics))
+        if not self.results_polling:
+            self.results_polling = True
+            self.root.after(RESULTS_POLL_MS, self.poll_results)
+
+    #Name a player is saved under
+    def result_name(self, player):
+        if player == self.computer_seat:
+            return f"Computer ({COMPUTER_LEVEL})"
+        return f"Player {player}"
+
+    #Hands saved games' statistics to the end screen
+    def poll_results(self):
+        if self.results().drain():
+            self.root.after(RESULTS_POLL_MS, self.poll_results)
+        else:
+            self.results_polling = False
+
+    #Shows the rank and personal best (solo) or the head to head record (multiplayer) of a saved game
+    def show_result_stats(self, engine, statistics):
+        if engine is not self.engine or not statistics:
+            return  #A new game started while this one was being saved
+        if self.selected_player == "Solo":
+            lines = []
+            if "rank" in statistics:
+                lines.append(f"Rank: #{statistics['rank']} of {statistics['ranked']}")
+            if statistics.get("personal_best") is not None:
+                mins, secs = divmod(int(statistics["personal_best"]), 60)
+                lines.append(f"Personal Best: {mins:02d}:{secs:02d}")
+            text = "\n".join(lines)
+        else:
+            record = statistics["head_to_head"]
+            text = (f"Head to Head: {self.player_name(1)} {record['wins']} - {record['losses']} {self.player_name(2)}"
+                    f" ({record['ties']} ties)")
+        self.stats_label.config(text=text)
+
+    #Hides the end screen
+    def hide_end_screen(self):
+        if self.end_overlay is not None:
+            self.end_overlay.place_forget()
     
     #Starts a new game with same settings
     def play_again(self):
-        global time_left
-        time_left = 180  #Reset timer
-        self.timer_running = False
+        self.stop_timed_events()  #Reset timer
+        self.close_recorder()
+        self.replay = None
         self.game_completed = False
+        start = time.perf_counter()
         self.start_game()
+        path = "predealt" if self.last_start_predealt else "cold"
+        self.play_again_times[path].append(time.perf_counter() - start)
     
 
     #Returns to main menu
     def go_to_menu(self):
         """Return to main menu"""
-        global time_left
-        self.timer_running = False  #Stop timer
-        time_left = 180  #Reset timer
+        self.stop_timed_events()  #Stop timer
+        self.close_recorder()
+        self.replay = None
+        if self.client is not None and self.is_online():
+            self.client.send("LEAVE")
         self.game_completed = False
         self.game_frame.pack_forget()
         self.root.geometry("800x600")  #Reset window size
         self.menu.menu_frame.pack(fill="both", expand=True)
 
     #Flips a card when clicked if requirements are met
-    def flip_card(self, index, row, col):
-            #Don't flip if already matched
-            if index in self.matched_cards:
+    def flip_card(self, index, row, col, by_computer=False, from_server=False, from_replay=False):
+            #Clicks are ignored while a replay is playing
+            if self.replay is not None and not from_replay:
                 return
-            
-            #Don't flip if already flipped
-            if index in self.flipped_cards:
+
+            #A click while 2 cards are showing settles them right away instead of being dropped
+            if self.engine.awaiting_resolve():
+                self.cancel_reveal()
+                self.check_match()
+
+            #Online clicks go to the server, the card is shown when the server sends the flip back
+            if self.is_online() and not from_server:
+                if self.online_started and self.engine.current_player == self.seat and not self.engine.is_face_up(index):
+                    self.client.send("FLIP", index)
+                return
+
+            #Clicks are ignored while the computer is playing
+            if self.is_computer_turn() and not by_computer:
+                return
+
+            #Engine ignores matched cards, cards already face up, and clicks after the game ended
+            result = self.engine.flip(index)
+            if result == FLIP_IGNORED:
                 return
 
-            #Don't flip if 2 cards are already flipped
-            if len(self.flipped_cards) >= 2:
-                return 
+            if self.recorder:
+                self.recorder.flip(index, self.engine.current_player)
+            if self.replay is None:
+                TELEMETRY.flip(index, self.engine.pair_of(index), self.engine.current_player, result)
+            self.save_snapshot()
 
             #Show image
-            btn = self.card_buttons[row][col]
-            btn.config(image=self.card_images[index], text="", width=90, height=90,activebackground="peach puff")
+            self.show_card_face(index, row, col)
+            self.stream.flip(index, self.engine.pair_of(index))
+            if self.computer:
+                self.computer.observe(index, self.engine.pair_of(index))
+
+            #If 2 cards are flipped, check for match after the reveal delay (unless another click comes first)
+            if result == FLIP_SECOND:
+                self.reveal_event = self.scheduler.call_later(self.reveal_delay, self.check_match, "mismatch flip-back", group=self)
+
+    #Checks if it is the computer's turn
+    def is_computer_turn(self):
+        return self.computer is not None and self.engine.current_player == self.computer_seat
+
+    #Name of a player for labels
+    def player_name(self, player):
+        if player == self.computer_seat:
+            return "Computer"
+        if self.is_online() and player == self.seat:
+            return f"Player {player} (you)"
+        return f"Player {player}"
+
+    #Checks if this game is played against another window through the game server
+    def is_online(self):
+        return (self.server_address is not None and self.selected_player == "Multiplayer" and self.computer_seat is None
+                and self.replay is None)
+
+    #Connects to the server if needed and joins the room
+    def join_server(self):
+        if self.client is None or self.client.closed:
+            from game_client import GameClient  #Only online games need the network code (and asyncio)
+            try:
+                self.client = GameClient(self.root, self.server_address, self.on_server_message)
+            except OSError as error:
+                messagebox().showerror("Server unavailable", f"Could not connect to {self.server_address}:\n{error}")
+                self.go_to_menu()
+                return
+        self.seat = None
+        self.online_started = False
+        self.client.send("JOIN", self.room, self.rows, self.cols)
+        if self.turn_label:
+            self.turn_label.config(text="Waiting for opponent...", fg="lightsalmon3")
+
+    #Handles a message from the game server
+    def on_server_message(self, command, args):
+        if command == "SEAT":
+            self.seat = int(args[0])
+        elif command == "START":
+            self.online_started = True
+            if self.turn_label:
+                self.turn_label.config(
+                    text=f"{self.player_name(self.engine.current_player)}'s turn",
+                    fg=PLAYER_TURN_COLOURS.get(self.engine.current_player, "black"),
+                )
+        elif command == "FLIP":
+            player, index, pair = (int(arg) for arg in args)
+            #The server reveals which face the card has, then it is flipped with the normal rules
+            self.engine.pairs[index] = pair
+            self.card_paths[index] = self.face_paths[pair]
+            self.card_images[index] = self.face_images[pair]
+            row, col = divmod(index, self.cols)
+            self.flip_card(index, row, col, from_server=True)
+        elif command == "LEFT":
+            if not self.engine.over:
+                messagebox().showinfo("Opponent left", "The other player left the game.")
+                self.cancel_reveal()
+                self.engine.end()
+                self.end_game()
+        elif command == "ERR":
+            if args and args[0] in ("room-full", "board-mismatch"):
+                messagebox().showwarning("Can't join room", f"Room '{self.room}' is busy with another game.")
+                self.go_to_menu()
+        elif command == "CLOSED":
+            self.client = None
+            if self.is_online() and self.engine and not self.engine.over and self.game_frame and self.game_frame.winfo_ismapped():
+                messagebox().showerror("Connection lost", "Lost the connection to the game server.")
+                self.go_to_menu()
+
+    #Lets the computer make its next flip after a short pause, if it is its turn
+    def schedule_computer_move(self):
+        if self.is_computer_turn() and not self.engine.over:
+            self.scheduler.call_later(COMPUTER_DELAY, self.computer_move, "computer move", group=self)
+
+    #Computer flips one card (the first or second of its turn)
+    def computer_move(self):
+        if not self.is_computer_turn() or self.engine.over or self.engine.awaiting_resolve():
+            return  #check_match schedules the next move once the pair is settled
+        if self.engine.first < 0:
+            index = self.computer.choose_first(self.engine)
+        else:
+            index = self.computer.choose_second(self.engine, self.engine.first)
+        row, col = divmod(index, self.cols)
+        self.flip_card(index, row, col, by_computer=True)
 
-            #Add to flipped cards
-            self.flipped_cards.append(index)
+        #Second flip of the turn
+        if not self.engine.awaiting_resolve():
+            self.schedule_computer_move()
 
-            #If 2 cards are flipped, check for match
-            if len(self.flipped_cards) == 2:
-                self.root.after(600, self.check_match) #Waits 0.6 seconds before checking for match
+    #Cancels the pending check_match
+    def cancel_reveal(self):
+        if self.reveal_event is not None:
+            self.reveal_event.cancel()
+            self.reveal_event = None
 
 
     #Checks if 2 flipped cards are a match
     def check_match(self):
-        #Exit if timer already ended the game in solo mode due to 0.6 second delay in check match
-        if self.selected_player == "Solo" and not self.timer_running:
+        self.reveal_event = None
+
+        #Nothing to check if the cards were already settled (new click, time up or new game)
+        if not self.engine.awaiting_resolve():
             return
 
-        idx1, idx2 = self.flipped_cards
+        #Engine compares pair ids, scores the turn and switches player on no match
+        player = self.engine.current_player
+        result, idx1, idx2 = self.engine.resolve()
+        if self.replay is None:
+            TELEMETRY.resolve(idx1, self.engine.pair_of(idx1), player, result)
+        self.save_snapshot()
 
-        #Get image paths to compare 
-        path1 = self.card_paths[idx1]
-        path2 = self.card_paths[idx2]
+        if self.computer:
+            if result == MATCH:
+                self.computer.matched(idx1, idx2)
+            self.computer.end_turn()
 
         #Keep cards face up (match)
-        if path1 == path2:
-            self.matched_cards.append(idx1)
-            self.matched_cards.append(idx2)
-            
-            #Add point to current player 
-            self.scores[self.current_player] += 1
+        if result == MATCH:
+            self.stream.match(idx1, idx2, self.engine.current_player)
             self.update_scores()
 
             #Check if game is over
-            if len(self.matched_cards) == self.rows * self.cols:
+            if self.engine.over:
                 self.game_completed = True  # Game was completed successfully
                 self.end_game()
                 return
         
         else:
             #No match, flip cards back, find buttons and reset them
-            for idx in self.flipped_cards:
+            for idx in (idx1, idx2):
                 row = idx // self.cols
                 col = idx % self.cols 
-                btn = self.card_buttons[row][col]
-                btn.config(image="", text="?", width=8, height=4, 
-                          bg="lightsalmon2", fg="white",
-                          activebackground="lightsalmon2", activeforeground="white")
-
-            #Switch player only on no match
-            if self.selected_player == "Multiplayer":
-                if self.current_player == 1:
-                    self.current_player = 2
-                else:
-                    self.current_player = 1
-                if self.turn_label:
-                    self.turn_label.config(
-                        text=f"Player {self.current_player}'s turn",
-                        fg=PLAYER_TURN_COLOURS.get(self.current_player, "black"),
-                    )
-            elif self.selected_player == "Solo":
-                self.current_player = 1  #Always player 1 in solo mode
-                #No turn label to update in solo mode
-
-        #Clear flipped cards for next turn
-        self.flipped_cards = []
+                self.show_card_back(idx, row, col)
+            self.stream.flip_back(idx1, idx2)
+            self.stream.turn(self.engine.current_player)
+
+            #Show whose turn it is now (no turn label in solo mode)
+            if self.turn_label:
+                self.turn_label.config(
+                    text=f"{self.player_name(self.engine.current_player)}'s turn",
+                    fg=PLAYER_TURN_COLOURS.get(self.engine.current_player, "black"),
+                )
+
+        #Computer plays on if it is (still) its turn
+        self.schedule_computer_move()
+
+    #Shows a card's image (button or canvas board)
+    def show_card_face(self, index, row, col):
+        if self.canvas_board:
+            self.canvas_board.show_face(index, self.card_images[index])
+            return
+        btn = self.card_buttons[row][col]
+        btn.config(image=self.card_images[index], text="", width=BUTTON_FACE_SIZE, height=BUTTON_FACE_SIZE,activebackground="peach puff")
+
+    #Turns a card face down (button or canvas board)
+    def show_card_back(self, index, row, col):
+        if self.canvas_board:
+            self.canvas_board.show_back(index)
+            return
+        btn = self.card_buttons[row][col]
+        btn.config(image="", text="?", width=8, height=4, 
+                  bg="lightsalmon2", fg="white",
+                  activebackground="lightsalmon2", activeforeground="white")
 
     #Refreshes score display
     def update_scores(self):
+        self.scheduler.update("scores", self.draw_scores)
+
+    #Draws the scores (batched by the scheduler, at most once per frame)
+    def draw_scores(self):
         if self.selected_player == "Multiplayer":
-            self.p1_score_label.config(text=f"Player 1: {self.scores[1]}")
-            self.p2_score_label.config(text=f"Player 2: {self.scores[2]}")
+            self.p1_score_label.config(text=f"Player 1: {self.engine.scores[1]}")
+            self.p2_score_label.config(text=f"Player 2: {self.engine.scores[2]}")
         elif self.selected_player == "Solo":
-            self.p1_score_label.config(text=f"Pairs Matched: {self.scores[1]}")
+            self.p1_score_label.config(text=f"Pairs Matched: {self.engine.scores[1]}")
 
     #Shows end game screen
     def end_game(self):
+        self.stream.over()
+        self.close_recorder()
+        if self.replay is None and not self.is_online():
+            SNAPSHOT_WRITER.clear()  #Finished games can't be resumed
         self.build_end_screen()
 
+    #Writes out the current game's replay log
+    def close_recorder(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
 #Main menu
 class MenuFrame:
 
@@ -435,7 +992,7 @@ class MenuFrame:
         controls_label = tk.Label(left_frame, text="Controls:", font=("Arial", 14), bg="peach puff", fg="lightsalmon3")
         controls_label.pack(pady=10)
         
-        quit_btn = tk.Button(left_frame, text="Quit", width=15, bg="indian red", fg="white", command=root.destroy)
+        quit_btn = tk.Button(left_frame, text="Quit", width=15, bg="indian red", fg="white", command=game.quit_game)
         quit_btn.pack(pady=5)
 
         rules_btn = tk.Button(left_frame, text="Rules", width=15, bg="lightsalmon2", fg="white", command=self.show_rules)
@@ -443,6 +1000,9 @@ class MenuFrame:
 
         self.play_btn = tk.Button(left_frame, text="Play!", width=15, bg="lightsalmon2", fg="white", command=self.play_game)
         self.play_btn.pack(pady=5)
+
+        #Only shown when there is a saved game
+        self.resume_btn = tk.Button(left_frame, text="Resume", width=15, bg="PaleGreen3", fg="white", command=game.resume_game)
         
         #Middle column: theme selection
         middle_frame = tk.Frame(columns_frame, bg="peach puff")
@@ -493,6 +1053,10 @@ class MenuFrame:
         multi_btn = tk.Button(middle_frame, text="Multiplayer", width=15, bg="lightsalmon2", fg="white", command=lambda: self.selected_player("Multiplayer"))
         multi_btn.pack(pady=5)
         self.player_button["Multiplayer"] = multi_btn
+
+        computer_btn = tk.Button(middle_frame, text="Vs Computer", width=15, bg="lightsalmon2", fg="white", command=lambda: self.selected_player("Computer"))
+        computer_btn.pack(pady=5)
+        self.player_button["Computer"] = computer_btn
         
         #Right column: difficulty selection
         right_frame = tk.Frame(columns_frame, bg="peach puff")
@@ -520,7 +1084,7 @@ class MenuFrame:
         
     #Shows rules in messagebox
     def show_rules(self):
-        messagebox.showinfo("Rules",  "How to Play Match Madness:\n\n"
+        messagebox().showinfo("Rules",  "How to Play Match Madness:\n\n"
     "SOLO MODE (Timed):\n"
     "1. Click on a card to flip it\n"
     "2. Click on another card to find a match\n"
@@ -538,7 +1102,13 @@ class MenuFrame:
 
     #Selects a theme when theme button is clicked
     def select_theme(self, theme):
+        self.game.cancel_next_deal()
+        #Frees the cached images of the previous theme when switching themes
+        if theme != self.game.selected_theme:
+            IMAGE_CACHE.evict_other_themes(theme)
+            self.game.prefetcher.forget_other_themes(theme)
         self.game.selected_theme = theme
+        self.start_prefetch()
         
         #Updates button colors (highlight selected, unhighlight others)
         for theme_name, btn in self.theme_buttons.items():
@@ -551,7 +1121,9 @@ class MenuFrame:
 
     #Selects a difficulty when difficulty button is clicked
     def select_difficulty(self, difficulty):
+        self.game.cancel_next_deal()
         self.game.selected_difficulty = difficulty
+        self.start_prefetch()
 
         #Update button colors
         for diff_name, btn in self.difficulty_buttons.items():
@@ -563,7 +1135,15 @@ class MenuFrame:
         self.update_play_button() 
 
     def selected_player(self, player):
-        self.game.selected_player = player
+        self.game.cancel_next_deal()
+
+        #Playing against the computer is a multiplayer game with the computer in one seat
+        if player == "Computer":
+            self.game.selected_player = "Multiplayer"
+            self.game.computer_seat = COMPUTER_SEAT
+        else:
+            self.game.selected_player = player
+            self.game.computer_seat = None
 
         #Update button colors
         for player_name, btn in self.player_button.items():
@@ -574,6 +1154,33 @@ class MenuFrame:
         
         self.update_play_button()
                 
+    #Shows or hides the resume button
+    def show_resume_button(self, show):
+        if show:
+            self.resume_btn.pack(pady=5)
+        else:
+            self.resume_btn.pack_forget()
+
+    #Highlights the buttons of the current selections (after they were set without the menu, e.g. resuming a game)
+    def show_selection(self):
+        player = "Computer" if self.game.computer_seat is not None else self.game.selected_player
+        for buttons, selected in ((self.theme_buttons, self.game.selected_theme), (self.difficulty_buttons, self.game.selected_difficulty),
+                                  (self.player_button, player)):
+            for name, btn in buttons.items():
+                btn.config(bg="lightsalmon3" if name == selected else "lightsalmon2")
+        self.update_play_button()
+
+    #Starts loading the selected theme's card faces in the background
+    def start_prefetch(self):
+        if self.game.selected_theme is None:
+            return
+        if self.game.selected_difficulty is None:
+            #Difficulty not picked yet, load enough faces for the biggest board
+            rows, cols = max(DIFFICULTIES.values(), key=lambda size: size[0] * size[1])
+        else:
+            rows, cols = DIFFICULTIES[self.game.selected_difficulty]
+        self.game.prefetcher.prefetch(self.game.selected_theme, (rows * cols) // 2, face_size(rows, cols))
+
     #Turns play button green when theme, player count, and difficulty are selected
     def update_play_button(self):
         if self.game.selected_theme is not None and self.game.selected_difficulty is not None and self.game.selected_player is not None:
@@ -584,18 +1191,56 @@ class MenuFrame:
     #Starting the game, checks for missing inputs
     def play_game(self):
         if self.game.selected_difficulty is None and self.game.selected_theme is None:
-            messagebox.showwarning("Missing selections", "Please select a theme and difficulty level")
+            messagebox().showwarning("Missing selections", "Please select a theme and difficulty level")
         elif self.game.selected_difficulty is None:
-            messagebox.showwarning("Missing difficulty", "Please select a difficulty level")
+            messagebox().showwarning("Missing difficulty", "Please select a difficulty level")
         elif self.game.selected_theme is None:
-            messagebox.showwarning("Missing theme", "Please select a theme")
+            messagebox().showwarning("Missing theme", "Please select a theme")
         elif self.game.selected_player is None:
-            messagebox.showwarning("Missing player count", "Please select a player count")
+            messagebox().showwarning("Missing player count", "Please select a player count")
         else:
+            player = "Computer" if self.game.computer_seat is not None else self.game.selected_player
+            save_last_settings({"theme": self.game.selected_theme, "difficulty": self.game.selected_difficulty, "player": player})
             self.game.start_game()
 
+    #Selects what was picked last time, which also starts loading its card faces before Play is clicked
+    def restore_last_settings(self):
+        settings = load_last_settings()
+        if not isinstance(settings, dict):
+            return
+        if self.game.selected_difficulty is None and settings.get("difficulty") in self.difficulty_buttons:
+            self.select_difficulty(settings["difficulty"])
+        if self.game.selected_theme is None and settings.get("theme") in self.theme_buttons:
+            self.select_theme(settings["theme"])
+        if self.game.selected_player is None and settings.get("player") in self.player_button:
+            self.selected_player(settings["player"])
+
 #Main 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match Madness")
+    parser.add_argument("--server", help="host:port of a game server for online multiplayer (see server.py)")
+    parser.add_argument("--room", default="default", help="room to join on the game server")
+    parser.add_argument("--profile", action="store_true", default=bool(os.environ.get("MATCH_MADNESS_PROFILE")),
+                        help="time every UI callback (F8 overlay, F9 cProfile capture, F10 save the table)")
+    parser.add_argument("--seed", type=lambda text: int(text, 16), help="deal every game from this hex seed (the end of a replay log's name)")
+    parser.add_argument("--startup-benchmark", action="store_true",
+                        help="print the startup timings (seconds since launch) as JSON and quit once the menu is on screen")
+    options = parser.parse_args()
+
     root = tk.Tk()
-    game = MatchMadness(root)
+
+    #Profiling wraps callbacks as they are registered, so it is installed before anything is built
+    profiler = None
+    if options.profile:
+        from profiling import Profiler
+        profiler = Profiler()
+        profiler.install(root)
+
+    game = MatchMadness(root, server=options.server, room=options.room, seed=options.seed)
+    game.scheduler.profiler = profiler
+    if options.startup_benchmark:
+        def report_startup():
+            print(json.dumps(game.startup_times))
+            root.after_idle(root.destroy)
+        game.on_startup = report_startup
     root.mainloop() 
\ No newline at end of file
@@ -0,0 +1,240 @@
+'''
+Computer opponent for Match Madness
+
+Description:
+A computer player that can take either seat of a two player game.
+
+The "perfect" level never forgets a card and plays optimally, using a value table computed by dynamic programming over
+(unmatched pairs, known singletons) states. A known singleton is a pair with exactly one card seen.
+A known pair is always taken right away, so the real decisions are:
+- With two or more singletons known, pass: flip two known cards of different pairs, which hands the same position to the opponent.
+- After the first flip of a turn reveals a new card: flip another unseen card (might match, but reveals more to the opponent),
+  or flip an already known card on purpose (gives nothing away).
+A pass can't be answered with a pass (the computer never does, so two computers can't stall a game), which makes passing worth
+minus the value of playing on, so the value of a position with two or more singletons is never below 0.
+The table stores the expected score difference for the player to move, so every decision is one lookup.
+It is computed once for a board size, saved in the data folder (with a header to catch stale or broken files), and reused by later games.
+
+Weaker levels have imperfect memory: each seen card is only remembered with some probability and can be forgotten
+between turns. They play greedily with whatever they remember.
+'''
+
+import os
+import random
+import struct
+from array import array
+from app_paths import data_path
+
+
+#Constant variables
+
+#Memory model per level: (chance a seen card is remembered, chance a remembered card is forgotten per turn)
+LEVELS = {
+    "easy": (0.4, 0.15),
+    "medium": (0.75, 0.05),
+    "perfect": (1.0, 0.0),
+}
+
+#Value tables cover boards up to this many pairs unless a bigger one is asked for
+DEFAULT_MAX_PAIRS = 64
+
+#Decision table flags
+DECIDE_MISS = 1  #After a new first card, flip a known card on purpose
+DECIDE_PASS = 2  #Start the turn with two known cards of different pairs
+
+#Table file header: magic, format version, max pairs
+TABLE_HEADER = struct.Struct("<4sBI")
+TABLE_MAGIC = b"MMAI"
+TABLE_VERSION = 2
+
+
+#Helper functions
+
+#Position of state (n, k) in the flat tables (0 <= k <= n)
+def table_index(n, k):
+    return n * (n + 1) // 2 + k
+
+#Computes the value and decision tables for boards up to max_pairs pairs
+#value[n, k]: expected (own score - opponent score) from here for the player to move, with n pairs left and k known singletons
+#decision[n, k]: DECIDE_MISS if, after the first card of the turn turns out new, flipping a known card beats flipping another unseen card,
+#plus DECIDE_PASS if passing beats playing on
+def compute_tables(max_pairs):
+    size = table_index(max_pairs, max_pairs) + 1
+    value = array("d", bytes(8 * size))
+    decision = array("b", bytes(size))
+
+    for n in range(1, max_pairs + 1):
+        #k from high to low: value[n, k] needs value[n, k + 1] and value[n, k + 2]
+        for k in range(n, -1, -1):
+            unseen = 2 * n - k
+
+            #First card matches a known singleton: take the pair and keep playing
+            expected = (k / unseen) * (1 + value[table_index(n - 1, k - 1)]) if k else 0.0
+
+            if k < n:
+                #First card is new, the turn continues with k + 1 singletons
+                new_first = (2 * n - 2 * k) / unseen
+                left = unseen - 1
+
+                #Option a: flip another unseen card
+                guess = (1 / left) * (1 + value[table_index(n - 1, k)])
+                guess += (k / left) * -(1 + value[table_index(n - 1, k)])  #Hit an old singleton, opponent takes that pair
+                if 2 * n - 2 * k - 2 > 0:
+                    guess += ((2 * n - 2 * k - 2) / left) * -value[table_index(n, k + 2)]
+
+                #Option b: flip a known card on purpose
+                best = guess
+                if k >= 1:
+                    safe = -value[table_index(n, k + 1)]
+                    if safe > guess:
+                        best = safe
+                        decision[table_index(n, k)] |= DECIDE_MISS
+
+                expected += new_first * best
+
+            #Pass: the opponent has to play on from the same position
+            if k >= 2 and expected < 0:
+                expected = -expected
+                decision[table_index(n, k)] |= DECIDE_PASS
+
+            value[table_index(n, k)] = expected
+
+    return value, decision
+
+
+#Loaded tables shared by every computer player
+loaded_tables = {}
+
+#Reads saved tables for max_pairs pairs, raises ValueError if the file is from another version or board size, or broken
+def read_tables(path, max_pairs):
+    size = table_index(max_pairs, max_pairs) + 1
+    value = array("d")
+    decision = array("b")
+    with open(path, "rb") as file:
+        magic, version, pairs = TABLE_HEADER.unpack(file.read(TABLE_HEADER.size))
+        if magic != TABLE_MAGIC or version != TABLE_VERSION or pairs != max_pairs:
+            raise ValueError(f"{path} holds tables of another version or board size")
+        value.fromfile(file, size)
+        decision.fromfile(file, size)
+        if file.read(1):
+            raise ValueError(f"{path} is longer than expected")
+    return value, decision
+
+#Returns (value, decision) tables covering at least max_pairs pairs, loading them from disk or computing and saving them
+def load_tables(max_pairs=DEFAULT_MAX_PAIRS):
+    for size, tables in loaded_tables.items():
+        if size >= max_pairs:
+            return tables
+
+    path = data_path("ai", f"optimal_{max_pairs}.bin")
+    try:
+        value, decision = read_tables(path, max_pairs)
+    except (OSError, EOFError, ValueError, struct.error):
+        value, decision = compute_tables(max_pairs)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, max_pairs))
+            value.tofile(file)
+            decision.tofile(file)
+        os.replace(temp_path, path)
+
+    loaded_tables[max_pairs] = (value, decision)
+    return value, decision
+
+
+#Computer player for one seat
+class ComputerPlayer:
+    #Constructor
+    def __init__(self, level="perfect", rng=None):
+        self.level = level
+        self.recall, self.forget = LEVELS[level]
+        self.rng = rng or random.Random()
+        self.memory = {}  #card index -> pair id of remembered, unmatched cards
+        self.tables = None
+        self.turn_changed = False  #This turn showed a new card or made a match
+        self.last_turn_passed = False  #The last turn changed nothing, so it can't be answered with a pass
+        self.passing = False  #This turn is a pass
+
+    #Forgets everything (new game) and makes sure the tables cover the board
+    def new_game(self, num_pairs):
+        self.memory = {}
+        self.turn_changed = False
+        self.last_turn_passed = False
+        self.passing = False
+        if self.level == "perfect":
+            self.tables = load_tables(max(num_pairs, DEFAULT_MAX_PAIRS))
+
+    #Called for every card shown to the players
+    def observe(self, index, pair_id):
+        if index not in self.memory:
+            self.turn_changed = True
+        if self.rng.random() < self.recall:
+            self.memory[index] = pair_id
+
+    #Called when a pair is matched (by either player)
+    def matched(self, first, second):
+        self.turn_changed = True
+        self.memory.pop(first, None)
+        self.memory.pop(second, None)
+
+    #Called at the end of every turn, imperfect players forget some cards
+    def end_turn(self):
+        self.last_turn_passed = not self.turn_changed
+        self.turn_changed = False
+        self.passing = False
+        if self.forget:
+            for index in [index for index in self.memory if self.rng.random() < self.forget]:
+                del self.memory[index]
+
+    #Returns the two cards of a remembered pair, or None
+    def known_pair(self):
+        seen = {}
+        for index, pair_id in self.memory.items():
+            if pair_id in seen:
+                return seen[pair_id], index
+            seen[pair_id] = index
+        return None
+
+    #Returns a random face down card that isn't remembered (or any face down card if all are remembered)
+    def unseen_card(self, engine, exclude=-1):
+        cards = [index for index in range(engine.num_cards)
+                 if index != exclude and not engine.is_face_up(index) and index not in self.memory]
+        if not cards:
+            cards = [index for index in range(engine.num_cards) if index != exclude and not engine.is_face_up(index)]
+        return self.rng.choice(cards)
+
+    #Picks the first card of the turn: a known pair, a known card to pass if the table says so, else an unseen card
+    def choose_first(self, engine):
+        pair = self.known_pair()
+        if pair:
+            return pair[0]
+
+        known = [index for index in self.memory if not engine.is_face_up(index)]
+        if self.tables and len(known) >= 2 and not self.last_turn_passed:
+            value, decision = self.tables
+            if decision[table_index(engine.pairs_left, len(known))] & DECIDE_PASS:
+                self.passing = True
+                return known[0]
+        return self.unseen_card(engine)
+
+    #Picks the second card of the turn, after the first one was flipped
+    def choose_second(self, engine, first):
+        first_pair = engine.pair_of(first)
+
+        #Partner remembered: take the pair
+        for index, pair_id in self.memory.items():
+            if pair_id == first_pair and index != first and not engine.is_face_up(index):
+                return index
+
+        #Passing: any other known card is of another pair
+        known = [index for index in self.memory if index != first and not engine.is_face_up(index)]
+        if self.passing and known:
+            return known[0]
+
+        #First card was new: flip another unseen card, or a known card on purpose if the table says so
+        if self.tables and known:
+            value, decision = self.tables
+            singletons = len({pair_id for index, pair_id in self.memory.items() if index != first})
+            if decision[table_index(engine.pairs_left, singletons)] & DECIDE_MISS:
+                return known[0]
+        return self.unseen_card(engine, exclude=first)
@@ -0,0 +1,20 @@
+'''
+File locations for Match Madness
+
+Description:
+Everything the game writes to disk (caches, saved games, statistics) lives in one folder in the user's home directory.
+The MATCH_MADNESS_DATA environment variable can point it somewhere else (tests, benchmarks, portable installs).
+'''
+
+import os
+
+
+#Folder for files written by the game
+DATA_FOLDER = os.environ.get("MATCH_MADNESS_DATA", os.path.join(os.path.expanduser("~"), ".match_madness"))
+
+
+#Returns the path of a file (or sub-folder) in the data folder, creating the folder if needed
+def data_path(*names):
+    path = os.path.join(DATA_FOLDER, *names)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,435 @@
+'''
+Benchmark suite for Match Madness
+
+Description:
+Times the game's hot paths on every difficulty and on synthetic boards much bigger than DIFFICULTIES allows:
+    engine.*    dealing and playing turns with engine.GameEngine (the rules behind flip_card/check_match)
+    assets.*    listing and opening themes, PNG decoding, the scaled face cache, the face content index and generated faces
+    telemetry.* recording a move, and loading and aggregating a million recorded moves
+    gui.*       face decoding in Tk, start_game and build_game_screen, flip_card/check_match handling,
+                build_end_screen and the canvas board (only with a display)
+    startup.*   cold starts in a fresh interpreter: importing the game, and launch to the first paint of the menu (with a display)
+GUI cases run under a virtual X display (Xvfb) when there is no display and Xvfb is installed, and are skipped otherwise.
+Each case is repeated until it has run for a while, and the median time per operation is reported.
+
+Results are written as JSON. A previous result file can be given as a baseline: every case whose fastest round got slower
+than the tolerance allows is flagged as a regression and the exit status is 1 (the fastest round is the least noisy one).
+Results record whether they were run with --quick; when either side was, the tolerance is widened to QUICK_TOLERANCE,
+since three short rounds are too noisy for the default.
+The game's data folder is pointed at a scratch folder, so benchmarks never touch saved games or caches.
+
+Usage:
+    python benchmarks.py [--output FILE] [--compare BASELINE] [--tolerance 0.25] [--filter TEXT] [--no-gui] [--quick]
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import app_paths
+from engine import GameEngine, DIFFICULTIES, FLIP_FIRST, FLIP_SECOND, MATCH, MISMATCH
+from face_generator import MIN_FACE_SIZE, FaceDeck, deck_seed
+from face_index import FaceIndex
+from face_variants import FaceVariants, decode_png
+from replay import REPLAY_WRITER
+from telemetry import EVENT_FIRST, Moves, TelemetryRecorder
+from theme_bundle import list_image_files, open_theme, read_file
+
+
+#Constant variables
+
+CARDS_FOLDER = "Cards"
+THEMES = ("Food", "Nature", "Flags", "Animals")
+
+#Synthetic boards the game can't deal from a theme folder (benchmarked besides DIFFICULTIES)
+SYNTHETIC_BOARDS = {
+"10x10": (10, 10),
+"20x20": (20, 20),
+"40x50": (40, 50),
+}
+
+#Files in the synthetic theme folder
+SYNTHETIC_FILES = 10000
+
+#Pairs of the generated face deck (a 40x50 board)
+GENERATED_PAIRS = 1000
+
+#Recorded moves the telemetry loader aggregates (a tenth with --quick)
+TELEMETRY_MOVES = 1000000
+
+#Each case runs in rounds of growing length until one round takes this long, then this many rounds are timed
+MIN_ROUND_SECONDS = 0.05
+ROUNDS = 7
+
+#A case is a regression when its fastest round is this much slower than the baseline's
+DEFAULT_TOLERANCE = 0.25
+
+#Smallest tolerance used when either result file was run with --quick
+QUICK_TOLERANCE = 1.0
+
+#Virtual display
+XVFB_DISPLAY = ":97"
+XVFB_WAIT_SECONDS = 5
+
+#Cold starts timed per startup case (each one is a new interpreter)
+STARTUP_RUNS = 7
+
+
+#Helper functions
+
+#Times fn, returns a result dict with per operation seconds (fn runs `ops` operations per call)
+def measure(fn, ops=1, quick=False):
+    min_round = MIN_ROUND_SECONDS / 5 if quick else MIN_ROUND_SECONDS
+    rounds = 3 if quick else ROUNDS
+
+    #Find how many calls make one round
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_round or calls >= 1 << 20:
+            break
+        calls *= 2
+
+    times = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        for j in range(calls):
+            fn()
+        times.append((time.perf_counter() - start) / (calls * ops))
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "operations": calls * ops * rounds}
+
+#Plays one turn on an engine (a mismatch when possible, so the board never runs out), redealing finished games
+def play_turn(engine, rng):
+    if engine.over:
+        engine.redeal(rng)
+    face_down = [index for index in range(engine.num_cards) if not engine.is_face_up(index)]
+    first = rng.choice(face_down)
+    engine.flip(first)
+    second = rng.choice(face_down)
+    while second == first:
+        second = rng.choice(face_down)
+    if engine.flip(second) == FLIP_SECOND:
+        engine.resolve()
+
+#Pairs of card indices that don't match (for repeatable flip/check cases)
+def mismatched_pairs(engine, count, rng):
+    pairs = []
+    while len(pairs) < count:
+        first, second = rng.sample(range(engine.num_cards), 2)
+        if engine.pairs[first] != engine.pairs[second]:
+            pairs.append((first, second))
+    return pairs
+
+#Starts a virtual X display if there is none, returns the Xvfb process (None if there was a display or no Xvfb)
+def start_virtual_display():
+    if os.environ.get("DISPLAY"):
+        return None
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        return None
+    process = subprocess.Popen([xvfb, XVFB_DISPLAY, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socket_path = f"/tmp/.X11-unix/X{XVFB_DISPLAY[1:]}"
+    deadline = time.monotonic() + XVFB_WAIT_SECONDS
+    while not os.path.exists(socket_path) and time.monotonic() < deadline and process.poll() is None:
+        time.sleep(0.05)
+    if process.poll() is not None or not os.path.exists(socket_path):
+        process.kill()
+        return None
+    os.environ["DISPLAY"] = XVFB_DISPLAY
+    return process
+
+
+#Engine cases
+def engine_cases(quick):
+    results = {}
+    rng = random.Random(1)
+    for name, (rows, cols) in {**DIFFICULTIES, **SYNTHETIC_BOARDS}.items():
+        results[f"engine.deal[{name}]"] = measure(lambda: GameEngine(rows, cols, players=2, rng=rng), quick=quick)
+        engine = GameEngine(rows, cols, players=2, rng=rng)
+        results[f"engine.turn[{name}]"] = measure(lambda: play_turn(engine, rng), quick=quick)
+    return results
+
+#Asset loading cases
+def asset_cases(quick):
+    results = {}
+    for theme in THEMES:
+        folder = os.path.join(CARDS_FOLDER, theme)
+        results[f"assets.list_image_files[{theme}]"] = measure(lambda: list_image_files(folder), quick=quick)
+        results[f"assets.open_theme[{theme}]"] = measure(lambda: open_theme(CARDS_FOLDER, theme), quick=quick)
+
+    #A folder much bigger than any real theme
+    synthetic = tempfile.mkdtemp(dir=app_paths.DATA_FOLDER)
+    for i in range(SYNTHETIC_FILES):
+        open(os.path.join(synthetic, f"{i}.png"), "wb").close()
+    results[f"assets.list_image_files[synthetic {SYNTHETIC_FILES}]"] = measure(lambda: list_image_files(synthetic), quick=quick)
+    shutil.rmtree(synthetic)
+
+    paths = list_image_files(os.path.join(CARDS_FOLDER, THEMES[0]))
+    data = [read_file(path) for path in paths]
+    results["assets.decode_png"] = measure(lambda: [decode_png(item) for item in data], ops=len(data), quick=quick)
+
+    #Scaled faces: building into an empty cache, then loading from it
+    variants = FaceVariants(tempfile.mkdtemp(dir=app_paths.DATA_FOLDER))
+    def build():
+        variants.folder = tempfile.mkdtemp(dir=app_paths.DATA_FOLDER)
+        for path in paths:
+            variants.load(path, read_file, 90)
+    results["assets.face_variant_build"] = measure(build, ops=len(paths), quick=True)
+    results["assets.face_variant_load"] = measure(lambda: [variants.load(path, read_file, 90) for path in paths],
+                                                  ops=len(paths), quick=quick)
+
+    #Content index: hashing a theme into an empty index, then checking it against the cached index
+    def index_build():
+        FaceIndex(os.path.join(tempfile.mkdtemp(dir=app_paths.DATA_FOLDER), "index.json")).distinct(paths, workers=1)
+    results["assets.face_index_build"] = measure(index_build, ops=len(paths), quick=True)
+    index = FaceIndex(os.path.join(tempfile.mkdtemp(dir=app_paths.DATA_FOLDER), "index.json"))
+    index.distinct(paths)
+    results["assets.face_index_cached"] = measure(lambda: index.distinct(paths), ops=len(paths), quick=quick)
+
+    #Generated faces for a board of GENERATED_PAIRS pairs, drawn into a new deck each time (full size, 40x50 card size
+    #and the smallest size faces are made at), every pair must get a face of its own
+    for size in (90, 11, MIN_FACE_SIZE):
+        results[f"assets.generate_faces[{GENERATED_PAIRS} pairs, {size}px]"] = measure(
+            lambda: FaceDeck(deck_seed("Generated"), size).render(GENERATED_PAIRS), ops=GENERATED_PAIRS, quick=quick)
+        generated = FaceDeck(deck_seed("Generated"), size)
+        generated.render(GENERATED_PAIRS)
+        faces = generated.faces[:GENERATED_PAIRS]
+        if len(set(faces)) != GENERATED_PAIRS:
+            raise AssertionError(f"only {len(set(faces))} of {GENERATED_PAIRS} generated faces at {size}px are distinct")
+    return results
+
+#Telemetry cases: recording one move, then loading and aggregating TELEMETRY_MOVES recorded moves
+def telemetry_cases(quick):
+    results = {}
+    recorder = TelemetryRecorder(tempfile.mkdtemp(dir=app_paths.DATA_FOLDER))
+    results["telemetry.record"] = measure(lambda: recorder.record(1, 0, 1, EVENT_FIRST), quick=quick)
+
+    #Random Hard games: two flips and a settled turn at a time, a pair is matched when both its cards are picked
+    folder = tempfile.mkdtemp(dir=app_paths.DATA_FOLDER)
+    recorder = TelemetryRecorder(folder)
+    rng = random.Random(1)
+    moves = TELEMETRY_MOVES // 10 if quick else TELEMETRY_MOVES
+    for game in range(moves // 30 + 1):
+        recorder.new_game()
+        for turn in range(10):
+            first, second = rng.sample(range(30), 2)
+            recorder.flip(first, first // 2, 1, FLIP_FIRST)
+            recorder.flip(second, second // 2, 1, FLIP_SECOND)
+            recorder.resolve(first, first // 2, 1, MATCH if first // 2 == second // 2 else MISMATCH)
+    recorder.flush()
+    REPLAY_WRITER.wait()
+    results[f"telemetry.load_summary[{moves} moves]"] = measure(lambda: Moves(folder).summary(), quick=True)
+    return results
+
+#GUI cases (needs a display)
+def gui_cases(quick):
+    import tkinter as tk
+    import MatchMadness as game_module
+    from canvas_board import CanvasBoard
+
+    results = {}
+    root = tk.Tk()
+    game = game_module.MatchMadness(root)
+    rng = random.Random(1)
+
+    paths = list_image_files(os.path.join(CARDS_FOLDER, THEMES[0]))
+    results["gui.decode_photo"] = measure(lambda: [tk.PhotoImage(file=path) for path in paths], ops=len(paths), quick=quick)
+
+    for difficulty in DIFFICULTIES:
+        for mode in ("Solo", "Multiplayer"):
+            game.selected_theme = THEMES[0]
+            game.selected_difficulty = difficulty
+            game.selected_player = mode
+            game.computer_seat = None
+            label = f"{difficulty}, {mode}"
+
+            def start():
+                game.stop_timed_events()
+                game.start_game()
+                root.update_idletasks()
+            results[f"gui.start_game[{label}]"] = measure(start, quick=quick)
+
+            def build():
+                game.build_game_screen()
+                root.update_idletasks()
+            results[f"gui.build_game_screen[{label}]"] = measure(build, quick=quick)
+
+            #One turn: two flips and the check, a mismatch so the board stays playable
+            turns = mismatched_pairs(game.engine, 64, rng)
+            position = [0]
+            def turn():
+                first, second = turns[position[0] % len(turns)]
+                position[0] += 1
+                game.flip_card(first, *divmod(first, game.cols))
+                game.flip_card(second, *divmod(second, game.cols))
+                game.cancel_reveal()
+                game.check_match()
+                root.update_idletasks()
+            results[f"gui.flip_check[{label}]"] = measure(turn, quick=quick)
+
+            def end_screen():
+                game.build_end_screen()
+                root.update_idletasks()
+                game.hide_end_screen()
+                root.update_idletasks()
+            results[f"gui.end_screen[{label}]"] = measure(end_screen, quick=quick)
+            game.stop_timed_events()
+
+    #Synthetic boards on the canvas renderer
+    face = tk.PhotoImage(width=90, height=90)
+    for name, (rows, cols) in SYNTHETIC_BOARDS.items():
+        frame = tk.Frame(root)
+        frame.pack()
+        def build():
+            for child in frame.winfo_children():
+                child.destroy()
+            board = CanvasBoard(frame, rows, cols, lambda index, row, col: None, card_size=20, padding=2)
+            board.pack()
+            root.update_idletasks()
+            return board
+        results[f"gui.canvas_build[{name}]"] = measure(build, quick=True)
+        board = build()
+        cards = list(range(rows * cols))
+        def reveal():
+            index = rng.choice(cards)
+            board.show_face(index, face)
+            board.show_back(index)
+            root.update_idletasks()
+        results[f"gui.canvas_reveal[{name}]"] = measure(reveal, quick=quick)
+        frame.destroy()
+
+    root.destroy()
+    return results
+
+#Runs a command in a fresh interpreter `runs` times, returns a result dict of its wall times
+def cold_start(command, runs, timing=None):
+    env = dict(os.environ, MATCH_MADNESS_DATA=app_paths.DATA_FOLDER)
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+        elapsed = time.perf_counter() - start
+        if timing is not None:
+            elapsed = json.loads(output.splitlines()[-1])[timing]  #The game's own timing (seconds since launch)
+        times.append(elapsed)
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "operations": runs}
+
+#Startup cases (first paint needs a display)
+def startup_cases(quick, gui):
+    runs = 3 if quick else STARTUP_RUNS
+    results = {"startup.import": cold_start([sys.executable, "-c", "import MatchMadness"], runs)}
+    if gui:
+        command = [sys.executable, "MatchMadness.py", "--startup-benchmark"]
+        results["startup.first_paint"] = cold_start(command, runs, timing="first_paint")
+        results["startup.launch_to_exit"] = cold_start(command, runs)
+    return results
+
+#Compares results with a baseline, returns the names of regressed cases
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"{'case':<52} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<52} {'-':>12} {format_time(result['min']):>12}      new")
+            continue
+        ratio = result["min"] / before["min"] if before["min"] else 1.0
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<52} {format_time(before['min']):>12} {format_time(result['min']):>12} {ratio - 1:+7.0%}{flag}")
+    return regressions
+
+#Formats seconds with a readable unit
+def format_time(seconds):
+    if seconds < 1e-6:
+        return f"{seconds * 1e9:.0f} ns"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+#Command line interface
+def main(args):
+    parser = argparse.ArgumentParser(description="Match Madness benchmarks")
+    parser.add_argument("--output", help="JSON file for the results (printed as a table either way)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this text")
+    parser.add_argument("--no-gui", action="store_true", help="skip the GUI cases")
+    parser.add_argument("--quick", action="store_true", help="fewer, shorter rounds")
+    options = parser.parse_args(args)
+
+    #Caches, saved games and replays go to a scratch folder
+    app_paths.DATA_FOLDER = tempfile.mkdtemp(prefix="match-madness-bench-")
+
+    groups = [("engine", engine_cases), ("assets", asset_cases), ("telemetry", telemetry_cases)]
+    display = None
+    gui = "skipped (--no-gui)"
+    if not options.no_gui:
+        display = start_virtual_display()
+        if os.environ.get("DISPLAY"):
+            groups.append(("gui", gui_cases))
+            gui = "virtual display" if display else "display"
+        else:
+            gui = "skipped (no display and no Xvfb)"
+    has_display = not options.no_gui and bool(os.environ.get("DISPLAY"))
+    groups.append(("startup", lambda quick: startup_cases(quick, has_display)))
+
+    results = {}
+    try:
+        for group, cases in groups:
+            #A filter like "gui.flip" only needs its own group to run
+            if "." in options.filter and options.filter.split(".")[0] != group:
+                continue
+            for name, result in cases(options.quick).items():
+                if options.filter in name:
+                    results[name] = result
+    finally:
+        if display is not None:
+            display.terminate()
+        shutil.rmtree(app_paths.DATA_FOLDER, ignore_errors=True)
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "time": time.time(), "gui": gui,
+                 "quick": options.quick},
+        "results": results,
+    }
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(report, file, indent=1)
+
+    print(f"GUI cases: {gui}")
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+        tolerance = options.tolerance
+        if options.quick or baseline["meta"].get("quick"):
+            tolerance = max(tolerance, QUICK_TOLERANCE)
+            print(f"A --quick run is compared, tolerance widened to {tolerance:.0%}")
+        regressions = compare(results, baseline["results"], tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {tolerance:.0%}")
+            return 1
+        return 0
+
+    for name, result in results.items():
+        print(f"{name:<52} {format_time(result['median']):>12}  (min {format_time(result['min'])})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,93 @@
+'''
+Canvas board renderer for Match Madness
+
+Description:
+Draws the whole card grid on a single tk.Canvas instead of one tk.Button per card, so big boards (20x20 and up)
+don't pay for hundreds of widgets and grid geometry management.
+Each card is a fixed set of canvas items (back rectangle, "?" text, face image) created once.
+Clicks are mapped to a card with arithmetic on the click coordinates, and revealing or hiding a card only touches that card's items.
+'''
+
+import tkinter as tk
+
+
+#Constant variables
+
+#Card colours (same as the button board)
+BACK_COLOUR = "lightsalmon2"
+TEXT_COLOUR = "white"
+BACKGROUND_COLOUR = "peach puff"
+
+
+#Card grid drawn on one canvas
+class CanvasBoard:
+    #Constructor
+    def __init__(self, parent, rows, cols, on_click, card_size=90, padding=6):
+        self.rows = rows
+        self.cols = cols
+        self.on_click = on_click  #Called with (index, row, col) when a card is clicked
+        self.card_size = card_size
+        self.padding = padding
+        self.pitch = card_size + padding  #Distance between the corners of neighbouring cards
+        self.scaled_faces = {}  #Tk image name -> face image shrunk to fit the card
+
+        width = cols * self.pitch + padding
+        height = rows * self.pitch + padding
+        self.canvas = tk.Canvas(parent, width=width, height=height, bg=BACKGROUND_COLOUR, highlightthickness=0)
+        self.canvas.bind("<Button-1>", self.click)
+
+        #Item ids per card, indexed by card index
+        self.backs = []
+        self.labels = []
+        self.faces = []
+        font = ("Arial", max(8, card_size // 6), "bold")
+        for index in range(rows * cols):
+            x, y = self.card_origin(index)
+            centre_x = x + card_size // 2
+            centre_y = y + card_size // 2
+            self.backs.append(self.canvas.create_rectangle(x, y, x + card_size, y + card_size, fill=BACK_COLOUR, outline=""))
+            self.labels.append(self.canvas.create_text(centre_x, centre_y, text="?", fill=TEXT_COLOUR, font=font))
+            self.faces.append(self.canvas.create_image(centre_x, centre_y, state="hidden"))
+
+    #Top left corner of a card in canvas coordinates
+    def card_origin(self, index):
+        row, col = divmod(index, self.cols)
+        return self.padding + col * self.pitch, self.padding + row * self.pitch
+
+    #Maps a click to a card (ignores clicks on the gaps between cards)
+    def click(self, event):
+        x = self.canvas.canvasx(event.x) - self.padding
+        y = self.canvas.canvasy(event.y) - self.padding
+        if x < 0 or y < 0:
+            return
+        col, x_in_card = divmod(int(x), self.pitch)
+        row, y_in_card = divmod(int(y), self.pitch)
+        if col >= self.cols or row >= self.rows or x_in_card >= self.card_size or y_in_card >= self.card_size:
+            return
+        self.on_click(row * self.cols + col, row, col)
+
+    #Returns the face image shrunk (by an integer factor) so it fits inside a card
+    def fit_face(self, image):
+        factor = -(-max(image.width(), image.height()) // self.card_size)  #Ceiling division
+        if factor <= 1:
+            return image
+        name = str(image)
+        if name not in self.scaled_faces:
+            self.scaled_faces[name] = image.subsample(factor)
+        return self.scaled_faces[name]
+
+    #Shows a card's face
+    def show_face(self, index, image):
+        self.canvas.itemconfigure(self.faces[index], image=self.fit_face(image), state="normal")
+        self.canvas.itemconfigure(self.backs[index], fill=BACKGROUND_COLOUR)
+        self.canvas.itemconfigure(self.labels[index], state="hidden")
+
+    #Turns a card face down again
+    def show_back(self, index):
+        self.canvas.itemconfigure(self.faces[index], state="hidden")
+        self.canvas.itemconfigure(self.backs[index], fill=BACK_COLOUR)
+        self.canvas.itemconfigure(self.labels[index], state="normal")
+
+    #Places the canvas in its parent
+    def pack(self, **options):
+        self.canvas.pack(**options)
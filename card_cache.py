@@ -0,0 +1,135 @@
+'''
+Card image cache for Match Madness
+
+Description:
+Keeps decoded card faces (Tkinter PhotoImages) alive across games so each face is only decoded once per process.
+Images are keyed by (theme, file, size), so both cards of a pair and every restart of the same board share one image.
+Least recently used images are evicted once the memory cap is reached, and a whole theme can be dropped when the player switches themes.
+'''
+
+import os
+from collections import OrderedDict
+import tkinter as tk
+
+
+#Constant variables
+
+#Memory cap for decoded images (about 800 card faces at 100x100)
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+#Bytes per pixel Tk keeps for a decoded photo (RGBA)
+BYTES_PER_PIXEL = 4
+
+
+#Helper functions
+
+#Decodes an image file into a Tkinter PhotoImage
+def decode_photo(path):
+    return tk.PhotoImage(file=path)
+
+#Estimated memory used by a decoded photo
+def photo_bytes(photo):
+    return photo.width() * photo.height() * BYTES_PER_PIXEL
+
+
+#Process-wide cache of decoded card faces
+class ImageCache:
+    #Constructor
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()  #(theme, file, size) -> (photo, bytes), oldest first
+        self.current_bytes = 0
+
+        #Counters
+        self.hits = 0
+        self.misses = 0
+        self.decodes = 0
+        self.evictions = 0
+
+    #Builds the cache key for an image
+    def make_key(self, theme, path, size=None):
+        return (theme, os.path.basename(path), size)
+
+    #Returns the photo for an image, decoding it only if it is not cached yet
+    def get(self, theme, path, size=None, decoder=decode_photo):
+        key = self.make_key(theme, path, size)
+        entry = self.images.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.images.move_to_end(key)  #Mark as most recently used
+            return entry[0]
+
+        self.misses += 1
+        photo = decoder(path)
+        self.decodes += 1
+        self.put(key, photo)
+        return photo
+
+    #Returns a list of photos for a list of paths, decoding each distinct path once
+    def get_many(self, theme, paths, size=None, decoder=decode_photo):
+        photos = {}
+        for path in paths:
+            if path not in photos:
+                photos[path] = self.get(theme, path, size, decoder)
+        return [photos[path] for path in paths]
+
+    #Adds an already decoded photo to the cache
+    def put(self, key, photo):
+        if key in self.images:
+            self.current_bytes -= self.images.pop(key)[1]
+        size_bytes = photo_bytes(photo)
+        self.images[key] = (photo, size_bytes)
+        self.current_bytes += size_bytes
+        self.enforce_limit()
+
+    #Checks if an image is cached without touching the counters
+    def contains(self, theme, path, size=None):
+        return self.make_key(theme, path, size) in self.images
+
+    #Evicts least recently used images until the cache fits in its memory cap
+    def enforce_limit(self):
+        #Always keep the newest image, even if it alone is over the cap
+        while self.current_bytes > self.max_bytes and len(self.images) > 1:
+            key, (photo, size_bytes) = self.images.popitem(last=False)
+            self.current_bytes -= size_bytes
+            self.evictions += 1
+
+    #Removes every image belonging to a theme
+    def evict_theme(self, theme):
+        for key in [key for key in self.images if key[0] == theme]:
+            self.current_bytes -= self.images.pop(key)[1]
+            self.evictions += 1
+
+    #Removes every image that does not belong to the given theme (used when switching themes)
+    def evict_other_themes(self, theme):
+        for other in {key[0] for key in self.images if key[0] != theme}:
+            self.evict_theme(other)
+
+    #Empties the cache (counters are kept)
+    def clear(self):
+        self.evictions += len(self.images)
+        self.images.clear()
+        self.current_bytes = 0
+
+    #Resets the hit/miss/decode counters
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.decodes = 0
+        self.evictions = 0
+
+    #Returns the cache counters
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "decodes": self.decodes,
+            "evictions": self.evictions,
+            "entries": len(self.images),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+#Shared cache used by the game
+IMAGE_CACHE = ImageCache()
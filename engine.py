@@ -0,0 +1,146 @@
+'''
+Match Madness game engine
+
+Description:
+The game rules without any Tkinter: dealing, flipping, matching, scoring and turns.
+The board is a compact array of integer pair ids (card index -> pair id), and matched and face-up cards are tracked as bitmasks,
+so every rule check is a couple of integer operations.
+The Tkinter game (MatchMadness) drives an engine and only draws what it reports, and games can also be played headless for tests,
+simulations and benchmarks.
+'''
+
+import random
+from array import array
+
+
+#Constant variables
+
+#Grid size (rows, cols) depending on difficulty of game
+DIFFICULTIES = {
+"Easy": (3,4),
+"Medium": (4,4),
+"Hard": (5,6)
+}
+
+#Timer for solo mode (seconds)
+SOLO_TIME_LIMIT = 180
+
+#Results of GameEngine.flip
+FLIP_IGNORED = 0  #Card can't be flipped right now (matched, already face up, two cards up, game over)
+FLIP_FIRST = 1  #First card of a turn is face up
+FLIP_SECOND = 2  #Second card is face up, resolve() must be called to score the turn
+
+#Results of GameEngine.resolve
+MATCH = 1
+MISMATCH = 2
+
+
+#Helper functions
+
+#Returns a shuffled array of pair ids (each id 0..num_pairs-1 appears twice)
+def deal_pairs(num_pairs, rng=random):
+    pair_ids = list(range(num_pairs)) * 2
+    rng.shuffle(pair_ids)
+    return array("H", pair_ids)
+
+
+#Rules and state of one game
+class GameEngine:
+    __slots__ = ("rows", "cols", "num_cards", "pairs", "players", "scores", "current_player",
+                 "matched", "face_up", "first", "second", "pairs_left", "moves", "over")
+
+    #Constructor, deals a new board unless pair ids are given
+    def __init__(self, rows, cols, players=1, pair_ids=None, rng=random):
+        if (rows * cols) % 2:
+            raise ValueError("a board needs an even number of cards")
+        self.rows = rows
+        self.cols = cols
+        self.num_cards = rows * cols
+        self.players = players
+        if pair_ids is None:
+            pair_ids = deal_pairs(self.num_cards // 2, rng)
+        elif len(pair_ids) != self.num_cards:
+            raise ValueError("pair_ids must have one entry per card")
+        self.pairs = array("H", pair_ids)
+        self.reset()
+
+    #Puts every card face down and resets scores and turns (the deal is kept)
+    def reset(self):
+        self.scores = [0] * (self.players + 1)  #Indexed by player number (1-based), index 0 unused
+        self.current_player = 1
+        self.matched = 0  #Bit i set = card i matched
+        self.face_up = 0  #Bit i set = card i face up this turn (not yet resolved)
+        self.first = -1  #First flipped card of the current turn
+        self.second = -1  #Second flipped card of the current turn
+        self.pairs_left = self.num_cards // 2
+        self.moves = 0  #Number of resolved turns
+        self.over = False
+
+    #Deals a new shuffled board and resets the game
+    def redeal(self, rng=random):
+        self.pairs = deal_pairs(self.num_cards // 2, rng)
+        self.reset()
+
+    #Pair id of the card at an index
+    def pair_of(self, index):
+        return self.pairs[index]
+
+    #Checks if a card is matched
+    def is_matched(self, index):
+        return (self.matched >> index) & 1 == 1
+
+    #Checks if a card is face up (matched or flipped this turn)
+    def is_face_up(self, index):
+        return ((self.matched | self.face_up) >> index) & 1 == 1
+
+    #Returns the indices of every face up card (matched or flipped this turn)
+    def face_up_cards(self):
+        shown = self.matched | self.face_up
+        return [index for index in range(self.num_cards) if (shown >> index) & 1]
+
+    #Checks if two cards are waiting for resolve()
+    def awaiting_resolve(self):
+        return self.second >= 0
+
+    #Flips a card if the rules allow it
+    def flip(self, index):
+        bit = 1 << index
+        if self.over or self.second >= 0 or (self.matched | self.face_up) & bit:
+            return FLIP_IGNORED
+        self.face_up |= bit
+        if self.first < 0:
+            self.first = index
+            return FLIP_FIRST
+        self.second = index
+        return FLIP_SECOND
+
+    #Scores the two flipped cards, returns (MATCH or MISMATCH, first index, second index)
+    def resolve(self):
+        first, second = self.first, self.second
+        if second < 0:
+            raise RuntimeError("resolve() called before two cards were flipped")
+        self.first = self.second = -1
+        self.face_up = 0
+        self.moves += 1
+
+        #Keep cards face up (match)
+        if self.pairs[first] == self.pairs[second]:
+            self.matched |= (1 << first) | (1 << second)
+            self.scores[self.current_player] += 1
+            self.pairs_left -= 1
+            if self.pairs_left == 0:
+                self.over = True
+            return MATCH, first, second
+
+        #Switch player only on no match
+        self.current_player = self.current_player % self.players + 1
+        return MISMATCH, first, second
+
+    #Ends the game early (solo timer ran out)
+    def end(self):
+        self.over = True
+
+    #Returns the winning player numbers (more than one on a tie)
+    def winners(self):
+        best = max(self.scores[1:])
+        return [player for player in range(1, self.players + 1) if self.scores[player] == best]
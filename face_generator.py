@@ -0,0 +1,382 @@
+'''
+Generated card faces for Match Madness
+
+Description:
+A theme only has so many pictures (15 in each theme folder), and every pair needs its own, so bigger boards run out of
+faces. This module draws as many extra faces as a board needs: a shape (square, circle, diamond, ...) in a colour,
+on a background, with a letter or digit in the middle. Faces are numbered, and numbering walks through colours first,
+then shapes, backgrounds and glyphs, so the first faces of a deck differ the most.
+A deck can be drawn over a faded copy of a theme picture, so generated faces still look like part of the theme.
+Below COMPACT_SIZE pixels shapes blur into blobs, so small faces drop them: they are a colour block with two glyphs
+side by side, drawn at a whole number scale, and told apart by colour, background and glyphs alone.
+Faces can't be made smaller than MIN_FACE_SIZE pixels.
+
+Faces are made straight into binary PPM bytes, which tk.PhotoImage(data=...) loads without a temporary file.
+Drawing works a row at a time: each shape is turned into runs of pixels per row once per deck, the shape rows of a
+(shape, colour, background) are built once and shared, and a face only rewrites the rows its glyph crosses.
+Decks are memoized per (seed, size) and drawn in batches, and their memory is exactly faces x (3 x size x size + header);
+the least recently used decks are dropped when the decks together pass MAX_DECK_BYTES.
+
+Generated faces have paths like <generated>/<seed>-<number>.ppm, so they go through the image cache, saved games and
+deals exactly like theme pictures.
+
+Usage:
+    python face_generator.py <pairs> [--size N] [--out FILE]     Times drawing a deck (and writes its first face),
+                                                                 fails if two of its faces are the same
+'''
+
+import argparse
+import math
+import os
+import sys
+import time
+import zlib
+from collections import OrderedDict
+
+
+#Constant variables
+
+#Folder part of generated face paths (no such folder exists)
+GENERATED_FOLDER = "<generated>"
+
+#Size generated faces are drawn at when no card size is given (same as the theme pictures)
+GENERATED_SIZE = 100
+
+#Faces drawn at a time when a deck needs more
+BATCH_FACES = 64
+
+#Memory cap of all memoized decks together
+MAX_DECK_BYTES = 64 * 1024 * 1024
+
+#Shape colours (strong), background colours (light) and glyph colours (light on dark shapes, dark on light ones)
+SHAPE_COLOURS = [
+    (214, 39, 40), (31, 119, 180), (44, 160, 44), (255, 127, 14), (148, 103, 189), (23, 190, 207),
+    (227, 119, 194), (140, 86, 75), (188, 189, 34), (0, 0, 128), (128, 0, 0), (0, 100, 80),
+]
+BACKGROUND_COLOURS = [(255, 218, 185), (240, 248, 255), (255, 250, 205), (230, 230, 250)]
+LIGHT_GLYPH = (255, 255, 255)
+DARK_GLYPH = (20, 20, 20)
+
+#How much of a theme picture shows through the background of composited faces (0-255)
+BACKDROP_STRENGTH = 80
+
+#3x5 pixel glyphs, one string of 15 bits (rows top to bottom) per character
+GLYPHS = {
+    "0": "111101101101111", "1": "010110010010111", "2": "111001111100111", "3": "111001111001111",
+    "4": "101101111001001", "5": "111100111001111", "6": "111100111101111", "7": "111001010010010",
+    "8": "111101111101111", "9": "111101111001111", "A": "010101111101101", "B": "110101110101110",
+    "C": "011100100100011", "D": "110101101101110", "E": "111100110100111", "F": "111100110100100",
+    "G": "011100101101011", "H": "101101111101101", "J": "001001001101010", "K": "101101110101101",
+    "L": "100100100100111", "M": "101111111101101", "N": "110101101101101", "P": "110101110100100",
+    "R": "110101110101101", "S": "011100010001110", "T": "111010010010010", "U": "101101101101111",
+    "V": "101101101101010", "W": "101101111111101", "X": "101101010101101", "Y": "101101010010010",
+    "Z": "111001010100111",
+}
+GLYPH_NAMES = sorted(GLYPHS)
+
+#Share of the face a glyph is tall
+GLYPH_HEIGHT = 0.36
+
+#Faces smaller than this can't show a shape that still reads as one: they get compact designs instead
+#(a colour block with two glyphs side by side), and faces smaller than MIN_FACE_SIZE can't fit two glyphs at all
+COMPACT_SIZE = 24
+MIN_FACE_SIZE = 9
+
+
+#Helper functions
+
+#Shape spans on coordinates from -1 to 1 (y grows downwards): the (left, right) stretches of a shape at height v
+def square_spans(v):
+    return [(-0.78, 0.78)] if abs(v) <= 0.78 else []
+
+def circle_spans(v):
+    return [(-math.sqrt(0.85 * 0.85 - v * v), math.sqrt(0.85 * 0.85 - v * v))] if abs(v) <= 0.85 else []
+
+def diamond_spans(v):
+    return [(abs(v) - 0.95, 0.95 - abs(v))] if abs(v) <= 0.95 else []
+
+def triangle_spans(v):
+    half = 0.9 * (v + 0.8) / 1.55
+    return [(-half, half)] if -0.8 <= v <= 0.75 else []
+
+def hexagon_spans(v):
+    half = 0.9 - 0.45 * abs(v)
+    return [(-half, half)] if abs(v) <= 0.78 else []
+
+def ring_spans(v):
+    if abs(v) > 0.88:
+        return []
+    outer = math.sqrt(0.88 * 0.88 - v * v)
+    if abs(v) >= 0.5:
+        return [(-outer, outer)]
+    inner = math.sqrt(0.5 * 0.5 - v * v)
+    return [(-outer, -inner), (inner, outer)]
+
+def plus_spans(v):
+    if abs(v) <= 0.36:
+        return [(-0.88, 0.88)]
+    return [(-0.36, 0.36)] if abs(v) <= 0.88 else []
+
+def octagon_spans(v):
+    half = min(0.82, 1.2 - abs(v))
+    return [(-half, half)] if abs(v) <= 0.82 else []
+
+SHAPES = [square_spans, circle_spans, diamond_spans, triangle_spans, hexagon_spans, ring_spans, plus_spans, octagon_spans]
+
+#Runs of a shape in each row of a size x size face: per row, a tuple of (start, end) pixel columns
+def shape_runs(shape, size):
+    rows = []
+    for y in range(size):
+        runs = []
+        for left, right in shape((2 * y + 1) / size - 1):
+            #Pixel x is inside when its centre (2x + 1) / size - 1 is within the span
+            start = max(0, math.ceil(((left + 1) * size - 1) / 2))
+            end = min(size, math.floor(((right + 1) * size - 1) / 2) + 1)
+            if start < end:
+                runs.append((start, end))
+        rows.append(tuple(runs))
+    return rows
+
+#Runs of a glyph in each row it covers, centred on a size x size face: {row: [(start, end), ...]}
+#Compact faces draw their glyphs at a whole number scale, so every glyph pixel stays a sharp block however small the face is
+def glyph_runs(text, size, compact=False):
+    if compact:
+        scale = max(1, min((size - 2) // 5, (size - 2) // (4 * len(text) - 1)))
+        height, width = 5 * scale, 3 * scale
+    else:
+        height = max(5, int(size * GLYPH_HEIGHT))
+        scale = height / 5
+        width = max(3, round(3 * scale))
+    gap = max(1, round(scale))
+    top = (size - height) // 2
+    left = (size - len(text) * width - (len(text) - 1) * gap) // 2
+    rows = {}
+    for y in range(height):
+        runs = []
+        for index, character in enumerate(text):
+            line = GLYPHS[character][3 * min(4, int(y / scale)):][:3]
+            character_left = left + index * (width + gap)
+            for column, bit in enumerate(line):
+                if bit == "1":
+                    start = character_left + round(column * width / 3)
+                    end = character_left + round((column + 1) * width / 3)
+                    if runs and runs[-1][1] == start:
+                        runs[-1] = (runs[-1][0], end)
+                    else:
+                        runs.append((start, end))
+        rows[top + y] = tuple(runs)
+    return rows
+
+#Runs of the colour block of compact faces (everything but a one pixel border)
+def block_runs(size):
+    return [()] + [((1, size - 1),)] * (size - 2) + [()]
+
+#Perceived brightness of a colour (0-255)
+def brightness(colour):
+    r, g, b = colour
+    return (r * 299 + g * 587 + b * 114) // 1000
+
+#Seed of a theme's deck (the same theme always generates the same faces)
+def deck_seed(theme):
+    return zlib.crc32(theme.encode("utf-8"))
+
+#Path of a generated face
+def generated_path(seed, number):
+    return os.path.join(GENERATED_FOLDER, f"{seed:08x}-{number}.ppm")
+
+#Checks if a path is a generated face
+def is_generated(path):
+    return os.path.dirname(path) == GENERATED_FOLDER
+
+#Returns (seed, number) of a generated face path
+def parse_generated(path):
+    seed, number = os.path.basename(path)[:-len(".ppm")].split("-")
+    return int(seed, 16), int(number)
+
+#RGB pixels of a binary PPM picture centred on a white size x size square (theme pictures keep their aspect ratio)
+def square_pixels(ppm, size):
+    magic, dimensions, maximum, rgb = ppm.split(b"\n", 3)
+    width, height = map(int, dimensions.split())
+    if (width, height) == (size, size):
+        return rgb
+    left, top = (size - width) // 2, (size - height) // 2
+    white = b"\xff" * (3 * size)
+    rows = [white] * top
+    for y in range(height):
+        rows.append(white[:3 * left] + rgb[3 * width * y:3 * width * (y + 1)] + white[:3 * (size - width - left)])
+    rows.extend([white] * (size - height - top))
+    return b"".join(rows)
+
+#Fades RGB pixels of a size x size picture towards white, for a deck's background
+def faded_backdrop(rgb):
+    keep = BACKDROP_STRENGTH
+    return bytes((value * keep + 255 * (255 - keep)) // 255 for value in rgb)
+
+
+#A numbered set of generated faces of one size
+class FaceDeck:
+    #Constructor (backdrop: size x size RGB pixels shown faded behind every face, None for plain backgrounds)
+    #Raises ValueError for sizes below MIN_FACE_SIZE, where faces can't be told apart
+    def __init__(self, seed, size, backdrop=None):
+        if size < MIN_FACE_SIZE:
+            raise ValueError(f"generated faces need at least {MIN_FACE_SIZE}x{MIN_FACE_SIZE} pixels, not {size}x{size}")
+        self.seed = seed
+        self.size = size
+        self.compact = size < COMPACT_SIZE
+        self.backdrop = faded_backdrop(backdrop) if backdrop is not None else None
+        self.header = b"P6\n%d %d\n255\n" % (size, size)
+        self.faces = []  #PPM bytes per face number
+        self.runs = {None: block_runs(size)}  #shape index (None: compact block) -> runs per row
+        self.layers = {}  #(shape, colour, background) -> shared row bytes
+        self.glyphs = {}  #glyph text -> runs per row
+
+        #The seed rotates the palettes and glyphs, so different decks start from different faces
+        self.colour_offset = seed % len(SHAPE_COLOURS)
+        self.shape_offset = (seed >> 8) % len(SHAPES)
+        self.glyph_offset = (seed >> 16) % len(GLYPH_NAMES)
+
+    #Number of faces before the generator starts repeating
+    def capacity(self):
+        backgrounds = 1 if self.backdrop is not None else len(BACKGROUND_COLOURS)
+        if self.compact:
+            return len(SHAPE_COLOURS) * len(GLYPH_NAMES) * len(GLYPH_NAMES) * backgrounds
+        return len(SHAPE_COLOURS) * len(SHAPES) * backgrounds * len(GLYPH_NAMES)
+
+    #Looks of a face number: (shape, shape colour, background, glyph text), colours change fastest
+    #Compact faces have no shape (None) and two glyphs, the second one changing before the first
+    def design(self, number):
+        number %= self.capacity()
+        number, colour = divmod(number, len(SHAPE_COLOURS))
+        colour = (colour + self.colour_offset) % len(SHAPE_COLOURS)
+        if self.compact:
+            number, second = divmod(number, len(GLYPH_NAMES))
+            number, first = divmod(number, len(GLYPH_NAMES))
+            shape = None
+            glyph = self.glyph_name(first) + self.glyph_name(second)
+        else:
+            number, shape = divmod(number, len(SHAPES))
+            shape = (shape + self.shape_offset) % len(SHAPES)
+        if self.backdrop is None:
+            number, background = divmod(number, len(BACKGROUND_COLOURS))
+        else:
+            background = None
+        if not self.compact:
+            glyph = self.glyph_name(number)
+        return shape, colour, background, glyph
+
+    #Glyph character of a glyph number (rotated by the seed)
+    def glyph_name(self, number):
+        return GLYPH_NAMES[(number + self.glyph_offset) % len(GLYPH_NAMES)]
+
+    #Rows of a shape in a colour on a background (made once per deck and shared by every face with them)
+    def layer(self, shape, colour, background):
+        key = (shape, colour, background)
+        rows = self.layers.get(key)
+        if rows is not None:
+            return rows
+        if shape not in self.runs:
+            self.runs[shape] = shape_runs(SHAPES[shape], self.size)  #Compact faces' block is made with the deck
+        fill = bytes(SHAPE_COLOURS[colour])
+        rows = []
+        shared = {}  #Runs -> row bytes, rows with the same runs are one object (flat backgrounds only)
+        for y, runs in enumerate(self.runs[shape]):
+            if self.backdrop is None and runs in shared:
+                rows.append(shared[runs])
+                continue
+            if self.backdrop is not None:
+                row = bytearray(self.backdrop[3 * self.size * y:3 * self.size * (y + 1)])
+            else:
+                row = bytearray(bytes(BACKGROUND_COLOURS[background]) * self.size)
+            for start, end in runs:
+                row[3 * start:3 * end] = fill * (end - start)
+            rows.append(shared.setdefault(runs, bytes(row)) if self.backdrop is None else bytes(row))
+        self.layers[key] = rows
+        return rows
+
+    #Draws one face, returns its PPM bytes
+    def draw(self, number):
+        shape, colour, background, glyph = self.design(number)
+        rows = list(self.layer(shape, colour, background))
+        if glyph not in self.glyphs:
+            self.glyphs[glyph] = glyph_runs(glyph, self.size, self.compact)
+        ink = bytes(DARK_GLYPH if brightness(SHAPE_COLOURS[colour]) > 150 else LIGHT_GLYPH)
+        inked = {}  #(layer row, glyph runs) -> row bytes, a glyph row repeats over several pixel rows
+        for y, runs in self.glyphs[glyph].items():
+            key = (id(rows[y]), runs)
+            row = inked.get(key)
+            if row is None:
+                row = bytearray(rows[y])
+                for start, end in runs:
+                    row[3 * start:3 * end] = ink * (end - start)
+                row = inked[key] = bytes(row)
+            rows[y] = row
+        return self.header + b"".join(rows)
+
+    #Makes sure the first `count` faces are drawn (in batches of at least BATCH_FACES)
+    def render(self, count):
+        if count <= len(self.faces):
+            return
+        count = max(count, len(self.faces) + BATCH_FACES)
+        self.faces.extend(self.draw(number) for number in range(len(self.faces), count))
+
+    #PPM bytes of a face
+    def face(self, number):
+        self.render(number + 1)
+        return self.faces[number]
+
+    #Memory used by the drawn faces
+    def nbytes(self):
+        return len(self.faces) * (len(self.header) + 3 * self.size * self.size)
+
+
+#Memoized decks, least recently used first
+decks = OrderedDict()
+
+#Returns the deck for (seed, size), made the first time it is asked for
+#backdrop is a function returning the deck's size x size backdrop pixels (or None), only called when the deck is made
+def deck(seed, size, backdrop=None):
+    key = (seed, size)
+    found = decks.get(key)
+    if found is not None:
+        decks.move_to_end(key)
+        return found
+    found = decks[key] = FaceDeck(seed, size, backdrop() if backdrop is not None else None)
+
+    #Drop the least recently used decks once they all take too much memory
+    while len(decks) > 1 and sum(item.nbytes() for item in decks.values()) > MAX_DECK_BYTES:
+        decks.popitem(last=False)
+    return found
+
+#PPM bytes of a generated face path drawn at a size
+def generated_face(path, size):
+    seed, number = parse_generated(path)
+    return deck(seed, size).face(number)
+
+
+#Command line interface
+def main(args):
+    parser = argparse.ArgumentParser(description="Match Madness generated faces")
+    parser.add_argument("pairs", type=int)
+    parser.add_argument("--size", type=int, default=GENERATED_SIZE)
+    parser.add_argument("--out", help="PPM file for the first face")
+    options = parser.parse_args(args)
+
+    if options.size < MIN_FACE_SIZE:
+        parser.error(f"--size must be at least {MIN_FACE_SIZE}")
+    start = time.perf_counter()
+    generated = FaceDeck(deck_seed("Generated"), options.size)
+    generated.render(options.pairs)
+    elapsed = time.perf_counter() - start
+    distinct = len(set(generated.faces[:options.pairs]))
+    print(f"{options.pairs} faces at {options.size}x{options.size} in {elapsed * 1000:.1f}ms, "
+          f"{generated.nbytes() / 1e6:.1f} MB, {distinct} distinct")
+    if options.out:
+        with open(options.out, "wb") as file:
+            file.write(generated.face(0))
+    if distinct != options.pairs:
+        print(f"Error: {options.pairs - distinct} faces repeat an earlier one")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
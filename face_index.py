@@ -0,0 +1,360 @@
+'''
+Card face content index for Match Madness
+
+Description:
+The game deals one pair per face file, so two files with the same (or nearly the same) picture would give the board
+two "pairs" that look alike, and flipping one card of each would look like a match the game rejects.
+This index gives every face a content identity so only one file per picture is dealt:
+    exact hash       sha1 of the file
+    perceptual hash  the picture shrunk to a THUMBNAIL_SIZE x THUMBNAIL_SIZE colour thumbnail (area average),
+                     so re-encoded, resized or slightly edited copies end up with nearly the same thumbnail
+Two faces are the same picture when their files are identical, or when their thumbnails differ by at most
+NEAR_DUPLICATE_DIFFERENCE per colour value on average. (Grey difference hashes were tried first, but the flat pastel
+backgrounds of the card art made them noisy: an apple and cherries on pink hashed identically.)
+Near duplicates are found through a grid index. Each thumbnail is quartered into 2x2 average colours (12 values), and
+PROJECTIONS adds those up with + and - signs (rows of a Hadamard matrix, so they vary independently): the quarters of
+near duplicates are at most QUARTER_LIMIT apart in total, so every such sum is too. Faces are put in a grid over the first
+GRID_PROJECTIONS sums, also in the neighbouring cell of each sum that is that close to a cell border, and a face is only
+compared with the faces in its own cell. Similar card backgrounds then don't make every face a candidate for every other:
+20,000 faces are grouped in a few seconds, whether they are pastel card art or random noise.
+The identities of a theme are cached too, by its list of exact hashes, so opening an unchanged theme doesn't regroup it.
+
+Hashes are cached (faces/content_index.json in the data folder): the exact hash of a file by (path, size, mtime), and the
+perceptual hash by exact hash, so unchanged files are never read again and copies of a picture are only decoded once.
+Uncached faces are hashed in a process pool when there are enough of them, so big theme libraries index on every core.
+
+Usage:
+    python face_index.py build [cards_folder] [--workers N]     Indexes every theme and lists its duplicate faces
+'''
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from app_paths import data_path
+from face_variants import decode_png
+from theme_bundle import open_bundle, open_theme, read_file
+
+
+#Constant variables
+
+INDEX_FILE = "content_index.json"
+
+#Perceptual hash thumbnail size (pixels per side)
+THUMBNAIL_SIZE = 8
+
+#Largest average difference per thumbnail colour value (0-255) for two faces to count as the same picture
+#(resized or re-encoded copies of the card art stay under 1.5, the closest distinct faces, two flags, are 3.7 apart)
+NEAR_DUPLICATE_DIFFERENCE = 2.5
+
+#Largest total difference between the quarter averages (see quarters) of two near duplicate thumbnails
+QUARTER_LIMIT = NEAR_DUPLICATE_DIFFERENCE * 3 * THUMBNAIL_SIZE * THUMBNAIL_SIZE / (THUMBNAIL_SIZE // 2) ** 2
+
+#Signed sums of the 12 quarter averages (rows of a 12 x 12 Hadamard matrix), the first GRID_PROJECTIONS index the grid
+PROJECTIONS = (
+    "++++++++++++", "-++-+++---+-", "--++-+++---+", "-+-++-+++---", "--+-++-+++--", "---+-++-+++",
+    "----+-++-+++", "-+---+-++-++", "-++---+-++-+", "-+++---+-++-", "--+++---+-++", "-+-+++---+-+",
+)
+PROJECTION_SIGNS = tuple(tuple(1 if sign == "+" else -1 for sign in row) for row in PROJECTIONS)
+GRID_PROJECTIONS = 8
+
+#Grid cell size of the sums, more than QUARTER_LIMIT (bigger cells: fewer cells per face, more faces per cell)
+PROJECTION_CELL = 90
+
+#Lists of faces (themes) whose identities are cached (the first grouped is dropped first)
+MAX_CACHED_THEMES = 64
+
+#Perceptual hash of a face the pure Python decoder can't read (only its exact hash identifies it)
+NO_PERCEPTUAL_HASH = None
+
+#Uncached faces needed before a process pool is worth starting (fewer are hashed on the calling thread)
+POOL_MIN_FACES = 64
+
+#Faces handed to a pool worker at a time
+POOL_CHUNK = 32
+
+
+#Helper functions
+
+#Shrinks RGB bytes to size x size by averaging the source pixels that fall in each thumbnail pixel
+def thumbnail(rgb, width, height, size):
+    columns = [x * size // width for x in range(width)]
+    sums = [0] * (3 * size * size)
+    counts = [0] * (size * size)
+    for y in range(height):
+        cell_row = y * size // height * size
+        base = y * width * 3
+        for x in range(width):
+            cell = cell_row + columns[x]
+            i = base + 3 * x
+            counts[cell] += 1
+            sums[3 * cell] += rgb[i]
+            sums[3 * cell + 1] += rgb[i + 1]
+            sums[3 * cell + 2] += rgb[i + 2]
+    return bytes(total // counts[i // 3] for i, total in enumerate(sums))
+
+#Perceptual hash of image bytes (hex colour thumbnail), NO_PERCEPTUAL_HASH if it can't be decoded
+def perceptual_hash(data):
+    try:
+        width, height, rgb = decode_png(bytes(data))
+    except (ValueError, zlib.error, struct.error):
+        return NO_PERCEPTUAL_HASH
+    if width < THUMBNAIL_SIZE or height < THUMBNAIL_SIZE:
+        return NO_PERCEPTUAL_HASH
+    return thumbnail(rgb, width, height, THUMBNAIL_SIZE).hex()
+
+#Runs in a pool worker: perceptual hash of a file path or of image bytes
+def perceptual_face(item):
+    return perceptual_hash(read_file(item) if isinstance(item, str) else item)
+
+#Checks if two thumbnails are the same picture
+def near_duplicates(first, second):
+    return sum(abs(a - b) for a, b in zip(first, second)) <= NEAR_DUPLICATE_DIFFERENCE * len(first)
+
+#Quarters a thumbnail into 2x2 average colours (the difference between two of these, times the pixels in a quarter,
+#is never more than the difference between the thumbnails, so it rejects most candidates after 12 values instead of 192)
+def quarters(thumb):
+    size = THUMBNAIL_SIZE
+    half = size // 2
+    row = 3 * size
+    averages = []
+    for top in (0, half):
+        for left in (0, half):
+            for channel in range(3):
+                start = top * row + 3 * left + channel
+                total = sum(sum(thumb[start + y * row:start + y * row + 3 * half:3]) for y in range(half))
+                averages.append(total / (half * half))
+    return averages
+
+#Key a list of faces' groupings are cached by: their exact hashes in order (and the threshold they were grouped with)
+def grouping_key(hashes):
+    text = " ".join([str(NEAR_DUPLICATE_DIFFERENCE)] + [digest for digest, perceptual in hashes])
+    return hashlib.sha1(text.encode("ascii")).hexdigest()
+
+#Returns a content identity per face (faces with the same identity show the same picture), from (exact, perceptual) hashes
+def identities(hashes):
+    parent = list(range(len(hashes)))
+
+    #Group of a face (union find over the faces)
+    def find(face):
+        while parent[face] != face:
+            parent[face] = parent[parent[face]]
+            face = parent[face]
+        return face
+
+    #Puts two faces in the same group
+    def join(first, second):
+        first, second = find(first), find(second)
+        if first != second:
+            parent[max(first, second)] = min(first, second)
+
+    #Identical files, then identical perceptual hashes (re-encoded copies), each joined to one representative
+    representatives = []
+    by_digest = {}
+    by_perceptual = {}
+    for face, (digest, perceptual) in enumerate(hashes):
+        if digest in by_digest:
+            join(by_digest[digest], face)
+            continue
+        by_digest[digest] = face
+        if perceptual is NO_PERCEPTUAL_HASH:
+            continue
+        if perceptual in by_perceptual:
+            join(by_perceptual[perceptual], face)
+            continue
+        by_perceptual[perceptual] = face
+        representatives.append(face)
+
+    #Near identical pictures: every signed sum of their quarters is at most QUARTER_LIMIT apart, so in each sum they are
+    #in the same grid cell, or in neighbouring cells with both of them that close to the border between the two.
+    #A face is put in its own cell and the neighbours it is that close to, and looks for others in its own cell only.
+    #The first sum is the overall average, a cheap check before comparing the other sums, quarters and thumbnails
+    thumbs = {face: bytes.fromhex(hashes[face][1]) for face in representatives}
+    coarse = {face: quarters(thumb) for face, thumb in thumbs.items()}
+    sums = {face: [sum([sign * value for sign, value in zip(signs, values)]) for signs in PROJECTION_SIGNS]
+            for face, values in coarse.items()}
+    grid = {}
+    own_cells = {}
+    for face in representatives:
+        options = []
+        for value in sums[face][:GRID_PROJECTIONS]:
+            cell = int(value // PROJECTION_CELL)
+            option = [cell]
+            if value - cell * PROJECTION_CELL <= QUARTER_LIMIT:
+                option.append(cell - 1)
+            if (cell + 1) * PROJECTION_CELL - value <= QUARTER_LIMIT:
+                option.append(cell + 1)
+            options.append(option)
+        own_cells[face] = tuple(option[0] for option in options)
+        for cell in itertools.product(*options):
+            grid.setdefault(cell, []).append(face)
+    for first in representatives:
+        first_sums = sums[first]
+        overall = first_sums[0]
+        for second in grid[own_cells[first]]:
+            if (first < second and abs(overall - sums[second][0]) <= QUARTER_LIMIT
+                    and all(abs(a - b) <= QUARTER_LIMIT for a, b in zip(first_sums, sums[second]))
+                    and sum(abs(a - b) for a, b in zip(coarse[first], coarse[second])) <= QUARTER_LIMIT
+                    and find(first) != find(second) and near_duplicates(thumbs[first], thumbs[second])):
+                join(first, second)
+    return [find(face) for face in range(len(hashes))]
+
+
+#Cached exact and perceptual hashes of card faces
+class FaceIndex:
+    #Constructor
+    def __init__(self, path=None):
+        self.path = path or data_path("faces", INDEX_FILE)
+        self.lock = threading.Lock()  #Used from prefetch workers
+        self.changed = False
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+            self.files = saved["files"]  #file key -> [size, mtime_ns, sha1]
+            self.perceptual = saved["perceptual"]  #sha1 -> perceptual hash
+            self.groups = saved.get("identities", {})  #key of a theme's sha1 list (see grouping_key) -> identities
+        except (OSError, ValueError, KeyError, TypeError):
+            self.files = {}
+            self.perceptual = {}
+            self.groups = {}
+
+        #Counters
+        self.hashed = 0
+
+    #Returns (exact hash, perceptual hash) per path, hashing only faces that aren't cached (bundle: the theme's bundle, if read from one)
+    def hashes(self, paths, read=read_file, bundle=None, workers=None):
+        if bundle is not None:
+            stat = os.stat(bundle.path)
+            keys = [f"{os.path.abspath(bundle.path)}:{os.path.basename(path)}" for path in paths]
+            stamps = [(stat.st_size, stat.st_mtime_ns)] * len(paths)
+        else:
+            keys = [os.path.abspath(path) for path in paths]
+            stamps = []
+            for path in paths:
+                stat = os.stat(path)
+                stamps.append((stat.st_size, stat.st_mtime_ns))
+
+        #Both hashes of unchanged files come from the cache
+        digests = [None] * len(paths)
+        missing = []
+        with self.lock:
+            for i, (key, stamp) in enumerate(zip(keys, stamps)):
+                entry = self.files.get(key)
+                if entry and (entry[0], entry[1]) == stamp and entry[2] in self.perceptual:
+                    digests[i] = entry[2]
+                else:
+                    missing.append(i)
+
+        #Exact hashes of new or changed files (cheap), remembering one file per content that still needs a perceptual hash
+        loose = bundle is None and read is read_file
+        unknown = {}  #sha1 -> path of a face with that content
+        for i in missing:
+            digest = hashlib.sha1(read(paths[i])).hexdigest()
+            digests[i] = digest
+            with self.lock:
+                self.files[keys[i]] = [stamps[i][0], stamps[i][1], digest]
+                self.changed = True
+                if digest not in self.perceptual:
+                    unknown.setdefault(digest, paths[i])
+
+        #Perceptual hashes (decoding is the slow part) of each new content once, in a pool when there are many
+        #(the pool reads loose files itself, bundle faces are sent as bytes)
+        if unknown:
+            items = [path if loose else bytes(read(path)) for path in unknown.values()]
+            if len(items) >= POOL_MIN_FACES and workers != 1:
+                #Spawned, not forked: the game indexes from a prefetch thread next to Tk
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    results = list(pool.map(perceptual_face, items, chunksize=POOL_CHUNK))
+            else:
+                results = [perceptual_face(item) for item in items]
+            with self.lock:
+                self.perceptual.update(zip(unknown, results))
+                self.hashed += len(results)
+
+        with self.lock:
+            return [(digest, self.perceptual[digest]) for digest in digests]
+
+    #Returns identities(hashes), grouped once per list of faces (an unchanged theme reuses its grouping)
+    def grouped(self, hashes):
+        key = grouping_key(hashes)
+        with self.lock:
+            cached = self.groups.get(key)
+        if cached is not None and len(cached) == len(hashes):
+            return cached
+        grouping = identities(hashes)
+        with self.lock:
+            self.groups[key] = grouping
+            while len(self.groups) > MAX_CACHED_THEMES:
+                del self.groups[next(iter(self.groups))]
+            self.changed = True
+        return grouping
+
+    #Keeps the first face of each distinct picture, in the given order
+    def distinct(self, paths, read=read_file, bundle=None, workers=None):
+        seen = set()
+        faces = []
+        for path, identity in zip(paths, self.grouped(self.hashes(paths, read, bundle, workers))):
+            if identity not in seen:
+                seen.add(identity)
+                faces.append(path)
+        return faces
+
+    #Saves the cache if it changed
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, "w") as file:
+                    json.dump({"files": self.files, "perceptual": self.perceptual, "identities": self.groups}, file)
+                os.replace(temp_path, self.path)
+                self.changed = False
+            except OSError:
+                pass
+
+
+#Command line interface
+def main(args):
+    parser = argparse.ArgumentParser(description="Match Madness face index")
+    parser.add_argument("mode", choices=("build",))
+    parser.add_argument("cards_folder", nargs="?", default="Cards")
+    parser.add_argument("--workers", type=int, default=None, help="pool processes (default: one per core)")
+    options = parser.parse_args(args)
+
+    index = FaceIndex()
+    themes = sorted({name.split(".")[0] for name in os.listdir(options.cards_folder)})
+    start = time.perf_counter()
+    total = 0
+    for theme in themes:
+        try:
+            paths, read = open_theme(options.cards_folder, theme)
+        except OSError:
+            continue
+        if not paths:
+            continue
+        total += len(paths)
+        bundle = open_bundle(options.cards_folder, theme)
+        hashes = index.hashes(paths, read, bundle, options.workers)
+        groups = {}
+        for path, identity in zip(paths, index.grouped(hashes)):
+            groups.setdefault(identity, []).append(os.path.basename(path))
+        duplicates = [names for names in groups.values() if len(names) > 1]
+        print(f"{theme}: {len(paths)} faces, {len(groups)} distinct")
+        for names in duplicates:
+            print(f"    same picture: {', '.join(names)}")
+    index.save()
+    elapsed = time.perf_counter() - start
+    print(f"{total} faces in {elapsed:.2f}s ({index.hashed} pictures decoded)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
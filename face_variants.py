@@ -0,0 +1,305 @@
+'''
+Pre-scaled card faces for Match Madness
+
+Description:
+Card faces are drawn at the size the board needs (90x90 on the button boards, smaller on big canvas boards),
+but the theme images are 100x100, so Tk used to clip them on every reveal.
+This module makes a copy of each face scaled to the card size once, with a pure Python area-average resampler that
+runs on the prefetch worker thread (no Tk needed), and keeps it in a disk cache (faces/ in the data folder) as a PPM file.
+After that, starting a board only reads ready made pixels, and Tk loads PPM without decoding a PNG.
+
+Variants are named by the source's content hash and the target size, so two themes sharing a picture share its variants.
+The hash of a loose file is remembered together with its size and modification time (faces/index.json),
+so unchanged files are never re-hashed and an edited file gets new variants.
+Images the pure Python decoder can't read (not 8 bit, interlaced, JPEG) are scaled by Tk with zoom/subsample instead.
+'''
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from fractions import Fraction
+from app_paths import data_path
+
+
+#Constant variables
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+#Channels per PNG colour type (grey, RGB, palette, grey + alpha, RGBA)
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+#Transparent pixels are blended onto the board's background colour (peach puff)
+BACKGROUND_RGB = (255, 218, 185)
+
+#Largest zoom factor Tk is asked for when it scales an image itself
+MAX_ZOOM = 10
+
+
+#Helper functions
+
+#Paeth predictor of the PNG filters
+def paeth(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+#Decodes an 8 bit, non interlaced PNG into (width, height, RGB bytes), raises ValueError for anything else
+def decode_png(data):
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("not a PNG")
+    position = 8
+    idat = []
+    palette = None
+    transparency = None
+    width = height = colour_type = None
+    while position < len(data):
+        length, kind = struct.unpack_from(">I4s", data, position)
+        chunk = data[position + 8:position + 8 + length]
+        position += 12 + length
+        if kind == b"IHDR":
+            width, height, depth, colour_type, compression, filtering, interlace = struct.unpack(">IIBBBBB", chunk)
+            if depth != 8 or interlace or colour_type not in PNG_CHANNELS:
+                raise ValueError("unsupported PNG format")
+        elif kind == b"PLTE":
+            palette = chunk
+        elif kind == b"tRNS":
+            transparency = chunk
+        elif kind == b"IDAT":
+            idat.append(chunk)
+        elif kind == b"IEND":
+            break
+    if width is None or not idat:
+        raise ValueError("truncated PNG")
+
+    channels = PNG_CHANNELS[colour_type]
+    stride = width * channels
+    raw = zlib.decompress(b"".join(idat))
+    if len(raw) < (stride + 1) * height:
+        raise ValueError("truncated PNG")
+
+    #Undo the per row filters
+    pixels = bytearray(stride * height)
+    previous = bytearray(stride)
+    for y in range(height):
+        start = y * (stride + 1)
+        filter_type = raw[start]
+        row = bytearray(raw[start + 1:start + 1 + stride])
+        if filter_type == 1:
+            for i in range(channels, stride):
+                row[i] = (row[i] + row[i - channels]) & 0xFF
+        elif filter_type == 2:
+            row = bytearray((value + above) & 0xFF for value, above in zip(row, previous))
+        elif filter_type == 3:
+            for i in range(stride):
+                left = row[i - channels] if i >= channels else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif filter_type == 4:
+            for i in range(stride):
+                if i >= channels:
+                    row[i] = (row[i] + paeth(row[i - channels], previous[i], previous[i - channels])) & 0xFF
+                else:
+                    row[i] = (row[i] + previous[i]) & 0xFF
+        elif filter_type != 0:
+            raise ValueError("corrupt PNG filter")
+        pixels[y * stride:(y + 1) * stride] = row
+        previous = row
+
+    return width, height, to_rgb(pixels, colour_type, palette, transparency)
+
+#Converts decoded PNG samples to RGB, blending transparency onto the background
+def to_rgb(pixels, colour_type, palette, transparency):
+    if colour_type == 2:
+        return bytes(pixels)
+    if colour_type == 0:
+        return bytes(value for value in pixels for i in range(3))
+    if colour_type == 3:
+        if palette is None:
+            raise ValueError("PNG palette missing")
+        alphas = transparency or b""
+        rgb = bytearray()
+        for index in pixels:
+            colour = palette[3 * index:3 * index + 3]
+            alpha = alphas[index] if index < len(alphas) else 255
+            rgb += blend(colour, alpha)
+        return bytes(rgb)
+    rgb = bytearray()
+    if colour_type == 4:
+        for i in range(0, len(pixels), 2):
+            rgb += blend((pixels[i],) * 3, pixels[i + 1])
+    else:
+        for i in range(0, len(pixels), 4):
+            rgb += blend(pixels[i:i + 3], pixels[i + 3])
+    return bytes(rgb)
+
+#Blends one colour onto the background
+def blend(colour, alpha):
+    if alpha == 255:
+        return bytes(colour)
+    return bytes((value * alpha + background * (255 - alpha)) // 255 for value, background in zip(colour, BACKGROUND_RGB))
+
+#Source pixels and weights covering each output pixel of an area-average resize along one axis
+def resize_weights(source, target):
+    scale = source / target
+    weights = []
+    for out in range(target):
+        start, end = out * scale, (out + 1) * scale
+        covered = []
+        pixel = int(start)
+        while pixel < end and pixel < source:
+            overlap = min(end, pixel + 1) - max(start, pixel)
+            if overlap > 0:
+                covered.append((pixel, overlap / scale))
+            pixel += 1
+        weights.append(covered)
+    return weights
+
+#Resizes RGB bytes with an area average (each output pixel is the mean of the source area it covers)
+def resize_rgb(rgb, width, height, new_width, new_height):
+    #Horizontal pass
+    columns = resize_weights(width, new_width)
+    rows = []
+    for y in range(height):
+        base = y * width * 3
+        row = []
+        for covered in columns:
+            r = g = b = 0.0
+            for x, weight in covered:
+                i = base + 3 * x
+                r += rgb[i] * weight
+                g += rgb[i + 1] * weight
+                b += rgb[i + 2] * weight
+            row += (r, g, b)
+        rows.append(row)
+
+    #Vertical pass
+    out = bytearray()
+    for covered in resize_weights(height, new_height):
+        for i in range(new_width * 3):
+            value = 0.0
+            for y, weight in covered:
+                value += rows[y][i] * weight
+            out.append(min(255, int(value + 0.5)))
+    return bytes(out)
+
+#Size of an image scaled to fit inside a size x size square (aspect ratio kept)
+def fit_size(width, height, size):
+    scale = size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+#Binary PPM image of RGB bytes
+def ppm_bytes(width, height, rgb):
+    return b"P6\n%d %d\n255\n" % (width, height) + rgb
+
+#Scales a decoded Tk photo to fit a size x size square with zoom/subsample (Tk thread, for images decode_png can't read)
+def scale_photo(photo, size):
+    ratio = Fraction(size, max(photo.width(), photo.height())).limit_denominator(MAX_ZOOM)
+    if ratio == 1:
+        return photo
+    if ratio.numerator > 1:
+        photo = photo.zoom(ratio.numerator)
+    return photo.subsample(ratio.denominator)
+
+
+#Disk cache of scaled faces
+class FaceVariants:
+    #Constructor
+    def __init__(self, folder=None):
+        self.folder = folder or os.path.dirname(data_path("faces", "index.json"))
+        os.makedirs(self.folder, exist_ok=True)
+        self.index_path = os.path.join(self.folder, "index.json")
+        self.lock = threading.Lock()  #Used from prefetch workers
+        self.changed = False
+        try:
+            with open(self.index_path) as file:
+                self.index = json.load(file)  #path -> [size, mtime_ns, sha1]
+        except (OSError, ValueError):
+            self.index = {}
+
+        #Counters
+        self.hits = 0
+        self.builds = 0
+
+    #Content hash of a source image (loose files are only re-hashed when their size or mtime changes)
+    def source_digest(self, path, read):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return hashlib.sha1(read(path)).hexdigest()  #Bundle only image, bundles are never edited in place
+        key = os.path.abspath(path)
+        with self.lock:
+            entry = self.index.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha1(read(path)).hexdigest()
+        with self.lock:
+            self.index[key] = [stat.st_size, stat.st_mtime_ns, digest]
+            self.changed = True
+        return digest
+
+    #Path of a variant
+    def variant_path(self, digest, size):
+        return os.path.join(self.folder, f"{digest}_{size}.ppm")
+
+    #Returns the PPM bytes of an image's variant if it is in the cache, else None (never decodes, so it is cheap on the Tk thread)
+    def cached_data(self, path, read, size):
+        try:
+            with open(self.variant_path(self.source_digest(path, read), size), "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        self.hits += 1
+        return data
+
+    #Returns PPM bytes of an image scaled to fit size x size, from the cache or made now (raises ValueError if it can't be decoded)
+    def load(self, path, read, size):
+        data = self.cached_data(path, read, size)
+        if data is not None:
+            return data
+
+        variant = self.variant_path(self.source_digest(path, read), size)
+        width, height, rgb = decode_png(bytes(read(path)))
+        new_width, new_height = fit_size(width, height, size)
+        if (new_width, new_height) != (width, height):
+            rgb = resize_rgb(rgb, width, height, new_width, new_height)
+        data = ppm_bytes(new_width, new_height, rgb)
+        self.builds += 1
+
+        #Temporary file first, so a half written variant is never loaded
+        temp_path = f"{variant}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, variant)
+        except OSError:
+            pass  #Read only data folder: the variant is still used, just not kept
+        return data
+
+    #Returns the variant's PPM bytes (PhotoImage(data=...) loads them directly), or None if it must be scaled by Tk
+    def load_data(self, path, read, size):
+        try:
+            return self.load(path, read, size)
+        except (ValueError, zlib.error, struct.error):
+            return None
+
+    #Saves the hash index if it changed
+    def save_index(self):
+        with self.lock:
+            if not self.changed:
+                return
+            temp_path = self.index_path + ".tmp"
+            try:
+                with open(temp_path, "w") as file:
+                    json.dump(self.index, file)
+                os.replace(temp_path, self.index_path)
+                self.changed = False
+            except OSError:
+                pass
@@ -0,0 +1,83 @@
+'''
+Network client for Match Madness
+
+Description:
+Connects the Tkinter game to a game server (server.py).
+A reader thread receives protocol lines and puts them on a thread-safe queue, which the Tk thread polls with root.after,
+so Tk is only ever touched from its own thread.
+'''
+
+import queue
+import socket
+import threading
+from server import encode, decode
+
+
+#Constant variables
+
+#How often the Tk thread checks for server messages (milliseconds)
+POLL_MS = 15
+
+
+#Helper functions
+
+#Splits "host:port" into (host, port)
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+#Connection to a game server
+class GameClient:
+    #Constructor, connects right away (raises OSError if the server can't be reached)
+    def __init__(self, root, address, on_message):
+        self.root = root
+        self.on_message = on_message  #Called on the Tk thread with (command, args)
+        self.sock = socket.create_connection(parse_address(address), timeout=5)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  #Flips are tiny, send them right away
+        self.messages = queue.Queue()
+        self.closed = False
+
+        reader = threading.Thread(target=self.read_loop, daemon=True)
+        reader.start()
+        self.root.after(POLL_MS, self.poll)
+
+    #Runs on the reader thread: queues every line until the connection closes
+    def read_loop(self):
+        try:
+            for line in self.sock.makefile("rb"):
+                self.messages.put(decode(line))
+        except OSError:
+            pass
+        self.messages.put(("CLOSED", []))
+
+    #Sends a message to the server
+    def send(self, *fields):
+        try:
+            self.sock.sendall(encode(*fields))
+        except OSError:
+            self.messages.put(("CLOSED", []))
+
+    #Hands queued messages to the game (Tk thread)
+    def poll(self):
+        while True:
+            try:
+                command, args = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if command == "CLOSED":
+                self.closed = True
+            self.on_message(command, args)
+            if self.closed:
+                return
+        if not self.closed:
+            self.root.after(POLL_MS, self.poll)
+
+    #Closes the connection
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
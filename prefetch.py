@@ -0,0 +1,231 @@
+'''
+Background theme prefetching for Match Madness
+
+Description:
+As soon as a theme (or difficulty) is picked in the menu, a worker thread opens the theme (bundle or folder) and reads the card faces from disk.
+Faces showing the same picture as an earlier face are left out (face_index), so a board never deals two pairs that look alike.
+The results are handed back to Tk through a thread-safe queue that is polled with root.after, and the faces are put into the shared image cache.
+Tk photos can only be created on the Tk thread, so the worker does all of the slow disk work and the main thread only builds each photo from memory.
+By the time Play is pressed, start_game just attaches the already prepared images.
+When the card size is known, the worker loads faces already scaled to it (face_variants), so Tk never scales at render time.
+A face that wasn't prefetched and has no scaled copy yet is scaled by Tk once (decoding and resampling it in Python
+would hold up the Tk thread for tens of milliseconds), and its scaled copy is made on a builder thread for next time.
+Boards needing more pairs than a theme has pictures get generated faces for the rest (face_generator).
+'''
+
+import base64
+import queue
+import threading
+import tkinter as tk
+from card_cache import IMAGE_CACHE, decode_photo
+from theme_bundle import open_bundle, open_theme, read_file
+
+
+#Constant variables
+
+#Folder part of generated face paths (same as face_generator.GENERATED_FOLDER, which isn't imported until needed)
+GENERATED_FOLDER = "<generated>"
+
+#Folder holding one sub-folder per theme
+CARDS_FOLDER = "Cards"
+
+#How often the Tk thread checks for finished work (milliseconds)
+POLL_MS = 15
+
+
+#Loads theme card faces in the background
+class ThemePrefetcher:
+    #Constructor
+    def __init__(self, root, cache=IMAGE_CACHE, variants=None):
+        self.root = root
+        self.cache = cache
+        self.variants = variants  #Disk cache of scaled faces, opened on first use
+        self.index = None  #Content hashes of faces, opened on first use
+        self.results = queue.Queue()  #Worker -> Tk thread messages
+        self.sources = {}  #theme -> (image paths, read function)
+        self.requested = {}  #(theme, face size) -> number of faces already requested
+        self.active_theme = None
+        self.workers = 0  #Number of running worker threads
+        self.polling = False
+        self.prepared = 0  #Number of photos built from prefetched data
+        self.missing = queue.Queue()  #(path, read function, size) of faces to make scaled copies of
+        self.builder = None  #Thread making them, started on first use
+
+    #Returns the disk cache of scaled faces
+    def face_variants(self):
+        if self.variants is None:
+            from face_variants import FaceVariants  #Imported when first needed, it isn't part of showing the menu
+            self.variants = FaceVariants()
+        return self.variants
+
+    #Returns the content index of faces
+    def face_index(self):
+        if self.index is None:
+            from face_index import FaceIndex
+            self.index = FaceIndex()
+        return self.index
+
+    #Opens a theme, keeping one face per distinct picture (in natural file order), returns (image paths, read function)
+    def open_faces(self, theme):
+        paths, read = open_theme(CARDS_FOLDER, theme)
+        index = self.face_index()
+        paths = index.distinct(paths, read, open_bundle(CARDS_FOLDER, theme))
+        index.save()
+        return paths, read
+
+    #Starts loading the first `count` faces of a theme in the background (scaled to fit size x size if a size is given)
+    def prefetch(self, theme, count, size=None):
+        self.active_theme = theme
+        if self.requested.get((theme, size), 0) >= count:
+            return  #Already loading or loaded
+        self.requested[(theme, size)] = count
+        variants = self.face_variants() if size else None
+
+        self.workers += 1
+        worker = threading.Thread(target=self.worker, args=(theme, count, size, variants), daemon=True)
+        worker.start()
+
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_MS, self.poll)
+
+    #Forgets everything about themes other than the given one (their images were evicted from the cache)
+    def forget_other_themes(self, theme):
+        for other in [key for key in self.requested if key[0] != theme]:
+            del self.requested[other]
+        for other in [name for name in self.sources if name != theme]:
+            del self.sources[other]
+
+    #Runs on the worker thread: opens the theme and reads (and scales) the files (no Tk calls here)
+    def worker(self, theme, count, size, variants):
+        try:
+            paths, read = self.open_faces(theme)
+            self.results.put(("source", theme, (paths, read)))
+            for path in paths[:count]:
+                data = variants.load_data(path, read, size) if variants else None
+                scaled = data is not None
+                if not scaled:
+                    data = base64.b64encode(read(path))
+                self.results.put(("image", theme, (path, size, data, scaled)))
+            if variants:
+                variants.save_index()
+        except (OSError, ValueError):
+            pass  #start_game falls back to loading from disk and reports the error there
+        finally:
+            self.results.put(("done", theme, None))
+
+    #Checks the queue from the Tk thread until every worker is finished
+    def poll(self):
+        self.drain()
+        if self.workers > 0:
+            self.root.after(POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    #Attaches every finished result to the cache (Tk thread only)
+    def drain(self):
+        while True:
+            try:
+                kind, theme, payload = self.results.get_nowait()
+            except queue.Empty:
+                return
+
+            if kind == "done":
+                self.workers -= 1
+            elif theme != self.active_theme:
+                continue  #Player switched themes while this was loading
+            elif kind == "source":
+                self.sources[theme] = payload
+            elif kind == "image":
+                path, size, data, scaled = payload
+                if not self.cache.contains(theme, path, size):
+                    photo = tk.PhotoImage(data=data)
+                    if size and not scaled:
+                        from face_variants import scale_photo
+                        photo = scale_photo(photo, size)
+                    self.cache.put(self.cache.make_key(theme, path, size), photo)
+                    self.prepared += 1
+
+    #Returns (image paths, read function) of a theme, using the prefetched source when there is one
+    def source(self, theme):
+        self.drain()
+        if theme not in self.sources:
+            self.sources[theme] = self.open_faces(theme)
+        return self.sources[theme]
+
+    #Returns the image paths of a theme
+    def image_paths(self, theme):
+        return self.source(theme)[0]
+
+    #Checks if a theme's faces are read from its bundle
+    def is_bundled(self, theme):
+        return self.source(theme)[1] is not read_file
+
+    #Returns the read function of a theme without listing its images (resuming a saved game, which knows its paths)
+    def reader(self, theme, bundled):
+        if theme in self.sources:
+            return self.sources[theme][1]
+        bundle = open_bundle(CARDS_FOLDER, theme) if bundled else None
+        return bundle.read if bundle is not None else read_file
+
+    #Returns a function that decodes one face of a theme on the Tk thread (for faces that were not prefetched)
+    #A read function can be given when the image paths are already known (resuming a saved game), then the theme isn't opened
+    #Generated faces (face_generator) have no file behind them, they are drawn from their path
+    def decoder(self, theme, size=None, read=None):
+        if read is None:
+            paths, read = self.source(theme)
+        if size:
+            decode = lambda path: self.decode_scaled(path, read, size)
+        elif read is read_file:
+            decode = decode_photo
+        else:
+            decode = lambda path: tk.PhotoImage(data=base64.b64encode(read(path)))
+        return lambda path: self.decode_generated(path, size) if path.startswith(GENERATED_FOLDER) else decode(path)
+
+    #Draws a generated face (Tk thread)
+    def decode_generated(self, path, size):
+        from face_generator import GENERATED_SIZE, generated_face
+        return tk.PhotoImage(data=generated_face(path, size or GENERATED_SIZE))
+
+    #Returns the paths of `count` generated faces for a theme (boards with more pairs than it has pictures)
+    #They are drawn over a faded copy of the theme's first picture, so they still look like part of the theme
+    def generated_faces(self, theme, count, size=None, paths=None, read=None):
+        from face_generator import GENERATED_SIZE, deck, deck_seed, generated_path, is_generated, square_pixels
+        if read is None:
+            paths, read = self.source(theme)
+        size = size or GENERATED_SIZE
+        pictures = [path for path in paths if not is_generated(path)]
+
+        #The backdrop is only decoded when the theme's deck is made at this size
+        def backdrop():
+            data = self.face_variants().load_data(pictures[0], read, size) if pictures else None
+            return square_pixels(data, size) if data is not None else None
+
+        seed = deck_seed(theme)
+        deck(seed, size, backdrop).render(count)  #Drawn in batches now, the photos are built from memory
+        return [generated_path(seed, number) for number in range(count)]
+
+    #Decodes one face scaled to fit size x size (Tk thread)
+    #Only a scaled copy already on disk is used, otherwise Tk scales the face and the copy is made in the background
+    def decode_scaled(self, path, read, size):
+        variants = self.face_variants()
+        data = variants.cached_data(path, read, size)
+        if data is not None:
+            return tk.PhotoImage(data=data)
+        self.missing.put((path, read, size))
+        if self.builder is None:
+            self.builder = threading.Thread(target=self.build_variants, args=(variants,), daemon=True)
+            self.builder.start()
+        from face_variants import scale_photo
+        return scale_photo(tk.PhotoImage(data=base64.b64encode(read(path))), size)
+
+    #Runs on the builder thread: makes the scaled copies of faces decode_scaled had to scale with Tk (no Tk calls here)
+    def build_variants(self, variants):
+        while True:
+            path, read, size = self.missing.get()
+            try:
+                variants.load_data(path, read, size)
+            except OSError:
+                pass  #Theme removed or bundle closed meanwhile, the face is scaled by Tk again next time
+            if self.missing.empty():
+                variants.save_index()
@@ -0,0 +1,325 @@
+'''
+Callback profiling for Match Madness
+
+Description:
+Opt-in instrumentation for finding out where a sluggish board spends its time (python MatchMadness.py --profile,
+or MATCH_MADNESS_PROFILE=1). When it is not installed nothing is wrapped, so a normal game pays nothing for it.
+
+Once installed, every Python callback the game gives Tk (button commands, event bindings, after and after_idle calls)
+is wrapped, and so is every event and frame update run by the frame scheduler. Each callback gets:
+    run time     wall time spent in the callback
+    queue delay  how late an after callback or scheduler event ran compared to when it was due
+recorded in HDR style histograms (log buckets with linear sub-buckets, about 3% precision from 1 microsecond to over an hour)
+so memory stays fixed however long the game runs.
+
+While the game runs:
+    F8   shows or hides a live overlay of the slowest callbacks
+    F9   starts or stops a cProfile capture (saved in profiles/ in the data folder and summarised on stdout)
+    F10  writes the callback table to profiles/ in the data folder
+The table is also written when the game exits.
+
+Usage:
+    python profiling.py check     Runs after and after_idle callbacks with the profiler installed (no window needed)
+'''
+
+import atexit
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import time
+import tkinter as tk
+from array import array
+from app_paths import data_path
+
+
+#Constant variables
+
+#Histogram layout: values below SUB_BUCKETS are exact, above that each power of two is split into SUB_BUCKETS buckets
+SUB_BUCKETS = 32
+MAX_SHIFT = 27  #Values up to SUB_BUCKETS << MAX_SHIFT microseconds (over an hour)
+HISTOGRAM_BUCKETS = SUB_BUCKETS + (MAX_SHIFT + 1) * SUB_BUCKETS
+
+#Overlay refresh interval (milliseconds) and number of callbacks it lists
+OVERLAY_MS = 500
+OVERLAY_ROWS = 15
+
+#Functions shown by the cProfile summary
+CPROFILE_ROWS = 25
+
+
+#Helper functions
+
+#Readable name of a callback: Class.method, function, or lambda with its location
+def callback_name(func):
+    if isinstance(func, functools.partial):
+        return callback_name(func.func)
+    owner = getattr(func, "__self__", None)
+    if owner is not None and not isinstance(owner, type(sys)):
+        return f"{type(owner).__name__}.{func.__name__}"
+    name = getattr(func, "__qualname__", None) or repr(func)
+    code = getattr(func, "__code__", None)
+    if code is not None and "<lambda>" in name:
+        return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name
+
+#Formats microseconds for tables
+def format_us(value):
+    if value >= 1000:
+        return f"{value / 1000:.1f}ms"
+    return f"{value:.0f}us"
+
+
+#Fixed memory latency histogram (microseconds)
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    #Constructor
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * HISTOGRAM_BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    #Adds a value
+    def record(self, value):
+        value = max(0, int(value))
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value < SUB_BUCKETS:
+            self.counts[value] += 1
+            return
+        shift = min(value.bit_length() - SUB_BUCKETS.bit_length(), MAX_SHIFT)
+        sub = min(value >> shift, 2 * SUB_BUCKETS - 1) - SUB_BUCKETS
+        self.counts[SUB_BUCKETS + shift * SUB_BUCKETS + sub] += 1
+
+    #Lowest value that falls in a bucket
+    def bucket_value(self, index):
+        if index < SUB_BUCKETS:
+            return index
+        shift, sub = divmod(index - SUB_BUCKETS, SUB_BUCKETS)
+        return (SUB_BUCKETS + sub) << shift
+
+    #Value below which p percent of the values fall
+    def percentile(self, p):
+        if self.count == 0:
+            return 0
+        wanted = self.count * p / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+    #Mean value
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+#Histograms of one callback
+class CallbackStats:
+    __slots__ = ("run", "queue")
+
+    #Constructor
+    def __init__(self):
+        self.run = LatencyHistogram()
+        self.queue = LatencyHistogram()
+
+
+#Wraps Tk callbacks and scheduler events and keeps their histograms
+class Profiler:
+    #Constructor
+    def __init__(self):
+        self.enabled = True  #Recording can be paused without unwrapping anything
+        self.stats = {}  #Callback name -> CallbackStats
+        self.root = None
+        self.original = {}  #Patched tkinter methods -> originals
+        self.registering_after = False  #after() registers its own wrapper, which must not be wrapped twice
+        self.overlay = None
+        self.capture = None  #Running cProfile.Profile
+
+    #Histograms of a callback
+    def stats_for(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CallbackStats()
+        return stats
+
+    #Runs a callback and records its run time (and how late it ran, in seconds)
+    def record_call(self, name, func, args=(), queue_delay=None):
+        if not self.enabled:
+            return func(*args)
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats = self.stats_for(name)
+            stats.run.record((time.perf_counter() - start) * 1e6)
+            if queue_delay is not None:
+                stats.queue.record(queue_delay * 1e6)
+
+    #Wraps a command or binding callback
+    def wrap(self, func):
+        name = callback_name(func)
+        def profiled(*args):
+            return self.record_call(name, func, args)
+        return profiled
+
+    #Wraps an after callback, recording how late it runs
+    def wrap_after(self, func, delay_ms):
+        name = callback_name(func)
+        due = time.perf_counter() + delay_ms / 1000
+        def profiled(*args):
+            return self.record_call(name, func, args, max(0.0, time.perf_counter() - due))
+        return profiled
+
+    #Starts wrapping every callback registered with Tk from now on (call before building the game)
+    def install(self, root):
+        self.root = root
+        profiler = self
+        original_register = tk.Misc._register
+        original_after = tk.Misc.after
+        original_after_idle = tk.Misc.after_idle
+        self.original = {"_register": original_register, "after": original_after, "after_idle": original_after_idle}
+
+        def _register(widget, func, subst=None, needcleanup=1):
+            if not profiler.registering_after:
+                func = profiler.wrap(func)
+            return original_register(widget, func, subst, needcleanup)
+
+        def after(widget, ms, func=None, *args):
+            if func is None:
+                return original_after(widget, ms)
+            profiler.registering_after = True
+            try:
+                return original_after(widget, ms, profiler.wrap_after(func, ms), *args)
+            finally:
+                profiler.registering_after = False
+
+        #Tk's after_idle calls after('idle', ...), so it goes to the original after directly (not through the patched one)
+        def after_idle(widget, func, *args):
+            profiler.registering_after = True
+            try:
+                return original_after(widget, "idle", profiler.wrap_after(func, 0), *args)
+            finally:
+                profiler.registering_after = False
+
+        tk.Misc._register = _register
+        tk.Misc.after = after
+        tk.Misc.after_idle = after_idle
+
+        root.bind_all("<F8>", lambda event: self.toggle_overlay())
+        root.bind_all("<F9>", lambda event: self.toggle_capture())
+        root.bind_all("<F10>", lambda event: self.save())
+        atexit.register(self.save)
+
+    #Puts the original tkinter methods back (callbacks registered meanwhile stay wrapped, but stop recording)
+    def uninstall(self):
+        for name, method in self.original.items():
+            setattr(tk.Misc, name, method)
+        self.original = {}
+        self.enabled = False
+
+    #Writes the callback table, slowest total time first
+    def dump(self, file=sys.stdout):
+        rows = sorted(self.stats.items(), key=lambda item: item[1].run.total, reverse=True)
+        print(f"{'callback':<60} {'calls':>7} {'total':>9} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'late p99':>9}", file=file)
+        for name, stats in rows:
+            run = stats.run
+            late = format_us(stats.queue.percentile(99)) if stats.queue.count else "-"
+            print(f"{name[:60]:<60} {run.count:>7} {format_us(run.total):>9} {format_us(run.percentile(50)):>8} "
+                  f"{format_us(run.percentile(90)):>8} {format_us(run.percentile(99)):>8} {format_us(run.max):>8} {late:>9}", file=file)
+
+    #Writes the callback table to the data folder, returns its path
+    def save(self):
+        if not self.stats:
+            return None
+        path = data_path("profiles", time.strftime("callbacks-%Y%m%d-%H%M%S.txt"))
+        with open(path, "w") as file:
+            self.dump(file)
+        print(f"Callback profile written to {path}")
+        return path
+
+    #Shows or hides the live overlay
+    def toggle_overlay(self):
+        if self.overlay is not None:
+            self.overlay.destroy()
+            self.overlay = None
+            return
+        self.overlay = tk.Toplevel(self.root)
+        self.overlay.title("Callback profile")
+        self.overlay.attributes("-topmost", True)
+        self.overlay.protocol("WM_DELETE_WINDOW", self.toggle_overlay)
+        self.overlay_label = tk.Label(self.overlay, font=("Courier", 9), justify="left", anchor="nw", bg="white")
+        self.overlay_label.pack(fill="both", expand=True)
+        self.refresh_overlay()
+
+    #Redraws the overlay (its own after calls bypass the wrapper so it doesn't show up in the table)
+    def refresh_overlay(self):
+        if self.overlay is None:
+            return
+        buffer = io.StringIO()
+        self.dump(buffer)
+        lines = buffer.getvalue().splitlines()[:OVERLAY_ROWS + 1]
+        if self.capture is not None:
+            lines.append("cProfile capture running (F9 to stop)")
+        self.overlay_label.config(text="\n".join(lines))
+        self.registering_after = True
+        try:
+            self.original.get("after", tk.Misc.after)(self.root, OVERLAY_MS, self.refresh_overlay)
+        finally:
+            self.registering_after = False
+
+    #Starts or stops a cProfile capture
+    def toggle_capture(self):
+        if self.capture is None:
+            self.capture = cProfile.Profile()
+            self.capture.enable()
+            print("cProfile capture started (F9 to stop)")
+            return
+        self.capture.disable()
+        path = data_path("profiles", time.strftime("cprofile-%Y%m%d-%H%M%S.pstats"))
+        self.capture.dump_stats(path)
+        stats = pstats.Stats(self.capture)
+        stats.sort_stats("cumulative").print_stats(CPROFILE_ROWS)
+        print(f"cProfile capture written to {path}")
+        self.capture = None
+
+
+#Installs a profiler on a windowless Tcl interpreter and checks that after and after_idle callbacks run and are recorded
+def check():
+    root = tk.Tcl()
+    root.bind_all = lambda *args: None  #No window, so no key bindings
+    profiler = Profiler()
+    profiler.install(root)
+    ran = []
+    def idle_callback():
+        ran.append("after_idle")
+    def after_callback():
+        ran.append("after")
+    try:
+        root.after_idle(idle_callback)
+        root.after(1, after_callback)
+        deadline = time.perf_counter() + 1
+        while len(ran) < 2 and time.perf_counter() < deadline:
+            root.tk.dooneevent(0x2)  #Tcl DONT_WAIT
+    finally:
+        profiler.uninstall()
+    recorded = sorted(name.rsplit(".", 1)[-1] for name in profiler.stats if name.endswith("_callback"))
+    profiler.stats.clear()  #Nothing to write at exit
+    if sorted(ran) != ["after", "after_idle"] or recorded != ["after_callback", "idle_callback"]:
+        print(f"Profiler check failed: ran {ran}, recorded {recorded}")
+        return 1
+    print("Profiler check passed: after and after_idle callbacks ran and were recorded")
+    return 0
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["check"]:
+        print("Usage: python profiling.py check")
+        sys.exit(2)
+    sys.exit(check())
@@ -0,0 +1,361 @@
+'''
+Replay logs for Match Madness
+
+Description:
+Every local game is dealt from a seed, so the seed and the settings are enough to rebuild the board exactly.
+A replay log is that header followed by one small record per flip, appended as the game is played.
+Records are collected in memory and written in batches by a background thread, so a flip only costs a struct pack.
+
+A log can be verified headlessly (the rules are re-run with engine.GameEngine as fast as possible, every flip must be
+legal and made by the player the log says) or played back in the game window at any speed.
+Online games are dealt by the server and are not recorded.
+Only the newest MAX_REPLAYS logs are kept: starting a new log deletes the oldest ones.
+
+Layout (all integers little endian):
+    header:  magic "MMRP", version (u8), seed (u64), start time (f64, unix seconds), rows (u16), cols (u16),
+             players (u8), computer seat (u8, 0 = none), then theme, difficulty and player mode
+             (each a u8 length and utf-8 text)
+    records: time since the previous record (u16, milliseconds, capped), card index (u16), player (u8)
+             Card index TIME_UP marks the solo timer running out.
+
+Usage:
+    python replay.py verify <log> [<log> ...]      Re-runs the rules and prints the result of each log
+    python replay.py play <log> [--speed N]        Plays a log back in the game window (N times faster)
+    python replay.py list                          Lists the recorded logs
+'''
+
+import argparse
+import atexit
+import os
+import queue
+import random
+import struct
+import sys
+import threading
+import time
+from app_paths import data_path
+from engine import GameEngine, SOLO_TIME_LIMIT, FLIP_IGNORED
+
+
+#Constant variables
+
+REPLAY_MAGIC = b"MMRP"
+REPLAY_VERSION = 1
+REPLAY_EXTENSION = ".mmr"
+
+#Header before the three names: magic, version, seed, start time, rows, cols, players, computer seat
+HEADER_FORMAT = struct.Struct("<4sBQdHHBB")
+NAME_LENGTH_FORMAT = struct.Struct("<B")
+
+#One flip: milliseconds since the previous record, card index, player
+RECORD_FORMAT = struct.Struct("<HHB")
+
+#Card index of the record written when the solo timer runs out
+TIME_UP = 0xFFFF
+
+#Longest gap a record can hold (longer pauses are replayed shorter)
+MAX_DELTA_MS = 0xFFFE
+
+#Buffered bytes that trigger a write (a Hard game is a few hundred bytes, so most games are written once at the end;
+#games that are saved for resuming are also flushed before each snapshot)
+FLUSH_BYTES = 4096
+
+#Logs kept in the replay folder (the oldest are deleted when a new one is started)
+MAX_REPLAYS = 200
+
+
+#Helper functions
+
+#Returns a new random seed for a deal
+def new_seed():
+    return random.getrandbits(64)
+
+#Deals the board for a seed (the game and the replayer must deal the same way)
+def seeded_engine(rows, cols, players, seed):
+    return GameEngine(rows, cols, players=players, rng=random.Random(seed))
+
+#Folder of recorded logs
+def replay_folder():
+    return os.path.dirname(data_path("replays", "x"))
+
+#Deletes the oldest logs so that at most keep are left, never one that is still being recorded
+def prune_replays(keep=MAX_REPLAYS):
+    folder = replay_folder()
+    recording = {os.path.abspath(recorder.path) for recorder in open_recorders}
+    logs = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(REPLAY_EXTENSION) and os.path.abspath(entry.path) not in recording:
+                    logs.append((entry.stat().st_mtime, entry.path))
+    except OSError:
+        return
+    logs.sort()
+    for mtime, path in logs[:max(0, len(logs) + len(recording) - keep)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  #A log that can't be deleted is tried again next time
+
+#Packs a name as a u8 length and utf-8 text
+def pack_name(name):
+    data = (name or "").encode("utf-8")[:255]
+    return NAME_LENGTH_FORMAT.pack(len(data)) + data
+
+
+#Writes log batches on one background thread (appends in order, so a log is only ever appended to)
+class ReplayWriter:
+    #Constructor
+    def __init__(self):
+        self.batches = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    #Queues bytes to append to a file
+    def append(self, path, data):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.batches.put((path, data))
+
+    #Runs on the writer thread
+    def run(self):
+        while True:
+            path, data = self.batches.get()
+            try:
+                with open(path, "ab") as file:
+                    file.write(data)
+            except OSError:
+                pass  #A lost replay must never break the game
+            finally:
+                self.batches.task_done()
+
+    #Waits until every queued batch is on disk
+    def wait(self):
+        if self.thread is not None:
+            self.batches.join()
+
+
+#Shared writer, and the recorders that still hold unwritten records (flushed when the program exits)
+REPLAY_WRITER = ReplayWriter()
+open_recorders = set()
+
+
+#Records one game
+class ReplayRecorder:
+    #Constructor, the header is written with the first batch (resume appends to an existing log of the same game instead)
+    def __init__(self, seed, settings, rows, cols, players, path=None, writer=REPLAY_WRITER, resume=False):
+        theme, difficulty, player_mode, computer_seat = settings
+        started = time.time()
+        if path is None:
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+            path = data_path("replays", f"{stamp}-{seed:016x}{REPLAY_EXTENSION}")
+            prune_replays(MAX_REPLAYS - 1)  #Room for this one
+        self.path = path
+        self.writer = writer
+        self.buffer = bytearray(HEADER_FORMAT.pack(REPLAY_MAGIC, REPLAY_VERSION, seed, started, rows, cols,
+                                                   players, computer_seat or 0))
+        self.buffer += pack_name(theme) + pack_name(difficulty) + pack_name(player_mode)
+        if resume and os.path.exists(path):
+            self.buffer.clear()
+        self.last_time = time.monotonic()
+        self.closed = False
+        open_recorders.add(self)
+
+    #Adds a record
+    def record(self, card, player):
+        now = time.monotonic()
+        delta = min(int((now - self.last_time) * 1000), MAX_DELTA_MS)
+        self.last_time = now
+        self.buffer += RECORD_FORMAT.pack(delta, card, player)
+        if len(self.buffer) >= FLUSH_BYTES:
+            self.flush()
+
+    #Records a flip
+    def flip(self, card, player):
+        self.record(card, player)
+
+    #Records the solo timer running out
+    def time_up(self, player=1):
+        self.record(TIME_UP, player)
+
+    #Hands the buffered records to the writer thread
+    def flush(self):
+        if self.buffer:
+            self.writer.append(self.path, bytes(self.buffer))
+            self.buffer.clear()
+
+    #Writes what is left, no more records after this
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.flush()
+            open_recorders.discard(self)
+
+
+#Writes every unfinished log before the program exits
+def flush_open_recorders():
+    for recorder in list(open_recorders):
+        recorder.close()
+    REPLAY_WRITER.wait()
+
+atexit.register(flush_open_recorders)
+
+
+#A log read back from disk
+class Replay:
+    #Constructor, reads the whole log (raises ValueError if it isn't one)
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            data = file.read()
+        if len(data) < HEADER_FORMAT.size:
+            raise ValueError(f"{path} is not a replay log")
+        magic, version, self.seed, self.started, self.rows, self.cols, self.players, computer_seat = HEADER_FORMAT.unpack_from(data)
+        if magic != REPLAY_MAGIC:
+            raise ValueError(f"{path} is not a replay log")
+        if version != REPLAY_VERSION:
+            raise ValueError(f"{path} has unsupported replay version {version}")
+        self.computer_seat = computer_seat or None
+
+        offset = HEADER_FORMAT.size
+        names = []
+        for i in range(3):
+            if offset >= len(data):
+                raise ValueError(f"{path} has a corrupt header")
+            (length,) = NAME_LENGTH_FORMAT.unpack_from(data, offset)
+            offset += 1
+            names.append(data[offset:offset + length].decode("utf-8", "replace"))
+            offset += length
+        self.theme, self.difficulty, self.player_mode = names
+
+        #A partly written last record (program killed mid-write) is ignored
+        end = offset + (len(data) - offset) // RECORD_FORMAT.size * RECORD_FORMAT.size
+        self.records = list(RECORD_FORMAT.iter_unpack(data[offset:end]))
+
+    #Settings tuple in the form MatchMadness.current_settings uses
+    def settings(self):
+        return (self.theme, self.difficulty, self.player_mode, self.computer_seat)
+
+    #Length of the recorded game (seconds)
+    def duration(self):
+        return sum(record[0] for record in self.records) / 1000
+
+
+#Re-runs the rules over a log, returns the finished engine (raises ValueError at the first illegal record)
+def verify(replay):
+    engine = seeded_engine(replay.rows, replay.cols, replay.players, replay.seed)
+    flip = engine.flip
+    for number, (delta, card, player) in enumerate(replay.records):
+        #Like the game: a new flip (or the timer) settles the two cards still showing
+        if engine.second >= 0:
+            engine.resolve()
+        if card == TIME_UP:
+            engine.end()
+            break
+        if player != engine.current_player:
+            raise ValueError(f"record {number}: player {player} flipped on player {engine.current_player}'s turn")
+        if card >= engine.num_cards or flip(card) == FLIP_IGNORED:
+            raise ValueError(f"record {number}: card {card} can't be flipped")
+    if engine.second >= 0:
+        engine.resolve()
+    return engine
+
+
+#Plays a log back in a MatchMadness window
+class ReplayPlayer:
+    #Constructor
+    def __init__(self, game, replay, speed=1.0):
+        self.game = game
+        self.replay = replay
+        self.speed = speed
+        self.seed = replay.seed
+        self.position = 0
+        self.elapsed = 0.0  #Recorded seconds played so far
+
+    #Starts the recorded game and the first flip
+    def start(self):
+        game = self.game
+        game.selected_theme, game.selected_difficulty, game.selected_player, game.computer_seat = self.replay.settings()
+        game.cancel_next_deal()
+        game.replay = self
+        game.start_game()
+        self.schedule_next()
+
+    #Waits for the next record (scaled by the playback speed)
+    def schedule_next(self):
+        if self.position >= len(self.replay.records) or self.game.replay is not self:
+            return
+        delta = self.replay.records[self.position][0] / 1000
+        self.game.scheduler.call_later(delta / self.speed, self.step, "replay", group=self.game)
+
+    #Applies one record
+    def step(self):
+        game = self.game
+        if game.replay is not self or game.engine.over:
+            return
+        delta, card, player = self.replay.records[self.position]
+        self.position += 1
+        self.elapsed += delta / 1000
+        if game.selected_player == "Solo":
+            game.countdown(max(0, SOLO_TIME_LIMIT - int(self.elapsed)))
+        if card == TIME_UP:
+            game.time_up()
+            return
+        row, col = divmod(card, game.cols)
+        game.flip_card(card, row, col, from_replay=True)
+        self.schedule_next()
+
+
+#Command line interface
+def main(args):
+    parser = argparse.ArgumentParser(description="Match Madness replay logs")
+    parser.add_argument("mode", choices=("verify", "play", "list"))
+    parser.add_argument("logs", nargs="*")
+    parser.add_argument("--speed", type=float, default=1.0)
+    options = parser.parse_args(args)
+
+    if options.mode == "list":
+        folder = replay_folder()
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(REPLAY_EXTENSION):
+                replay = Replay(os.path.join(folder, name))
+                print(f"{name}  {replay.theme} {replay.difficulty} {replay.player_mode}  "
+                      f"{len(replay.records)} records, {replay.duration():.1f}s")
+        return 0
+
+    if not options.logs:
+        parser.error("no replay log given")
+
+    if options.mode == "verify":
+        failed = 0
+        records = 0
+        start = time.perf_counter()
+        for path in options.logs:
+            try:
+                replay = Replay(path)
+                engine = verify(replay)
+            except (OSError, ValueError) as error:
+                print(f"{path}: FAILED {error}")
+                failed += 1
+                continue
+            records += len(replay.records)
+            state = "finished" if engine.pairs_left == 0 else "unfinished"
+            print(f"{path}: ok, {engine.moves} moves, {state}, scores {engine.scores[1:]}")
+        elapsed = time.perf_counter() - start
+        print(f"{len(options.logs)} logs, {records} records in {elapsed:.3f}s ({records / max(elapsed, 1e-9):,.0f} records/s)")
+        return 1 if failed else 0
+
+    #Play back in the game window
+    import tkinter as tk
+    from MatchMadness import MatchMadness
+    replay = Replay(options.logs[0])
+    root = tk.Tk()
+    game = MatchMadness(root)
+    ReplayPlayer(game, replay, options.speed).start()
+    root.mainloop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
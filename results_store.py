@@ -0,0 +1,352 @@
+'''
+Results store for Match Madness
+
+Description:
+Keeps every finished game in a local SQLite database (results.sqlite3 in the data folder) for leaderboards and statistics.
+The game never waits for the database: results are queued and written by one background thread, in batches of one
+transaction each, with the database in WAL mode so queries from other threads are never blocked by a write.
+
+Besides the games table, small summary tables are updated in the same transaction as each batch:
+    solo_times      completed solo games per (theme, difficulty, whole second), so a rank is a sum over at most
+                    SOLO_TIME_LIMIT rows however many games are stored
+    personal_bests  best solo time and games played per (player, theme, difficulty)
+    head_to_head    games, wins and ties per pair of players
+so the end screen queries stay in the low milliseconds at millions of games. Rolling averages read the last games
+of a player through an index.
+
+Usage:
+    python results_store.py top <theme> <difficulty>        Best solo times
+    python results_store.py bench [--games N]               Fills a scratch database and times the queries
+'''
+
+import argparse
+import getpass
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from app_paths import data_path
+
+
+#Constant variables
+
+#Most results written in one transaction
+BATCH_SIZE = 500
+
+#Games in a rolling average
+ROLLING_WINDOW = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    finished REAL NOT NULL,
+    theme TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    player1 TEXT NOT NULL,
+    player2 TEXT,
+    score1 INTEGER NOT NULL,
+    score2 INTEGER,
+    winner INTEGER,
+    completed INTEGER NOT NULL,
+    seconds REAL,
+    moves INTEGER NOT NULL,
+    seed TEXT
+);
+CREATE INDEX IF NOT EXISTS games_recent ON games (player1, theme, difficulty, mode, finished);
+CREATE INDEX IF NOT EXISTS games_solo_time ON games (theme, difficulty, seconds) WHERE mode = 'Solo' AND completed = 1;
+
+CREATE TABLE IF NOT EXISTS solo_times (
+    theme TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    second INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (theme, difficulty, second)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS personal_bests (
+    player TEXT NOT NULL,
+    theme TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    seconds REAL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (player, theme, difficulty)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS head_to_head (
+    player_a TEXT NOT NULL,
+    player_b TEXT NOT NULL,
+    games INTEGER NOT NULL,
+    wins_a INTEGER NOT NULL,
+    wins_b INTEGER NOT NULL,
+    ties INTEGER NOT NULL,
+    PRIMARY KEY (player_a, player_b)
+) WITHOUT ROWID;
+"""
+
+INSERT_GAME = """INSERT INTO games (finished, theme, difficulty, mode, player1, player2, score1, score2, winner, completed, seconds, moves, seed)
+VALUES (:finished, :theme, :difficulty, :mode, :player1, :player2, :score1, :score2, :winner, :completed, :seconds, :moves, :seed)"""
+
+ADD_SOLO_TIME = """INSERT INTO solo_times (theme, difficulty, second, games) VALUES (?, ?, ?, 1)
+ON CONFLICT (theme, difficulty, second) DO UPDATE SET games = games + 1"""
+
+ADD_PERSONAL_GAME = """INSERT INTO personal_bests (player, theme, difficulty, seconds, games) VALUES (?, ?, ?, ?, 1)
+ON CONFLICT (player, theme, difficulty) DO UPDATE SET games = games + 1,
+    seconds = CASE WHEN seconds IS NULL OR excluded.seconds < seconds THEN coalesce(excluded.seconds, seconds) ELSE seconds END"""
+
+ADD_HEAD_TO_HEAD = """INSERT INTO head_to_head (player_a, player_b, games, wins_a, wins_b, ties) VALUES (?, ?, 1, ?, ?, ?)
+ON CONFLICT (player_a, player_b) DO UPDATE SET games = games + 1, wins_a = wins_a + excluded.wins_a,
+    wins_b = wins_b + excluded.wins_b, ties = ties + excluded.ties"""
+
+
+#Helper functions
+
+#Name of the person at this computer (solo results are kept per player)
+def local_player():
+    try:
+        return getpass.getuser()
+    except (KeyError, OSError, ImportError):
+        return "Player"
+
+#Opens a connection with the settings every connection uses
+def connect(path):
+    connection = sqlite3.connect(path, timeout=5)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")  #Safe with WAL, a crash can only lose the last batch
+    return connection
+
+#Returns a game result row (a dict, as the writer and the queries expect)
+def game_result(theme, difficulty, mode, players, scores, completed, seconds, moves, seed=None):
+    two_players = len(players) > 1
+    if two_players:
+        winner = 0 if scores[0] == scores[1] else (1 if scores[0] > scores[1] else 2)
+    else:
+        winner = None
+    return {
+        "finished": time.time(), "theme": theme, "difficulty": difficulty, "mode": mode,
+        "player1": players[0], "player2": players[1] if two_players else None,
+        "score1": scores[0], "score2": scores[1] if two_players else None, "winner": winner,
+        "completed": 1 if completed else 0, "seconds": seconds, "moves": moves,
+        "seed": None if seed is None else f"{seed:016x}",
+    }
+
+
+#Persistent results with a background writer
+class ResultsStore:
+    #Constructor, the database is created by the writer thread on first use
+    def __init__(self, path=None):
+        self.path = path or data_path("results.sqlite3")
+        self.pending = queue.Queue()  #(result, reply callback) for the writer
+        self.replies = queue.Queue()  #(reply callback, statistics) for the caller's thread
+        self.waiting = 0  #Results whose reply hasn't been drained yet
+        self.local = threading.local()  #Query connection per thread
+        self.ready = threading.Event()  #Schema exists
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    #Queues a finished game, reply(statistics) is called from drain() once it is saved
+    def add(self, result, reply=None):
+        if reply is not None:
+            self.waiting += 1
+        self.pending.put((result, reply))
+
+    #Runs the replies of saved games (call from the thread that added them), returns True while some are still due
+    def drain(self):
+        while True:
+            try:
+                reply, statistics = self.replies.get_nowait()
+            except queue.Empty:
+                return self.waiting > 0
+            self.waiting -= 1
+            reply(statistics)
+
+    #Writes queued results until close() (writer thread)
+    def write_loop(self):
+        connection = connect(self.path)
+        connection.executescript(SCHEMA)
+        self.ready.set()
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is None for item in batch)
+            batch = [item for item in batch if item is not None]
+            try:
+                with connection:
+                    self.write_batch(connection, [result for result, reply in batch])
+                for result, reply in batch:
+                    if reply is not None:
+                        self.replies.put((reply, self.statistics(connection, result)))
+            except sqlite3.Error:
+                for result, reply in batch:
+                    if reply is not None:
+                        self.replies.put((reply, {}))  #Statistics unavailable, the game goes on
+            finally:
+                for item in batch:
+                    self.pending.task_done()
+            if stop:
+                self.pending.task_done()
+                connection.close()
+                return
+
+    #Inserts a batch and updates the summary tables (inside the caller's transaction)
+    def write_batch(self, connection, results):
+        connection.executemany(INSERT_GAME, results)
+        solo = [result for result in results if result["mode"] == "Solo"]
+        connection.executemany(ADD_SOLO_TIME, [(result["theme"], result["difficulty"], int(result["seconds"]))
+                                               for result in solo if result["completed"]])
+        connection.executemany(ADD_PERSONAL_GAME, [(result["player1"], result["theme"], result["difficulty"],
+                                                    result["seconds"] if result["completed"] else None)
+                                                   for result in solo])
+        rows = []
+        for result in results:
+            if result["player2"] is None:
+                continue
+            #Each pair of players is stored once, in name order
+            a, b = sorted((result["player1"], result["player2"]))
+            winner = result["winner"]
+            winner_name = None if not winner else result[f"player{winner}"]
+            rows.append((a, b, 1 if winner_name == a else 0, 1 if winner_name == b else 0, 1 if winner == 0 else 0))
+        connection.executemany(ADD_HEAD_TO_HEAD, rows)
+
+    #Statistics shown on the end screen for a saved game
+    def statistics(self, connection, result):
+        if result["mode"] == "Solo":
+            statistics = {"personal_best": self.personal_best(result["player1"], result["theme"], result["difficulty"], connection)}
+            if result["completed"]:
+                statistics["rank"], statistics["ranked"] = self.solo_rank(result["theme"], result["difficulty"], result["seconds"], connection)
+            return statistics
+        return {"head_to_head": self.head_to_head(result["player1"], result["player2"], connection)}
+
+    #Query connection of the calling thread
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            self.ready.wait()
+            connection = connect(self.path)
+            self.local.connection = connection
+        return connection
+
+    #Rank of a solo time among completed games (ties share a rank) and the number of ranked games, as (rank, games)
+    def solo_rank(self, theme, difficulty, seconds, connection=None):
+        connection = connection or self.connection()
+        faster, total = connection.execute(
+            "SELECT coalesce(sum(CASE WHEN second < ? THEN games END), 0), coalesce(sum(games), 0) "
+            "FROM solo_times WHERE theme = ? AND difficulty = ?", (int(seconds), theme, difficulty)).fetchone()
+        return faster + 1, total
+
+    #Best solo time of a player (None if they never completed a board)
+    def personal_best(self, player, theme, difficulty, connection=None):
+        connection = connection or self.connection()
+        row = connection.execute("SELECT seconds FROM personal_bests WHERE player = ? AND theme = ? AND difficulty = ?",
+                                 (player, theme, difficulty)).fetchone()
+        return row[0] if row else None
+
+    #Fastest completed solo games, as (seconds, player, finished) rows
+    def best_solo_times(self, theme, difficulty, limit=10, connection=None):
+        connection = connection or self.connection()
+        return connection.execute(
+            "SELECT seconds, player1, finished FROM games INDEXED BY games_solo_time "
+            "WHERE mode = 'Solo' AND completed = 1 AND theme = ? AND difficulty = ? ORDER BY seconds LIMIT ?",
+            (theme, difficulty, limit)).fetchall()
+
+    #Record of one player against another, as {"games", "wins", "losses", "ties"} from the first player's side
+    def head_to_head(self, player, opponent, connection=None):
+        connection = connection or self.connection()
+        a, b = sorted((player, opponent))
+        row = connection.execute("SELECT games, wins_a, wins_b, ties FROM head_to_head WHERE player_a = ? AND player_b = ?",
+                                 (a, b)).fetchone()
+        games, wins_a, wins_b, ties = row or (0, 0, 0, 0)
+        if player == a:
+            return {"games": games, "wins": wins_a, "losses": wins_b, "ties": ties}
+        return {"games": games, "wins": wins_b, "losses": wins_a, "ties": ties}
+
+    #Averages of a player's last games in first seat, as (games, average moves, average seconds of completed games)
+    def rolling_average(self, player, theme, difficulty, mode="Solo", window=ROLLING_WINDOW, connection=None):
+        connection = connection or self.connection()
+        return connection.execute(
+            "SELECT count(*), avg(moves), avg(CASE WHEN completed THEN seconds END) FROM ("
+            "SELECT moves, completed, seconds FROM games WHERE player1 = ? AND theme = ? AND difficulty = ? AND mode = ? "
+            "ORDER BY finished DESC LIMIT ?)", (player, theme, difficulty, mode, window)).fetchone()
+
+    #Waits until every queued result is written
+    def flush(self):
+        self.pending.join()
+
+    #Writes what is queued and stops the writer
+    def close(self):
+        self.pending.put(None)
+        self.writer.join()
+
+
+#Fills a scratch database with `games` random results and times the end screen queries
+def bench(games):
+    folder = tempfile.mkdtemp()
+    store = ResultsStore(os.path.join(folder, "bench.sqlite3"))
+    rng = random.Random(1)
+    themes = ("Food", "Nature", "Flags", "Animals")
+    difficulties = ("Easy", "Medium", "Hard")
+    players = [f"player{i}" for i in range(1000)]
+    start = time.perf_counter()
+    for i in range(games):
+        theme, difficulty = rng.choice(themes), rng.choice(difficulties)
+        if rng.random() < 0.5:
+            completed = rng.random() < 0.7
+            result = game_result(theme, difficulty, "Solo", [rng.choice(players)], [rng.randint(0, 15)],
+                                 completed, rng.uniform(20, 180) if completed else None, rng.randint(10, 60))
+        else:
+            score = rng.randint(0, 15)
+            result = game_result(theme, difficulty, "Multiplayer", rng.sample(players[:20], 2), [score, 15 - score],
+                                 True, None, rng.randint(10, 60))
+        store.add(result)
+    store.flush()
+    print(f"wrote {games:,} games in {time.perf_counter() - start:.1f}s")
+
+    queries = {
+        "solo rank": lambda: store.solo_rank("Food", "Hard", rng.uniform(20, 180)),
+        "personal best": lambda: store.personal_best(rng.choice(players), "Food", "Hard"),
+        "top 10": lambda: store.best_solo_times("Food", "Hard"),
+        "head to head": lambda: store.head_to_head("player1", "player2"),
+        "rolling average": lambda: store.rolling_average(rng.choice(players), "Food", "Hard"),
+    }
+    for name, query in queries.items():
+        times = []
+        for i in range(200):
+            start = time.perf_counter()
+            query()
+            times.append(time.perf_counter() - start)
+        times.sort()
+        print(f"{name:<16} p50 {times[100] * 1000:.3f} ms, max {times[-1] * 1000:.3f} ms")
+    store.close()
+
+
+#Command line interface
+def main(args):
+    parser = argparse.ArgumentParser(description="Match Madness results store")
+    parser.add_argument("mode", choices=("top", "bench"))
+    parser.add_argument("theme", nargs="?")
+    parser.add_argument("difficulty", nargs="?")
+    parser.add_argument("--games", type=int, default=1000000)
+    options = parser.parse_args(args)
+
+    if options.mode == "bench":
+        bench(options.games)
+        return 0
+    if not options.theme or not options.difficulty:
+        parser.error("top needs a theme and a difficulty")
+    store = ResultsStore()
+    for place, (seconds, player, finished) in enumerate(store.best_solo_times(options.theme, options.difficulty), 1):
+        mins, secs = divmod(int(seconds), 60)
+        print(f"{place:>3}. {mins:02d}:{secs:02d}  {player}  {time.strftime('%Y-%m-%d', time.localtime(finished))}")
+    store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
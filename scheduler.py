@@ -0,0 +1,197 @@
+'''
+Frame scheduler and countdown timer for Match Madness
+
+Description:
+One scheduler owns every timed event of the game (countdown ticks, mismatch flip-back, end of game) and keeps a single
+pending root.after call for the earliest one.
+Events run at time.monotonic() deadlines instead of being chained with fixed root.after delays, so callback latency
+never adds up and a 3 minute game lasts 3 minutes.
+UI updates can be queued per frame: updates with the same key are coalesced and run once at the next frame.
+The scheduler measures how late each event runs, and events are grouped by owner so several boards or timers can share one.
+When a profiler (profiling.Profiler) is attached, every event and update is timed under its name.
+'''
+
+import heapq
+import itertools
+import math
+import time
+
+
+#Constant variables
+
+#Frame length used to batch UI updates (about 60 frames per second)
+FRAME_SECONDS = 1 / 60
+
+
+#A scheduled callback, returned so it can be cancelled
+class ScheduledEvent:
+    __slots__ = ("deadline", "callback", "name", "group", "cancelled")
+
+    #Constructor
+    def __init__(self, deadline, callback, name, group):
+        self.deadline = deadline
+        self.callback = callback
+        self.name = name
+        self.group = group
+        self.cancelled = False
+
+    #Stops the event from running
+    def cancel(self):
+        self.cancelled = True
+
+
+#Runs every timed event of the game from one Tk after call
+class FrameScheduler:
+    #Constructor
+    def __init__(self, root, clock=time.monotonic):
+        self.root = root
+        self.clock = clock
+        self.events = []  #Heap of (deadline, order, event)
+        self.order = itertools.count()  #Keeps events with the same deadline in scheduling order
+        self.updates = {}  #key -> UI update to run at the next frame
+        self.after_id = None
+        self.wakeup = None  #Deadline the pending after call was made for
+        self.profiler = None  #Optional profiling.Profiler
+
+        #Lateness of events (how long after their deadline they ran)
+        self.events_run = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    #Runs a callback at a monotonic clock deadline
+    def call_at(self, deadline, callback, name="", group=None):
+        event = ScheduledEvent(deadline, callback, name, group)
+        heapq.heappush(self.events, (deadline, next(self.order), event))
+        self.schedule_wakeup(deadline)
+        return event
+
+    #Runs a callback after a delay in seconds
+    def call_later(self, delay, callback, name="", group=None):
+        return self.call_at(self.clock() + delay, callback, name, group)
+
+    #Queues a UI update for the next frame (a newer update with the same key replaces the older one)
+    def update(self, key, callback):
+        self.updates[key] = callback
+        self.schedule_wakeup(self.clock() + FRAME_SECONDS)
+
+    #Cancels every pending event of a group
+    def cancel_group(self, group):
+        for deadline, order, event in self.events:
+            if event.group == group:
+                event.cancelled = True
+
+    #Makes sure the scheduler wakes up by a deadline
+    def schedule_wakeup(self, deadline):
+        if self.wakeup is not None and self.wakeup <= deadline:
+            return  #Already waking up earlier
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        delay_ms = max(0, math.ceil((deadline - self.clock()) * 1000))
+        self.wakeup = deadline
+        self.after_id = self.root.after(delay_ms, self.run)
+
+    #Runs every due event, then the queued UI updates, then waits for the next deadline
+    def run(self):
+        self.after_id = None
+        self.wakeup = None
+
+        now = self.clock()
+        while self.events and self.events[0][0] <= now:
+            deadline, order, event = heapq.heappop(self.events)
+            if event.cancelled:
+                continue
+            lateness = now - deadline
+            self.events_run += 1
+            self.total_lateness += lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+            if self.profiler is not None:
+                self.profiler.record_call(f"event: {event.name or 'unnamed'}", event.callback, queue_delay=lateness)
+            else:
+                event.callback()
+
+        #Batched UI updates, once per frame
+        updates = self.updates
+        self.updates = {}
+        for key, callback in updates.items():
+            if self.profiler is not None:
+                self.profiler.record_call(f"update: {key}", callback)
+            else:
+                callback()
+
+        #Drop cancelled events at the front so they don't cause empty wakeups
+        while self.events and self.events[0][2].cancelled:
+            heapq.heappop(self.events)
+        if self.events:
+            self.schedule_wakeup(self.events[0][0])
+        if self.updates:
+            self.schedule_wakeup(self.clock() + FRAME_SECONDS)
+
+    #Returns the scheduler lateness counters (milliseconds)
+    def stats(self):
+        mean = self.total_lateness / self.events_run if self.events_run else 0.0
+        return {
+            "events_run": self.events_run,
+            "pending": sum(1 for deadline, order, event in self.events if not event.cancelled),
+            "mean_lateness_ms": mean * 1000,
+            "max_lateness_ms": self.max_lateness * 1000,
+        }
+
+
+#Countdown that ticks every second against a fixed deadline
+class CountdownTimer:
+    #Constructor
+    def __init__(self, scheduler, duration, on_tick, on_expire, group=None):
+        self.scheduler = scheduler
+        self.duration = duration
+        self.on_tick = on_tick  #Called with the whole seconds left
+        self.on_expire = on_expire
+        self.group = group
+        self.start_time = None
+        self.stop_time = None
+        self.next_tick = None
+
+    #Starts counting down from the full duration (or with `elapsed` seconds already used, resuming a saved game)
+    def start(self, elapsed=0.0):
+        self.start_time = self.scheduler.clock() - elapsed
+        self.stop_time = None
+        self.schedule_tick(math.floor(elapsed) + 1)
+
+    #Schedules the tick for `seconds` seconds after the start (absolute, so ticks never drift)
+    def schedule_tick(self, seconds):
+        self.next_tick = self.scheduler.call_at(self.start_time + seconds, lambda: self.tick(seconds), "countdown", self.group)
+
+    #Called once per second
+    def tick(self, seconds):
+        left = self.remaining()
+        if left <= 0:
+            self.stop()
+            self.on_tick(0)
+            self.on_expire()
+            return
+        self.on_tick(math.ceil(left))
+        #Catch up if ticks were skipped (e.g. the window was busy)
+        elapsed = self.scheduler.clock() - self.start_time
+        self.schedule_tick(max(seconds + 1, math.floor(elapsed) + 1))
+
+    #Stops the countdown (remaining time is frozen)
+    def stop(self):
+        if self.stop_time is None and self.start_time is not None:
+            self.stop_time = self.scheduler.clock()
+        if self.next_tick is not None:
+            self.next_tick.cancel()
+            self.next_tick = None
+
+    #Checks if the countdown is running
+    def running(self):
+        return self.start_time is not None and self.stop_time is None
+
+    #Seconds since the start (up to the stop time once stopped)
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        end = self.stop_time if self.stop_time is not None else self.scheduler.clock()
+        return min(self.duration, end - self.start_time)
+
+    #Seconds left
+    def remaining(self):
+        return max(0.0, self.duration - self.elapsed())
@@ -0,0 +1,358 @@
+'''
+Match Madness game server
+
+Description:
+An asyncio server hosting many two player rooms in one process, with no thread per room.
+Each room runs the same rules as the game (engine.GameEngine). The server is the only one that knows the deal
+and only reveals a card's pair id when the card is flipped.
+
+Protocol: one line of ASCII per message, fields separated by spaces.
+    client -> server
+        JOIN <room> <rows> <cols>     Join (or create) a room, leaving the previous one
+        FLIP <index>                  Flip a card (only on your turn)
+        LEAVE                         Leave the room
+    server -> client
+        SEAT <player>                 Your player number in the room
+        START <rows> <cols> <players> Both seats are taken, player 1 starts
+        FLIP <player> <index> <pair>  A card was flipped (the server resolves the turn right after the second flip)
+        OVER <score 1> <score 2>      Every pair was found, the room is closed
+        LEFT <player>                 The other player left, the room is closed
+        ERR <message>                 The last message was rejected
+
+Usage:
+    python server.py serve [--host HOST] [--port PORT]
+    python server.py loadgen [--rooms N] [--games G] [--think SECONDS] [--host HOST --port PORT]
+        Starts a local server process if no port is given. --think adds a pause before each bot flip (0 = flip as fast as possible).
+'''
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import sys
+import time
+from engine import GameEngine, FLIP_IGNORED, FLIP_SECOND, MATCH
+
+
+#Constant variables
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+#Players per room
+ROOM_SEATS = 2
+
+#Largest board a room can be created with
+MAX_CARDS = 1024
+
+#Longest line accepted from a client (bytes)
+MAX_LINE = 128
+
+#Unsent bytes a connection may have queued before it is dropped (a client that stopped reading)
+MAX_WRITE_BUFFER = 64 * 1024
+
+
+#Helper functions
+
+#Encodes a message as one protocol line
+def encode(*fields):
+    return (" ".join(str(field) for field in fields) + "\n").encode("ascii")
+
+#Splits a protocol line into its command and arguments
+def decode(line):
+    fields = line.decode("ascii", "replace").split()
+    if not fields:
+        return "", []
+    return fields[0].upper(), fields[1:]
+
+
+#One game between two connections
+class Room:
+    __slots__ = ("name", "engine", "players")
+
+    #Constructor
+    def __init__(self, name, rows, cols):
+        self.name = name
+        self.engine = GameEngine(rows, cols, players=ROOM_SEATS)
+        self.players = []  #Connections, seat = position + 1
+
+    #Sends a message to everyone in the room
+    def broadcast(self, message):
+        for player in self.players:
+            player.send(message)
+
+
+#One client connection
+class Connection:
+    __slots__ = ("server", "writer", "room", "seat")
+
+    #Constructor
+    def __init__(self, server, writer):
+        self.server = server
+        self.writer = writer
+        self.room = None
+        self.seat = 0
+
+    #Queues a message (never waits, so a slow client can't stall the room)
+    #A client whose unsent messages pass MAX_WRITE_BUFFER stopped reading: it is cut off, which also ends its room
+    def send(self, message):
+        if self.writer.is_closing():
+            return
+        transport = self.writer.transport
+        if transport.get_write_buffer_size() + len(message) > MAX_WRITE_BUFFER:
+            self.server.overflows += 1
+            transport.abort()  #Drops the queued bytes now (close would keep them until they are sent)
+            return
+        self.writer.write(message)
+
+
+#Hosts every room
+class GameServer:
+    #Constructor
+    def __init__(self):
+        self.rooms = {}  #name -> Room
+        self.connections = 0
+        self.moves = 0
+        self.overflows = 0  #Connections dropped for not reading
+
+    #Handles one client until it disconnects
+    async def handle(self, reader, writer):
+        connection = Connection(self, writer)
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.LimitOverrunError:
+                    connection.send(encode("ERR", "line-too-long"))
+                    break
+                except asyncio.IncompleteReadError:
+                    break  #Client disconnected
+                command, args = decode(line)
+                self.dispatch(connection, command, args)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.leave(connection)
+            self.connections -= 1
+            writer.close()
+
+    #Runs one client command
+    def dispatch(self, connection, command, args):
+        if command == "JOIN" and len(args) == 3 and args[1].isdigit() and args[2].isdigit():
+            self.join(connection, args[0], int(args[1]), int(args[2]))
+        elif command == "FLIP" and len(args) == 1 and args[0].isdigit():
+            self.flip(connection, int(args[0]))
+        elif command == "LEAVE":
+            self.leave(connection)
+        else:
+            connection.send(encode("ERR", "bad-command"))
+
+    #Puts a connection in a room, starting the game once both seats are taken
+    def join(self, connection, name, rows, cols):
+        self.leave(connection)
+        if rows * cols > MAX_CARDS or rows * cols < 2 or (rows * cols) % 2:
+            connection.send(encode("ERR", "bad-board"))
+            return
+        room = self.rooms.get(name)
+        if room is None:
+            room = Room(name, rows, cols)
+            self.rooms[name] = room
+        elif len(room.players) >= ROOM_SEATS:
+            connection.send(encode("ERR", "room-full"))
+            return
+        elif (room.engine.rows, room.engine.cols) != (rows, cols):
+            connection.send(encode("ERR", "board-mismatch"))
+            return
+
+        room.players.append(connection)
+        connection.room = room
+        connection.seat = len(room.players)
+        connection.send(encode("SEAT", connection.seat))
+        if len(room.players) == ROOM_SEATS:
+            room.broadcast(encode("START", rows, cols, ROOM_SEATS))
+
+    #Flips a card for a player
+    def flip(self, connection, index):
+        room = connection.room
+        if room is None or len(room.players) < ROOM_SEATS:
+            connection.send(encode("ERR", "not-started"))
+            return
+        engine = room.engine
+        if connection.seat != engine.current_player:
+            connection.send(encode("ERR", "not-your-turn"))
+            return
+        if index >= engine.num_cards:
+            connection.send(encode("ERR", "bad-card"))
+            return
+        result = engine.flip(index)
+        if result == FLIP_IGNORED:
+            connection.send(encode("ERR", "bad-card"))
+            return
+
+        self.moves += 1
+        room.broadcast(encode("FLIP", connection.seat, index, engine.pair_of(index)))
+
+        #Resolve right away, clients show the cards for their own reveal delay
+        if result == FLIP_SECOND:
+            engine.resolve()
+            if engine.over:
+                room.broadcast(encode("OVER", *engine.scores[1:]))
+                self.close_room(room)
+
+    #Takes a connection out of its room, closing the room for the other player
+    def leave(self, connection):
+        room = connection.room
+        if room is None:
+            return
+        if room.engine.over or len(room.players) < ROOM_SEATS:
+            room.players.remove(connection)
+            connection.room = None
+            if not room.players and self.rooms.get(room.name) is room:
+                del self.rooms[room.name]
+            return
+        room.broadcast(encode("LEFT", connection.seat))
+        self.close_room(room)
+
+    #Removes a room and everyone from it
+    def close_room(self, room):
+        for player in room.players:
+            player.room = None
+        room.players = []
+        if self.rooms.get(room.name) is room:
+            del self.rooms[room.name]
+
+    #Starts listening
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+
+
+#Load generator: bot players that mirror the game and flip random face down cards
+class Bot:
+    #Constructor
+    def __init__(self, host, port, room, rows, cols, games, latencies, think=0.0):
+        self.host = host
+        self.port = port
+        self.room = room
+        self.rows = rows
+        self.cols = cols
+        self.games = games
+        self.latencies = latencies  #Shared list of move round trip times (seconds)
+        self.think = think  #Pause before each flip (seconds)
+        self.rng = random.Random()
+
+    #Plays `games` games in its room
+    async def run(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            for game in range(self.games):
+                writer.write(encode("JOIN", self.room, self.rows, self.cols))
+                await self.play(reader, writer)
+        finally:
+            writer.close()
+
+    #Plays one game until OVER or LEFT
+    async def play(self, reader, writer):
+        seat = 0
+        #Mirror of the room, pair ids are filled in as cards are revealed
+        engine = GameEngine(self.rows, self.cols, players=ROOM_SEATS, pair_ids=[0] * (self.rows * self.cols))
+        unmatched = list(range(engine.num_cards))
+        sent_at = None
+        started = False
+        while True:
+            #Our turn: flip a random face down card
+            if started and sent_at is None and engine.current_player == seat and not engine.over:
+                if self.think:
+                    await asyncio.sleep(self.think)
+                index = self.rng.choice(unmatched)
+                while engine.is_face_up(index):
+                    index = self.rng.choice(unmatched)
+                sent_at = time.perf_counter()
+                writer.write(encode("FLIP", index))
+
+            command, args = decode(await reader.readline())
+            if command == "SEAT":
+                seat = int(args[0])
+            elif command == "START":
+                started = True
+            elif command == "FLIP":
+                player, index, pair = (int(arg) for arg in args)
+                if player == seat and sent_at is not None:
+                    self.latencies.append(time.perf_counter() - sent_at)
+                    sent_at = None
+                engine.pairs[index] = pair
+                if engine.flip(index) == FLIP_SECOND:
+                    result, first, second = engine.resolve()
+                    if result == MATCH:
+                        unmatched.remove(first)
+                        unmatched.remove(second)
+            elif command in ("OVER", "LEFT", ""):
+                return
+            elif command == "ERR":
+                raise RuntimeError(f"server rejected a move: {args}")
+
+#Runs a server in a child process and sends its port back through a pipe
+def serve_in_process(host, connection):
+    async def serve():
+        server = await GameServer().start(host, 0)
+        connection.send(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+    asyncio.run(serve())
+
+#Runs the load generator and prints move latency percentiles
+async def load_test(rooms, games, rows, cols, host=DEFAULT_HOST, port=None, think=0.0):
+    #Local server in its own process so the bots don't slow it down
+    process = None
+    if port is None:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=serve_in_process, args=(host, sender), daemon=True)
+        process.start()
+        port = receiver.recv()
+
+    latencies = []
+    start = time.perf_counter()
+    bots = [Bot(host, port, f"load-{room}", rows, cols, games, latencies, think) for room in range(rooms) for seat in range(ROOM_SEATS)]
+    await asyncio.gather(*(bot.run() for bot in bots))
+    elapsed = time.perf_counter() - start
+
+    if process is not None:
+        process.terminate()
+        process.join()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+    print(f"{rooms} rooms x {games} games ({rows}x{cols}): {len(latencies)} moves in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:,.0f} moves/s)")
+    print(f"  move latency ms: p50 {percentile(50):.2f}, p90 {percentile(90):.2f}, p99 {percentile(99):.2f}, max {latencies[-1] * 1000:.2f}")
+
+
+#Command line interface
+def main(args):
+    parser = argparse.ArgumentParser(description="Match Madness game server")
+    parser.add_argument("mode", choices=("serve", "loadgen"))
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--cols", type=int, default=6)
+    parser.add_argument("--think", type=float, default=0.0)
+    options = parser.parse_args(args)
+
+    if options.mode == "serve":
+        async def serve():
+            game_server = GameServer()
+            server = await game_server.start(options.host, options.port or DEFAULT_PORT)
+            print(f"Serving on {options.host}:{options.port or DEFAULT_PORT}")
+            async with server:
+                await server.serve_forever()
+        asyncio.run(serve())
+    else:
+        asyncio.run(load_test(options.rooms, options.games, options.rows, options.cols, options.host, options.port, options.think))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,335 @@
+'''
+Batch game simulator for Match Madness
+
+Description:
+Plays many games at once as NumPy arrays to collect the statistics used to tune DIFFICULTIES and the solo time limit.
+Every policy has a fast path that keeps a few numbers per game instead of whole boards (see each simulate_*_batch),
+which plays each policy at well over 16,000 games a second on the Hard board.
+simulate_batch is the reference they were checked against: every row of its arrays is one game (a shuffled board of
+pair ids, which cards are matched, and which cards the players remember), and one loop iteration plays one turn
+(two flips) of every unfinished game. --reference runs it instead of the fast paths.
+
+Flip policies:
+    random    flips two random unmatched cards every turn (no memory)
+    perfect   remembers every card ever seen and takes a known pair whenever there is one
+    memory    like perfect, but each seen card is only remembered with probability RECALL and forgotten with probability FORGET per turn
+
+Usage:
+    python simulate.py [--games N] [--policy random|perfect|memory] [--players 1|2] [--difficulty Easy|Medium|Hard|all] [--seed S] [--reference]
+'''
+
+import argparse
+import sys
+import time
+import numpy as np
+from engine import DIFFICULTIES, SOLO_TIME_LIMIT
+
+
+#Constant variables
+
+#Estimated seconds per turn for a human player (two clicks plus the 0.6 second reveal)
+SECONDS_PER_TURN = 2.5
+
+#Limited memory player
+RECALL = 0.7  #Chance a newly seen card is remembered
+FORGET = 0.05  #Chance a remembered card is forgotten each turn
+
+#Games simulated per batch (bounds memory use)
+BATCH_SIZE = 50000
+
+POLICIES = ("random", "perfect", "memory")
+
+
+#Helper functions
+
+#Deals `games` shuffled boards, returns (pair ids, partner index) arrays of shape (games, cards)
+def deal_boards(rng, games, num_cards):
+    #Ranking random keys gives a random permutation of 0..num_cards-1 per row, // 2 turns it into pair ids
+    order = np.argsort(rng.random((games, num_cards)), axis=1)
+    pairs = (order // 2).astype(np.int16)
+
+    #Card positions sorted by pair id: columns 2p and 2p+1 hold the two cards of pair p
+    positions = np.argsort(pairs, axis=1, kind="stable")
+    first, second = positions[:, 0::2], positions[:, 1::2]
+    partner = np.empty_like(positions)
+    rows = np.arange(games)[:, None]
+    partner[rows, first] = second
+    partner[rows, second] = first
+    return pairs, partner
+
+#Picks one random True column per row of a boolean mask (rows with no True pick column 0)
+def random_choice(rng, mask):
+    keys = rng.random(mask.shape)
+    keys[~mask] = -1.0
+    return keys.argmax(axis=1)
+
+
+#Plays a batch of games to the end, returns (turns per game, scores of shape (games, players + 1))
+def simulate_batch(rng, games, rows, cols, policy="perfect", players=1, max_turns=None):
+    num_cards = rows * cols
+    if max_turns is None:
+        max_turns = num_cards * 50  #Random play can take a long time on big boards
+    pairs, partner = deal_boards(rng, games, num_cards)
+
+    matched = np.zeros((games, num_cards), dtype=bool)
+    seen = np.zeros((games, num_cards), dtype=bool)  #Cards the player(s) remember
+    turns = np.zeros(games, dtype=np.int32)
+    scores = np.zeros((games, players + 1), dtype=np.int32)
+    current = np.ones(games, dtype=np.int32)
+    active = np.arange(games)  #Rows of the games still being played
+
+    for turn in range(max_turns):
+        if active.size == 0:
+            break
+        a_matched = matched[active]
+        a_partner = partner[active]
+        a_rows = np.arange(active.size)
+        unmatched = ~a_matched
+
+        if policy == "random":
+            first = random_choice(rng, unmatched)
+            others = unmatched.copy()
+            others[a_rows, first] = False
+            second = random_choice(rng, others)
+        else:
+            a_seen = seen[active]
+            unknown = unmatched & ~a_seen
+
+            #A known pair: a remembered unmatched card whose partner is remembered too
+            known_pair = unmatched & a_seen & a_seen[a_rows[:, None], a_partner]
+            has_known = known_pair.any(axis=1)
+
+            #Otherwise flip an unknown card, then its partner if remembered, else another unknown card
+            first = np.where(has_known, known_pair.argmax(axis=1), random_choice(rng, unknown))
+            first_partner = a_partner[a_rows, first]
+            others = unknown.copy()
+            others[a_rows, first] = False
+            guess = random_choice(rng, others)
+            partner_known = a_seen[a_rows, first_partner] | has_known | ~others.any(axis=1)
+            second = np.where(partner_known, first_partner, guess)
+
+        #Score the turn
+        is_match = a_partner[a_rows, first] == second
+        hit_rows = active[is_match]
+        matched[hit_rows, first[is_match]] = True
+        matched[hit_rows, second[is_match]] = True
+        scores[hit_rows, current[hit_rows]] += 1
+        turns[active] += 1
+
+        #Switch player only on no match
+        miss_rows = active[~is_match]
+        current[miss_rows] = current[miss_rows] % players + 1
+
+        #Update what the players remember
+        if policy == "perfect":
+            seen[active, first] = True
+            seen[active, second] = True
+        elif policy == "memory":
+            forgotten = rng.random((active.size, num_cards)) < FORGET
+            seen[active] &= ~forgotten
+            seen[active, first] |= rng.random(active.size) < RECALL
+            seen[active, second] |= rng.random(active.size) < RECALL
+
+        #Drop finished games
+        active = active[~matched[active].all(axis=1)]
+
+    return turns, scores
+
+
+#Fast path for the perfect memory policy
+#The board is already a random permutation, so flipping unknown cards left to right is the same as flipping random ones.
+#The remembered cards are then always a prefix of the row, and at most one known pair can be waiting at a time,
+#so each turn is a handful of operations on one value per game instead of on whole rows.
+def simulate_perfect_batch(rng, games, rows, cols, players=1):
+    num_cards = rows * cols
+    num_pairs = num_cards // 2
+    pairs, partner = deal_boards(rng, games, num_cards)
+
+    next_card = np.zeros(games, dtype=np.int32)  #Every card before this one has been seen
+    pending = np.full(games, -1, dtype=np.int32)  #Seen card whose partner is also seen (a known pair), or -1
+    pairs_found = np.zeros(games, dtype=np.int32)
+    turns = np.zeros(games, dtype=np.int32)
+    scores = np.zeros((games, players + 1), dtype=np.int32)
+    current = np.ones(games, dtype=np.int32)
+    active = np.arange(games)
+
+    while active.size:
+        a_next = next_card[active]
+        a_pending = pending[active]
+
+        #Take the known pair if there is one
+        has_known = a_pending >= 0
+
+        #Otherwise flip the next unseen card, then its partner if it was seen before, else the next unseen card
+        first = np.where(has_known, a_pending, a_next)
+        first_partner = partner[active, np.minimum(first, num_cards - 1)]
+        partner_seen = has_known | (first_partner < first)
+        second = np.where(partner_seen, first_partner, np.minimum(a_next + 1, num_cards - 1))
+        is_match = partner_seen | (first_partner == second)
+
+        #Second card is new and its partner was seen earlier: known pair for the next turn
+        second_partner = partner[active, second]
+        new_known = ~partner_seen & ~is_match & (second_partner < second)
+
+        next_card[active] = a_next + np.where(has_known, 0, np.where(partner_seen, 1, 2))
+        pending[active] = np.where(new_known, second, -1)
+
+        #Score the turn, switch player only on no match
+        turns[active] += 1
+        hit_rows = active[is_match]
+        pairs_found[hit_rows] += 1
+        scores[hit_rows, current[hit_rows]] += 1
+        miss_rows = active[~is_match]
+        current[miss_rows] = current[miss_rows] % players + 1
+
+        active = active[pairs_found[active] < num_pairs]
+
+    return turns, scores
+
+
+#Fast path for the random policy
+#Two random unmatched cards out of k pairs match with probability 1/(2k - 1) whatever happened before, so the turns spent
+#at each number of pairs left are one geometric draw, and a whole game is drawn at once without a loop over turns.
+#(Unlike simulate_batch, games aren't cut off at max_turns, which random play on the Hard board practically never reaches.)
+def simulate_random_batch(rng, games, rows, cols, players=1):
+    num_pairs = rows * cols // 2
+    pairs_left = np.arange(num_pairs, 0, -1)
+    level_turns = rng.geometric(1.0 / (2 * pairs_left - 1), size=(games, num_pairs))
+    turns = level_turns.sum(axis=1, dtype=np.int32)
+
+    #Every turn but the last of a level is a miss that passes the turn on, the last one is a match
+    scorer = np.cumsum(level_turns - 1, axis=1) % players + 1
+    scores = np.zeros((games, players + 1), dtype=np.int32)
+    for player in range(1, players + 1):
+        scores[:, player] = (scorer == player).sum(axis=1)
+    return turns, scores
+
+#Fast path for the limited memory policy
+#Which unknown card gets flipped is random, so only how many pairs have 0, 1 or 2 remembered cards matters, not where they are.
+#A pair with both cards remembered is always taken on the next turn and a turn creates at most one, so it is a flag.
+#Each turn is then a few operations on three numbers per game, with the forgetting of the other cards one binomial draw.
+def simulate_memory_batch(rng, games, rows, cols, players=1):
+    num_pairs = rows * cols // 2
+    unknown_pairs = np.full(games, num_pairs, dtype=np.int32)  #Pairs with no card remembered
+    half_known = np.zeros(games, dtype=np.int32)  #Pairs with one card remembered
+    known = np.zeros(games, dtype=bool)  #A pair with both cards remembered is waiting
+    turns = np.zeros(games, dtype=np.int32)
+    scores = np.zeros((games, players + 1), dtype=np.int32)
+    current = np.ones(games, dtype=np.int32)
+    active = np.arange(games)
+
+    while active.size:
+        size = active.size
+        a_unknown = unknown_pairs[active]
+        a_half = half_known[active]
+        a_known = known[active]
+        unknown_cards = 2 * a_unknown + a_half
+
+        #Take the known pair if there is one, else flip an unknown card: the partner of a remembered card matches right away
+        first_half = ~a_known & (rng.random(size) * unknown_cards < a_half)
+        from_unknown = ~a_known & ~first_half
+
+        #A card of an unknown pair is followed by another unknown card: its partner (a lucky match),
+        #the unseen card of a half known pair, or a card of another unknown pair
+        second_pick = rng.random(size) * (unknown_cards - 1)
+        lucky = from_unknown & (second_pick < 1)
+        miss = from_unknown & ~lucky
+        second_half = miss & (second_pick < 1 + a_half)
+        second_unknown = miss & ~second_half
+
+        #Every remembered card may be forgotten, then the two flipped cards may be remembered
+        forgotten = rng.binomial(a_half - first_half - second_half, FORGET)
+        first_recalled = miss & (rng.random(size) < RECALL)
+        second_recalled = miss & (rng.random(size) < RECALL)
+        second_kept = second_half & (rng.random(size) >= FORGET)  #The card remembered before of the second card's pair
+
+        unknown_pairs[active] = (a_unknown - lucky - miss - second_unknown + forgotten + (miss & ~first_recalled)
+                                 + (second_unknown & ~second_recalled) + (second_half & ~second_kept & ~second_recalled))
+        half_known[active] = (a_half - first_half - second_half - forgotten + first_recalled
+                              + (second_unknown & second_recalled) + (second_half & (second_kept ^ second_recalled)))
+        known[active] = second_kept & second_recalled
+
+        #Score the turn, switch player only on no match
+        turns[active] += 1
+        hit_rows = active[~miss]
+        scores[hit_rows, current[hit_rows]] += 1
+        miss_rows = active[miss]
+        current[miss_rows] = current[miss_rows] % players + 1
+
+        active = active[(unknown_pairs[active] + half_known[active] + known[active]) > 0]
+
+    return turns, scores
+
+
+#Fast path of each policy
+FAST_PATHS = {"random": simulate_random_batch, "perfect": simulate_perfect_batch, "memory": simulate_memory_batch}
+
+
+#Aggregated statistics for one grid size
+def summarize(turns, scores, players):
+    summary = {
+        "games": int(turns.size),
+        "turns_mean": float(turns.mean()),
+        "turns_percentiles": {p: int(np.percentile(turns, p)) for p in (10, 50, 90, 99)},
+    }
+    if players == 1:
+        summary["solo_within_limit"] = float((turns * SECONDS_PER_TURN <= SOLO_TIME_LIMIT).mean())
+    else:
+        best = scores[:, 1:].max(axis=1)
+        winners = scores[:, 1:] == best[:, None]
+        ties = winners.sum(axis=1) > 1
+        summary["tie_rate"] = float(ties.mean())
+        for player in range(1, players + 1):
+            summary[f"player_{player}_win_rate"] = float((winners[:, player - 1] & ~ties).mean())
+    return summary
+
+#Simulates `games` games in batches and returns their summary (reference: play whole boards with simulate_batch)
+def run(games, rows, cols, policy="perfect", players=1, seed=None, reference=False):
+    rng = np.random.default_rng(seed)
+    all_turns = []
+    all_scores = []
+    remaining = games
+    while remaining > 0:
+        batch = min(BATCH_SIZE, remaining)
+        if reference:
+            turns, scores = simulate_batch(rng, batch, rows, cols, policy, players)
+        else:
+            turns, scores = FAST_PATHS[policy](rng, batch, rows, cols, players)
+        all_turns.append(turns)
+        all_scores.append(scores)
+        remaining -= batch
+    return summarize(np.concatenate(all_turns), np.concatenate(all_scores), players)
+
+
+#Command line interface
+def main(args):
+    parser = argparse.ArgumentParser(description="Simulate Match Madness games in bulk")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--policy", choices=POLICIES, default="perfect")
+    parser.add_argument("--players", type=int, choices=(1, 2), default=1)
+    parser.add_argument("--difficulty", choices=list(DIFFICULTIES) + ["all"], default="all")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--reference", action="store_true", help="play whole boards turn by turn (slow, to check the fast paths)")
+    options = parser.parse_args(args)
+
+    names = list(DIFFICULTIES) if options.difficulty == "all" else [options.difficulty]
+    for name in names:
+        rows, cols = DIFFICULTIES[name]
+        start = time.perf_counter()
+        summary = run(options.games, rows, cols, options.policy, options.players, options.seed, options.reference)
+        elapsed = time.perf_counter() - start
+
+        percentiles = summary["turns_percentiles"]
+        print(f"{name} ({rows}x{cols}, {options.policy}, {options.players}P): {summary['games']} games in {elapsed:.2f}s "
+              f"({summary['games'] / elapsed:,.0f} games/s)")
+        print(f"  turns to clear: mean {summary['turns_mean']:.1f}, p10 {percentiles[10]}, p50 {percentiles[50]}, "
+              f"p90 {percentiles[90]}, p99 {percentiles[99]}")
+        if options.players == 1:
+            print(f"  solo games cleared within {SOLO_TIME_LIMIT}s at {SECONDS_PER_TURN}s/turn: {summary['solo_within_limit']:.1%}")
+        else:
+            print(f"  player 1 wins {summary['player_1_win_rate']:.1%}, player 2 wins {summary['player_2_win_rate']:.1%}, "
+                  f"ties {summary['tie_rate']:.1%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
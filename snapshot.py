@@ -0,0 +1,261 @@
+'''
+Saved games for Match Madness
+
+Description:
+The game in progress is kept on disk as one small binary snapshot (a Hard board is about half a kilobyte), so quitting
+in the middle of a game (or the program being closed) doesn't lose it: the menu offers to resume it on the next launch.
+
+A snapshot holds everything needed to put the board back exactly: the deal, matched and face up cards, scores, whose turn
+it is, solo time used, and the face image paths the board was dealt with, so resuming never rescans the theme folder.
+The game saves one on every state change. Snapshots are handed to a background thread that keeps only the newest one
+and writes at most every SNAPSHOT_INTERVAL seconds, so a burst of flips costs one write.
+Every write goes to a temporary file first and replaces the snapshot, so a half written snapshot is never read.
+The game hands its buffered replay records to the replay writer before each snapshot, and a snapshot is only written
+once they are on disk, so a resumed game's replay log never misses a flip the snapshot has.
+Online games (the server owns the board) and replays are not saved.
+
+Layout (all integers little endian):
+    header:  magic "MMSG", version (u8), flags (u8), seed (u64), telemetry game id (u64), saved at (f64, unix seconds),
+             solo seconds used (f64),
+             rows (u16), cols (u16), players (u8), computer seat (u8, 0 = none), current player (u8),
+             first and second face up card of the turn (i16, -1 = none), resolved turns (u32)
+    body:    score per player (u16), pair id per card (u16), matched and face up cards (bitmasks, one bit per card),
+             theme, difficulty, player mode and replay log path (each a u16 length and utf-8 text),
+             number of faces (u16), then the image path of each pair id (u16 length and utf-8 text)
+Version 1 snapshots (no game id) still load, the resumed game gets a new telemetry id.
+'''
+
+import atexit
+import os
+import struct
+import threading
+import time
+from app_paths import data_path
+from engine import GameEngine
+from replay import REPLAY_WRITER
+
+
+#Constant variables
+
+SNAPSHOT_MAGIC = b"MMSG"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FILE = "saved_game.mmsg"
+
+#Header: magic, version, flags, seed, game id, saved at, seconds used, rows, cols, players, computer seat, current player,
+#first, second, moves
+HEADER_FORMAT = struct.Struct("<4sBBQQddHHBBBhhI")
+
+#Version 1 header, without the game id
+HEADER_FORMAT_V1 = struct.Struct("<4sBBQddHHBBBhhI")
+TEXT_LENGTH_FORMAT = struct.Struct("<H")
+
+#Header flags
+FLAG_SEED = 1  #The board was dealt from the seed (it can be replayed)
+FLAG_BUNDLED = 2  #The faces came from the theme bundle, not the loose folder
+
+#Shortest time between two snapshot writes (seconds), changes in between are coalesced into the next write
+SNAPSHOT_INTERVAL = 0.25
+
+#Queued in place of snapshot bytes to remove the saved game
+DELETE = object()
+
+
+#Helper functions
+
+#Path of the saved game
+def snapshot_path():
+    return data_path(SNAPSHOT_FILE)
+
+#Packs a text as a u16 length and utf-8 text
+def pack_text(text):
+    data = (text or "").encode("utf-8")
+    return TEXT_LENGTH_FORMAT.pack(len(data)) + data
+
+#Packs a bitmask of one bit per card
+def pack_bits(bits, num_cards):
+    return bits.to_bytes((num_cards + 7) // 8, "little")
+
+#Packs a game in progress into snapshot bytes
+def pack_snapshot(engine, settings, seed, seconds_used, face_paths, bundled=False, replay_path=None, game_id=0):
+    theme, difficulty, player_mode, computer_seat = settings
+    flags = (FLAG_SEED if seed is not None else 0) | (FLAG_BUNDLED if bundled else 0)
+    parts = [HEADER_FORMAT.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, seed or 0, game_id, time.time(), seconds_used,
+                                engine.rows, engine.cols, engine.players, computer_seat or 0, engine.current_player,
+                                engine.first, engine.second, engine.moves)]
+    parts.append(struct.pack(f"<{engine.players}H", *engine.scores[1:]))
+    parts.append(struct.pack(f"<{engine.num_cards}H", *engine.pairs))
+    parts.append(pack_bits(engine.matched, engine.num_cards))
+    parts.append(pack_bits(engine.face_up, engine.num_cards))
+    for text in (theme, difficulty, player_mode, replay_path):
+        parts.append(pack_text(text))
+    parts.append(TEXT_LENGTH_FORMAT.pack(len(face_paths)))
+    parts.extend(pack_text(path) for path in face_paths)
+    return b"".join(parts)
+
+#Reads the saved game, None if there is none (raises ValueError if the file isn't a snapshot)
+def load_snapshot(path=None):
+    path = path or snapshot_path()
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    return Snapshot(data)
+
+
+#A game in progress read back from snapshot bytes
+class Snapshot:
+    #Constructor, unpacks the bytes (raises ValueError if they aren't a snapshot)
+    def __init__(self, data):
+        try:
+            self.unpack(data)
+        except (struct.error, UnicodeDecodeError, IndexError) as error:
+            raise ValueError(f"corrupt saved game ({error})")
+
+    #Reads every field
+    def unpack(self, data):
+        magic, version = struct.unpack_from("<4sB", data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("not a saved game")
+        if version == SNAPSHOT_VERSION:
+            header = HEADER_FORMAT
+            (magic, version, flags, seed, self.game_id, self.saved_at, self.seconds_used, self.rows, self.cols, self.players,
+             computer_seat, self.current_player, self.first, self.second, self.moves) = header.unpack_from(data)
+        elif version == 1:
+            header = HEADER_FORMAT_V1
+            (magic, version, flags, seed, self.saved_at, self.seconds_used, self.rows, self.cols, self.players,
+             computer_seat, self.current_player, self.first, self.second, self.moves) = header.unpack_from(data)
+            self.game_id = None
+        else:
+            raise ValueError(f"unsupported saved game version {version}")
+        self.seed = seed if flags & FLAG_SEED else None
+        self.bundled = bool(flags & FLAG_BUNDLED)
+        self.computer_seat = computer_seat or None
+        num_cards = self.rows * self.cols
+        offset = header.size
+
+        self.scores = [0] + list(struct.unpack_from(f"<{self.players}H", data, offset))
+        offset += 2 * self.players
+        self.pairs = struct.unpack_from(f"<{num_cards}H", data, offset)
+        offset += 2 * num_cards
+        mask_size = (num_cards + 7) // 8
+        self.matched = int.from_bytes(data[offset:offset + mask_size], "little")
+        offset += mask_size
+        self.face_up = int.from_bytes(data[offset:offset + mask_size], "little")
+        offset += mask_size
+
+        texts = []
+        for i in range(4):
+            text, offset = self.read_text(data, offset)
+            texts.append(text)
+        self.theme, self.difficulty, self.player_mode, replay_path = texts
+        self.replay_path = replay_path or None
+
+        (count,) = TEXT_LENGTH_FORMAT.unpack_from(data, offset)
+        offset += TEXT_LENGTH_FORMAT.size
+        self.face_paths = []
+        for i in range(count):
+            path, offset = self.read_text(data, offset)
+            self.face_paths.append(path)
+        if offset != len(data) or any(pair >= count for pair in self.pairs):
+            raise ValueError("corrupt saved game")
+
+    #Reads one u16 length prefixed text, returns (text, offset after it)
+    def read_text(self, data, offset):
+        (length,) = TEXT_LENGTH_FORMAT.unpack_from(data, offset)
+        offset += TEXT_LENGTH_FORMAT.size
+        if offset + length > len(data):
+            raise ValueError("corrupt saved game")
+        return data[offset:offset + length].decode("utf-8"), offset + length
+
+    #Settings tuple in the form MatchMadness.current_settings uses
+    def settings(self):
+        return (self.theme, self.difficulty, self.player_mode, self.computer_seat)
+
+    #Rebuilds the engine as it was when the snapshot was taken
+    def engine(self):
+        engine = GameEngine(self.rows, self.cols, players=self.players, pair_ids=self.pairs)
+        engine.scores = list(self.scores)
+        engine.current_player = self.current_player
+        engine.matched = self.matched
+        engine.face_up = self.face_up
+        engine.first = self.first
+        engine.second = self.second
+        engine.moves = self.moves
+        engine.pairs_left = engine.num_cards // 2 - bin(self.matched).count("1") // 2
+        engine.over = engine.pairs_left == 0
+        return engine
+
+
+#Writes snapshots on a background thread, only ever the newest one
+class SnapshotWriter:
+    #Constructor
+    def __init__(self, path=None):
+        self.path = path
+        self.pending = None  #Newest unwritten snapshot bytes, or DELETE
+        self.lock = threading.Lock()  #Guards pending
+        self.write_lock = threading.Lock()  #One write at a time (worker or flush)
+        self.wakeup = threading.Event()
+        self.thread = None
+
+        #Counters
+        self.saves = 0
+        self.writes = 0
+
+    #Queues a snapshot, replacing one that wasn't written yet
+    def save(self, data):
+        self.queue(data)
+
+    #Queues removing the saved game (the game ended)
+    def clear(self):
+        self.queue(DELETE)
+
+    #Hands work to the writer thread
+    def queue(self, item):
+        with self.lock:
+            self.pending = item
+            self.saves += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    #Runs on the writer thread
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.write_pending()
+            time.sleep(SNAPSHOT_INTERVAL)  #Snapshots queued meanwhile are coalesced into one write
+
+    #Writes (or deletes) the pending snapshot, if any
+    def write_pending(self):
+        with self.write_lock:
+            with self.lock:
+                item = self.pending
+                self.pending = None
+            if item is None:
+                return
+            path = self.path or snapshot_path()
+            try:
+                if item is DELETE:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    REPLAY_WRITER.wait()  #Replay records queued before this snapshot reach the log first
+                    temp_path = path + ".tmp"
+                    with open(temp_path, "wb") as file:
+                        file.write(item)
+                    os.replace(temp_path, path)
+                self.writes += 1
+            except OSError:
+                pass  #A lost snapshot must never break the game
+
+    #Writes the pending snapshot now, on the calling thread (quitting)
+    def flush(self):
+        self.write_pending()
+
+
+#Shared writer, flushed when the program exits
+SNAPSHOT_WRITER = SnapshotWriter()
+atexit.register(SNAPSHOT_WRITER.flush)
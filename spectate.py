@@ -0,0 +1,306 @@
+'''
+Spectator stream for Match Madness
+
+Description:
+Publishes a live game to any number of local subscribers (lobby screens, tools) without a Tk window per game.
+Every state change (flip, match, mismatch flip-back, turn change, timer tick, game over) becomes a delta of a few bytes.
+It is encoded once and appended to each subscriber's buffer, so publishing costs the game one small append per subscriber.
+A new subscriber first reads a snapshot of the whole game, then only deltas.
+
+Slow subscribers never block the game: when a buffer is full it is cleared and the subscriber gets a fresh snapshot on
+its next read (coalescing everything it missed). A subscriber that keeps falling behind is dropped: resyncs are counted
+across reads and only forgotten after CAUGHT_UP_READS reads in a row that didn't need a snapshot.
+Subscribers live in the game's process (the game publishes to MatchMadness.stream), nothing reaches them over the network.
+
+Message layout (little endian), first byte is the message type:
+    S snapshot  rows (u16), cols (u16), players (u8), current player (u8), seconds left (u16, 0xFFFF = no timer),
+                scores (u16 per player), matched bitmask (1 bit per card), face up count (u16), (card u16, pair u16) per face up card
+    F flip      card (u16), pair (u16)
+    M match     first card (u16), second card (u16), player (u8), player's new score (u16)
+    B flip back first card (u16), second card (u16)
+    T turn      player (u8)
+    K tick      seconds left (u16)
+    O over      (no fields)
+
+Usage:
+    python spectate.py check     Plays a game into a stream and checks a slow subscriber is dropped and a fast one isn't
+'''
+
+import random
+import struct
+import sys
+import threading
+from collections import deque
+
+
+#Constant variables
+
+SNAPSHOT = b"S"
+FLIP = b"F"
+MATCH = b"M"
+FLIP_BACK = b"B"
+TURN = b"T"
+TICK = b"K"
+OVER = b"O"
+
+NO_TIMER = 0xFFFF
+
+#Messages a subscriber may have waiting before it is resynced with a snapshot
+MAX_PENDING = 256
+
+#Resyncs (without the subscriber catching up in between) before it is dropped
+MAX_RESYNCS = 8
+
+#Reads in a row without a snapshot after which a subscriber counts as caught up (its resyncs are forgotten)
+CAUGHT_UP_READS = 4
+
+SNAPSHOT_HEADER = struct.Struct("<HHBBH")
+CARD_PAIR = struct.Struct("<HH")
+MATCH_FIELDS = struct.Struct("<HHBH")
+U8 = struct.Struct("<B")
+U16 = struct.Struct("<H")
+
+
+#Buffer of messages for one subscriber
+class Subscription:
+    #Constructor
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = deque()
+        self.needs_snapshot = True  #Next read starts with a snapshot
+        self.resyncs = 0  #Resyncs since the subscriber last caught up
+        self.clean_reads = 0  #Reads in a row that didn't need a snapshot
+        self.dropped = False
+
+    #Returns every waiting message (snapshot first if needed), never blocks
+    def read(self):
+        if self.dropped:
+            return []
+        messages = []
+        if self.needs_snapshot:
+            with self.stream.lock:
+                self.pending.clear()
+                self.needs_snapshot = False
+                messages.append(self.stream.snapshot())
+            self.clean_reads = 0
+        else:
+            self.clean_reads += 1
+            if self.clean_reads >= CAUGHT_UP_READS:
+                self.resyncs = 0  #Kept up for a while
+        while self.pending:
+            messages.append(self.pending.popleft())
+        return messages
+
+    #Stops receiving messages
+    def close(self):
+        self.stream.unsubscribe(self)
+
+
+#Publishes one game's state changes
+class GameStream:
+    #Constructor
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()  #Snapshots may be read from other threads
+        self.reset(0, 0, 1)
+
+    #Starts a new game (subscribers get a snapshot of it)
+    def reset(self, rows, cols, players, seconds_left=None):
+        with self.lock:
+            self.rows = rows
+            self.cols = cols
+            self.players = players
+            self.current_player = 1
+            self.seconds_left = NO_TIMER if seconds_left is None else seconds_left
+            self.scores = [0] * (players + 1)
+            self.matched = 0
+            self.face_up = {}  #card -> pair of face up, unmatched cards
+            for subscriber in self.subscribers:
+                subscriber.needs_snapshot = True
+
+    #Continues a saved game from its engine (subscribers get a snapshot of it)
+    def restore(self, engine, seconds_left=None):
+        self.reset(engine.rows, engine.cols, engine.players, seconds_left)
+        with self.lock:
+            self.current_player = engine.current_player
+            self.scores = list(engine.scores)
+            self.matched = engine.matched
+            self.face_up = {card: engine.pair_of(card) for card in (engine.first, engine.second) if card >= 0}
+
+    #Adds a subscriber
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self.lock:
+            self.subscribers.append(subscription)
+        return subscription
+
+    #Removes a subscriber
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    #Encodes the whole game state
+    def snapshot(self):
+        parts = [SNAPSHOT, SNAPSHOT_HEADER.pack(self.rows, self.cols, self.players, self.current_player, self.seconds_left)]
+        parts.extend(U16.pack(score) for score in self.scores[1:])
+        parts.append(self.matched.to_bytes((self.rows * self.cols + 7) // 8, "little"))
+        parts.append(U16.pack(len(self.face_up)))
+        parts.extend(CARD_PAIR.pack(card, pair) for card, pair in self.face_up.items())
+        return b"".join(parts)
+
+    #Hands a message to every subscriber, resyncing or dropping the ones that fall behind
+    def publish(self, message):
+        if not self.subscribers:
+            return
+        for subscriber in self.subscribers:
+            if subscriber.needs_snapshot:
+                continue  #Will get everything in its snapshot
+            if len(subscriber.pending) >= MAX_PENDING:
+                subscriber.pending.clear()
+                subscriber.needs_snapshot = True
+                subscriber.resyncs += 1
+                if subscriber.resyncs > MAX_RESYNCS:
+                    subscriber.dropped = True
+                continue
+            subscriber.pending.append(message)
+        if any(subscriber.dropped for subscriber in self.subscribers):
+            with self.lock:
+                self.subscribers = [subscriber for subscriber in self.subscribers if not subscriber.dropped]
+
+    #State changes, called by the game (deltas are idempotent, so one that races a snapshot is harmless)
+
+    #A card was turned face up
+    def flip(self, card, pair):
+        with self.lock:
+            self.face_up[card] = pair
+        self.publish(FLIP + CARD_PAIR.pack(card, pair))
+
+    #Two cards were matched
+    def match(self, first, second, player):
+        with self.lock:
+            self.face_up.pop(first, None)
+            self.face_up.pop(second, None)
+            self.matched |= (1 << first) | (1 << second)
+            self.scores[player] += 1
+        self.publish(MATCH + MATCH_FIELDS.pack(first, second, player, self.scores[player]))
+
+    #Two mismatched cards were turned back
+    def flip_back(self, first, second):
+        with self.lock:
+            self.face_up.pop(first, None)
+            self.face_up.pop(second, None)
+        self.publish(FLIP_BACK + CARD_PAIR.pack(first, second))
+
+    #The turn passed to another player
+    def turn(self, player):
+        self.current_player = player
+        self.publish(TURN + U8.pack(player))
+
+    #The timer changed
+    def tick(self, seconds_left):
+        self.seconds_left = seconds_left
+        self.publish(TICK + U16.pack(seconds_left))
+
+    #The game ended
+    def over(self):
+        self.publish(OVER)
+
+
+#Game state rebuilt from stream messages (for lobby screens and tools)
+class StreamState:
+    #Constructor
+    def __init__(self):
+        self.rows = 0
+        self.cols = 0
+        self.players = 1
+        self.current_player = 1
+        self.seconds_left = None
+        self.scores = [0, 0]
+        self.matched = set()
+        self.face_up = {}  #card -> pair
+        self.over = False
+
+    #Applies one message
+    def apply(self, message):
+        kind = message[:1]
+        if kind == SNAPSHOT:
+            self.rows, self.cols, self.players, self.current_player, seconds = SNAPSHOT_HEADER.unpack_from(message, 1)
+            self.seconds_left = None if seconds == NO_TIMER else seconds
+            offset = 1 + SNAPSHOT_HEADER.size
+            self.scores = [0] + [U16.unpack_from(message, offset + 2 * i)[0] for i in range(self.players)]
+            offset += 2 * self.players
+            mask_size = (self.rows * self.cols + 7) // 8
+            mask = int.from_bytes(message[offset:offset + mask_size], "little")
+            self.matched = {card for card in range(self.rows * self.cols) if (mask >> card) & 1}
+            offset += mask_size
+            (count,) = U16.unpack_from(message, offset)
+            offset += 2
+            self.face_up = dict(CARD_PAIR.unpack_from(message, offset + 4 * i) for i in range(count))
+            self.over = False
+        elif kind == FLIP:
+            card, pair = CARD_PAIR.unpack_from(message, 1)
+            self.face_up[card] = pair
+        elif kind == MATCH:
+            first, second, player, score = MATCH_FIELDS.unpack_from(message, 1)
+            self.face_up.pop(first, None)
+            self.face_up.pop(second, None)
+            self.matched.update((first, second))
+            self.scores[player] = score
+        elif kind == FLIP_BACK:
+            first, second = CARD_PAIR.unpack_from(message, 1)
+            self.face_up.pop(first, None)
+            self.face_up.pop(second, None)
+        elif kind == TURN:
+            (self.current_player,) = U8.unpack_from(message, 1)
+        elif kind == TICK:
+            (self.seconds_left,) = U16.unpack_from(message, 1)
+        elif kind == OVER:
+            self.over = True
+
+
+#Publishes random turns of a game to a fast, a briefly slow and a slow subscriber, checks only the slow one is dropped
+def check():
+    stream = GameStream()
+    stream.reset(5, 6, 2)
+    fast, hiccup, slow = stream.subscribe(), stream.subscribe(), stream.subscribe()
+    states = {fast: StreamState(), hiccup: StreamState()}
+    rng = random.Random(1)
+    for turn in range(20000):
+        first, second = rng.sample(range(30), 2)
+        stream.flip(first, first // 2)
+        stream.flip(second, second // 2)
+        stream.flip_back(first, second)
+        stream.turn(turn % 2 + 1)
+        for message in fast.read():
+            states[fast].apply(message)
+        if turn < 1000 or turn % 200 == 0:  #Falls behind for a stretch, then keeps up
+            pass
+        elif turn < 2000 or turn % 2 == 0:
+            for message in hiccup.read():
+                states[hiccup].apply(message)
+        if turn % 100 == 0:  #Reads far too rarely
+            slow.read()
+    problems = []
+    if fast.dropped or fast.resyncs:
+        problems.append("a subscriber that keeps up was resynced or dropped")
+    if hiccup.dropped:
+        problems.append("a subscriber that caught up again was dropped")
+    if not slow.dropped or slow in stream.subscribers:
+        problems.append(f"a subscriber that never keeps up wasn't dropped ({slow.resyncs} resyncs)")
+    for subscriber, state in states.items():
+        for message in subscriber.read():
+            state.apply(message)
+        if state.face_up or state.current_player != stream.current_player:
+            problems.append("a subscriber's rebuilt state differs from the game")
+    if problems:
+        print("Stream check failed: " + "; ".join(problems))
+        return 1
+    print("Stream check passed: the slow subscriber was dropped, the others kept the game's state")
+    return 0
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["check"]:
+        print("Usage: python spectate.py check")
+        sys.exit(2)
+    sys.exit(check())
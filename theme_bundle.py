@@ -0,0 +1,197 @@
+'''
+Packed theme bundles for Match Madness
+
+Description:
+A theme bundle is a single file holding every card face of a theme, so opening a theme is one open and one index read
+instead of a directory scan plus one open per image.
+
+Layout (all integers little endian):
+    header:  magic "MMTB", version (u16), image count (u32), index size in bytes (u32)
+    index:   one entry per image: name length (u16), name (utf-8), payload offset (u64), payload length (u32),
+             width (u16), height (u16), sha1 of the payload (20 bytes)
+    payload: the original image files, back to back
+
+Bundles are read through mmap, so image bytes are only paged in when a card face is actually decoded.
+The game prefers Cards/<theme>.mmtb and falls back to scanning Cards/<theme>/ when there is no bundle.
+
+Usage:
+    python theme_bundle.py build [cards_folder]     Builds a bundle for every theme folder
+    python theme_bundle.py list <bundle>            Prints the index of a bundle
+'''
+
+import mmap
+import os
+import re
+import struct
+import sys
+
+
+#Constant variables
+
+BUNDLE_MAGIC = b"MMTB"
+BUNDLE_VERSION = 1
+BUNDLE_EXTENSION = ".mmtb"
+
+#Header: magic, version, image count, index size
+HEADER_FORMAT = struct.Struct("<4sHII")
+
+#Index entry after the name: offset, length, width, height, sha1
+ENTRY_FORMAT = struct.Struct("<QIHH20s")
+NAME_LENGTH_FORMAT = struct.Struct("<H")
+
+#Valid image file endings
+IMAGE_ENDINGS = (".png", ".jpg")
+
+
+#Helper functions
+
+#Sort key that orders numbers in file names by value (1, 2, ..., 10 instead of 1, 10, 11, ..., 2)
+def natural_key(path):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", os.path.basename(path))]
+
+#Returns a list of full paths for images in cards folder (in natural order, which decides the faces small boards use)
+def list_image_files(folder: str):
+    files = []
+    for name in os.listdir(folder):
+        if name.lower().endswith(IMAGE_ENDINGS):
+            files.append(os.path.join(folder, name))
+    files.sort(key=natural_key)
+    return files
+
+#Reads a whole file into memory
+def read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+#Returns (width, height) of a PNG from its header, or (0, 0) for other formats
+def image_size(data):
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+    return 0, 0
+
+#Path of the bundle for a theme
+def bundle_path(cards_folder, theme):
+    return os.path.join(cards_folder, theme + BUNDLE_EXTENSION)
+
+
+#Memory-mapped, read only view of a theme bundle
+class ThemeBundle:
+    #Constructor, maps the file and reads its index
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, index_size = HEADER_FORMAT.unpack_from(self.data, 0)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a theme bundle")
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"{path} has unsupported bundle version {version}")
+
+        self.entries = {}  #name -> (offset, length, width, height, sha1)
+        self.names = []  #names in bundle order
+        position = HEADER_FORMAT.size
+        for i in range(count):
+            (name_length,) = NAME_LENGTH_FORMAT.unpack_from(self.data, position)
+            position += NAME_LENGTH_FORMAT.size
+            name = self.data[position:position + name_length].decode("utf-8")
+            position += name_length
+            self.entries[name] = ENTRY_FORMAT.unpack_from(self.data, position)
+            position += ENTRY_FORMAT.size
+            self.names.append(name)
+
+        if position != HEADER_FORMAT.size + index_size:
+            raise ValueError(f"{path} has a corrupt index")
+
+    #Returns the image paths in the same form as list_image_files (names inside the theme folder)
+    def paths(self, folder):
+        return [os.path.join(folder, name) for name in self.names]
+
+    #Returns the bytes of an image by path or name
+    def read(self, path):
+        offset, length, width, height, digest = self.entries[os.path.basename(path)]
+        return self.data[offset:offset + length]
+
+    #Returns the content hash of an image by path or name
+    def digest(self, path):
+        return self.entries[os.path.basename(path)][4]
+
+    #Unmaps the file
+    def close(self):
+        self.data.close()
+
+
+#Writes a bundle from a list of image files
+def write_bundle(image_paths, out_path):
+    import hashlib  #Only bundling needs it, the game only reads bundles
+    payloads = [read_file(path) for path in image_paths]
+
+    names = [os.path.basename(path).encode("utf-8") for path in image_paths]
+
+    #Payloads start right after the header and index
+    index_size = sum(NAME_LENGTH_FORMAT.size + len(name) + ENTRY_FORMAT.size for name in names)
+    offset = HEADER_FORMAT.size + index_size
+    index = bytearray()
+    for name, data in zip(names, payloads):
+        width, height = image_size(data)
+        index += NAME_LENGTH_FORMAT.pack(len(name)) + name
+        index += ENTRY_FORMAT.pack(offset, len(data), width, height, hashlib.sha1(data).digest())
+        offset += len(data)
+
+    #Write to a temporary file first so a half-written bundle is never picked up by the game
+    temp_path = out_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(HEADER_FORMAT.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(names), len(index)))
+        file.write(index)
+        for data in payloads:
+            file.write(data)
+    os.replace(temp_path, out_path)
+
+
+#Opened bundles, shared by the whole process (theme bundles are read only)
+open_bundles = {}
+
+#Returns the bundle for a theme, or None if the theme has no bundle
+def open_bundle(cards_folder, theme):
+    path = bundle_path(cards_folder, theme)
+    if path not in open_bundles:
+        open_bundles[path] = ThemeBundle(path) if os.path.isfile(path) else None
+    return open_bundles[path]
+
+#Returns (image paths, read function) for a theme, preferring its bundle over the loose folder
+def open_theme(cards_folder, theme):
+    bundle = open_bundle(cards_folder, theme)
+    folder = os.path.join(cards_folder, theme)
+    if bundle is not None:
+        return sorted(bundle.paths(folder), key=natural_key), bundle.read  #Bundles built before natural order was used
+    return list_image_files(folder), read_file
+
+
+#Command line interface
+def main(args):
+    if len(args) >= 1 and args[0] == "build":
+        cards_folder = args[1] if len(args) > 1 else "Cards"
+        for theme in sorted(os.listdir(cards_folder)):
+            folder = os.path.join(cards_folder, theme)
+            if not os.path.isdir(folder):
+                continue
+            image_paths = list_image_files(folder)
+            if not image_paths:
+                continue
+            out_path = bundle_path(cards_folder, theme)
+            write_bundle(image_paths, out_path)
+            print(f"{out_path}: {len(image_paths)} images, {os.path.getsize(out_path)} bytes")
+    elif len(args) == 2 and args[0] == "list":
+        bundle = ThemeBundle(args[1])
+        for name in bundle.names:
+            offset, length, width, height, digest = bundle.entries[name]
+            print(f"{name:<20} {width}x{height:<6} {length:>8} bytes  {digest.hex()}")
+        bundle.close()
+    else:
+        print(__doc__.split("Usage:")[1].rstrip())
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,341 @@
+'''
+Strategy tournaments for Match Madness
+
+Description:
+Plays many headless two player games between computer strategies over a grid of difficulties and themes,
+spread across a process pool. Games are handed out in chunks, each chunk with its own seed derived from the
+tournament seed, so results don't depend on which worker ran what or in which order.
+Workers send back running totals per chunk (never per game), and the totals are merged and printed as chunks finish.
+A checkpoint file with the merged totals and finished chunks is saved regularly, so an interrupted run can be resumed.
+
+The players swap seats every game, so the first player's advantage cancels out.
+A theme only decides whether a board can be dealt (it needs a face per pair). The rules don't depend on the artwork.
+
+Strategies:
+    random            flips random face down cards, remembers nothing
+    easy, medium      ai.ComputerPlayer with imperfect memory
+    perfect           ai.ComputerPlayer with perfect memory and optimal play
+    module:Class      any class with the ai.ComputerPlayer methods (new_game, observe, matched, end_turn,
+                      choose_first, choose_second), constructed with an rng keyword argument
+
+Usage:
+    python tournament.py [--strategies S [S ...]] [--games N] [--difficulty D [D ...]] [--themes T [T ...]]
+                         [--workers W] [--chunk C] [--seed S] [--checkpoint FILE] [--resume]
+'''
+
+import argparse
+import concurrent.futures
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from itertools import combinations
+from ai import ComputerPlayer, LEVELS
+from app_paths import data_path
+from engine import GameEngine, DIFFICULTIES, FLIP_SECOND, MATCH
+from theme_bundle import open_theme
+
+
+#Constant variables
+
+CARDS_FOLDER = "Cards"
+
+#Games per chunk sent to a worker
+DEFAULT_CHUNK = 250
+
+#Seconds between checkpoint saves
+CHECKPOINT_SECONDS = 30
+
+#Seconds between progress lines
+PROGRESS_SECONDS = 5
+
+#z value of the 95% confidence intervals
+Z_95 = 1.96
+
+
+#Helper functions
+
+#Player that flips random face down cards
+class RandomPlayer:
+    #Constructor
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+
+    #Nothing to remember (same methods as ai.ComputerPlayer)
+    def new_game(self, num_pairs):
+        pass
+
+    #Ignores shown cards
+    def observe(self, index, pair_id):
+        pass
+
+    #Ignores matches
+    def matched(self, first, second):
+        pass
+
+    #Nothing to forget
+    def end_turn(self):
+        pass
+
+    #Picks a random face down card
+    def choose_first(self, engine):
+        cards = [index for index in range(engine.num_cards) if not engine.is_face_up(index)]
+        return self.rng.choice(cards)
+
+    #Picks another random face down card
+    def choose_second(self, engine, first):
+        return self.choose_first(engine)
+
+
+#Builds a strategy by name
+def make_strategy(name, rng):
+    if name == "random":
+        return RandomPlayer(rng=rng)
+    if name in LEVELS:
+        return ComputerPlayer(name, rng=rng)
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"unknown strategy {name!r}")
+    return getattr(importlib.import_module(module_name), class_name)(rng=rng)
+
+#Plays one game between two strategies, returns (engine scores, moves)
+def play_game(rows, cols, strategies, rng):
+    engine = GameEngine(rows, cols, players=len(strategies), rng=rng)
+    for strategy in strategies:
+        strategy.new_game(engine.num_cards // 2)
+    while not engine.over:
+        strategy = strategies[engine.current_player - 1]
+        index = strategy.choose_first(engine)
+        engine.flip(index)
+        for other in strategies:
+            other.observe(index, engine.pairs[index])
+        index = strategy.choose_second(engine, index)
+        if engine.flip(index) != FLIP_SECOND:
+            raise RuntimeError(f"strategy {type(strategy).__name__} flipped card {index}, which can't be flipped")
+        for other in strategies:
+            other.observe(index, engine.pairs[index])
+        result, first, second = engine.resolve()
+        for other in strategies:
+            if result == MATCH:
+                other.matched(first, second)
+            other.end_turn()
+    return engine.scores, engine.moves
+
+#Empty running totals for one grid cell
+def new_totals():
+    return {"games": 0, "wins_a": 0, "wins_b": 0, "ties": 0, "moves": 0, "moves_sq": 0, "margin": 0, "margin_sq": 0}
+
+#Adds one set of totals into another
+def merge_totals(totals, other):
+    for key, value in other.items():
+        totals[key] += value
+
+#Worker: plays one chunk of games, returns (task key, totals)
+def run_chunk(task):
+    key, rows, cols, name_a, name_b, games, seed = task
+    rng = random.Random(seed)
+    player_a = make_strategy(name_a, random.Random(rng.getrandbits(64)))
+    player_b = make_strategy(name_b, random.Random(rng.getrandbits(64)))
+    totals = new_totals()
+    for game in range(games):
+        #Swap seats every game
+        a_seat = 1 + game % 2
+        strategies = (player_a, player_b) if a_seat == 1 else (player_b, player_a)
+        scores, moves = play_game(rows, cols, strategies, rng)
+        margin = scores[a_seat] - scores[3 - a_seat]  #Strategy a's score minus strategy b's
+        totals["games"] += 1
+        if margin > 0:
+            totals["wins_a"] += 1
+        elif margin < 0:
+            totals["wins_b"] += 1
+        else:
+            totals["ties"] += 1
+        totals["moves"] += moves
+        totals["moves_sq"] += moves * moves
+        totals["margin"] += margin
+        totals["margin_sq"] += margin * margin
+    return key, totals
+
+#Wilson score interval of a rate (low, high)
+def wilson(successes, n, z=Z_95):
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return centre - spread, centre + spread
+
+#Mean and 95% half width of a total and its sum of squares
+def mean_interval(total, total_sq, n):
+    if n == 0:
+        return 0.0, 0.0
+    mean = total / n
+    variance = max(total_sq / n - mean * mean, 0.0) * n / max(n - 1, 1)
+    return mean, Z_95 * math.sqrt(variance / n)
+
+#Number of card faces a theme has (bundle or folder), 0 if it doesn't exist
+def theme_faces(theme):
+    try:
+        paths, read = open_theme(CARDS_FOLDER, theme)
+    except (OSError, ValueError):
+        return 0
+    return len(paths)
+
+#Saves the checkpoint atomically (a crash mid-save keeps the previous one)
+def save_checkpoint(path, config, results, done):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump({"config": config, "results": results, "done": sorted(done)}, file)
+    os.replace(temp_path, path)
+
+
+#One tournament run
+class Tournament:
+    #Constructor
+    def __init__(self, strategies, games, difficulties, themes, seed, chunk=DEFAULT_CHUNK):
+        self.strategies = strategies
+        self.games = games  #Per grid cell
+        self.difficulties = difficulties
+        self.themes = themes
+        self.seed = seed
+        self.chunk = chunk
+        self.results = {}  #Cell name -> running totals
+        self.done = set()  #Keys of finished chunks
+
+    #Settings that must match when resuming
+    def config(self):
+        return {"strategies": self.strategies, "games": self.games, "difficulties": self.difficulties,
+                "themes": self.themes, "seed": self.seed, "chunk": self.chunk}
+
+    #Strategy pairings (a strategy alone plays itself)
+    def matchups(self):
+        if len(self.strategies) == 1:
+            return [(self.strategies[0], self.strategies[0])]
+        return list(combinations(self.strategies, 2))
+
+    #Every chunk of the tournament as worker tasks, skipping finished ones
+    def tasks(self):
+        for difficulty in self.difficulties:
+            rows, cols = DIFFICULTIES[difficulty]
+            for theme in self.themes:
+                if theme_faces(theme) < rows * cols // 2:
+                    print(f"skipping {theme} {difficulty}: not enough card faces", file=sys.stderr)
+                    continue
+                for name_a, name_b in self.matchups():
+                    cell = f"{difficulty}|{theme}|{name_a}|{name_b}"
+                    for number, start in enumerate(range(0, self.games, self.chunk)):
+                        key = f"{cell}|{number}"
+                        if key in self.done:
+                            continue
+                        seed = random.Random(f"{self.seed}|{key}").getrandbits(64)
+                        yield (key, rows, cols, name_a, name_b, min(self.chunk, self.games - start), seed)
+
+    #Adds a finished chunk
+    def add(self, key, totals):
+        cell = key.rpartition("|")[0]
+        merge_totals(self.results.setdefault(cell, new_totals()), totals)
+        self.done.add(key)
+
+    #Loads a checkpoint made with the same settings
+    def resume(self, path):
+        with open(path) as file:
+            saved = json.load(file)
+        if saved["config"] != self.config():
+            raise ValueError(f"{path} was made with different settings: {saved['config']}")
+        self.results = saved["results"]
+        self.done = set(saved["done"])
+
+    #Runs every remaining chunk on a process pool, streaming the totals as chunks finish
+    def run(self, workers=None, checkpoint=None):
+        workers = workers or os.cpu_count() or 1
+        tasks = iter(self.tasks())
+        start = last_save = last_progress = time.perf_counter()
+        played = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            #Keep a couple of chunks per worker queued, never the whole tournament
+            pending = set()
+            def fill():
+                while len(pending) < 2 * workers:
+                    task = next(tasks, None)
+                    if task is None:
+                        return
+                    pending.add(pool.submit(run_chunk, task))
+            fill()
+            while pending:
+                finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    pending.discard(future)
+                    key, totals = future.result()
+                    self.add(key, totals)
+                    played += totals["games"]
+                fill()
+
+                now = time.perf_counter()
+                if checkpoint and now - last_save >= CHECKPOINT_SECONDS:
+                    save_checkpoint(checkpoint, self.config(), self.results, self.done)
+                    last_save = now
+                if now - last_progress >= PROGRESS_SECONDS:
+                    print(f"... {played:,} games in {now - start:.0f}s ({played / (now - start):,.0f} games/s)", file=sys.stderr)
+                    last_progress = now
+
+        if checkpoint:
+            save_checkpoint(checkpoint, self.config(), self.results, self.done)
+        return played, time.perf_counter() - start
+
+    #Prints the results table
+    def report(self):
+        print(f"{'difficulty':<10} {'theme':<8} {'a':>8} {'b':>8} {'games':>9}  {'a wins (95% CI)':<22} {'ties':>6}  "
+              f"{'moves':>14}  {'margin a-b':>14}")
+        for cell, totals in sorted(self.results.items()):
+            difficulty, theme, name_a, name_b = cell.split("|")
+            n = totals["games"]
+            low, high = wilson(totals["wins_a"], n)
+            moves, moves_ci = mean_interval(totals["moves"], totals["moves_sq"], n)
+            margin, margin_ci = mean_interval(totals["margin"], totals["margin_sq"], n)
+            print(f"{difficulty:<10} {theme:<8} {name_a:>8} {name_b:>8} {n:>9,}  "
+                  f"{totals['wins_a'] / max(n, 1):6.1%} ({low:5.1%}-{high:5.1%})  {totals['ties'] / max(n, 1):6.1%}  "
+                  f"{moves:7.2f} ±{moves_ci:5.2f}  {margin:+7.2f} ±{margin_ci:5.2f}")
+
+
+#Command line interface
+def main(args):
+    parser = argparse.ArgumentParser(description="Run a Match Madness strategy tournament")
+    parser.add_argument("--strategies", nargs="+", default=["random", "easy", "medium", "perfect"])
+    parser.add_argument("--games", type=int, default=10000, help="games per difficulty, theme and pairing")
+    parser.add_argument("--difficulty", nargs="+", choices=list(DIFFICULTIES), default=list(DIFFICULTIES))
+    parser.add_argument("--themes", nargs="+", default=["Food"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: tournaments/<seed>.json in the data folder)")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint")
+    options = parser.parse_args(args)
+
+    #Fail early on a bad strategy name instead of in every worker
+    for name in options.strategies:
+        try:
+            make_strategy(name, random.Random())
+        except (ValueError, ImportError, AttributeError) as error:
+            parser.error(f"bad strategy {name!r}: {error}")
+
+    tournament = Tournament(options.strategies, options.games, options.difficulty, options.themes, options.seed, options.chunk)
+    checkpoint = options.checkpoint or data_path("tournaments", f"{options.seed}.json")
+    if options.resume and os.path.exists(checkpoint):
+        tournament.resume(checkpoint)
+        print(f"resuming {checkpoint}: {len(tournament.done)} chunks already played", file=sys.stderr)
+
+    try:
+        played, elapsed = tournament.run(options.workers, checkpoint)
+    except KeyboardInterrupt:
+        save_checkpoint(checkpoint, tournament.config(), tournament.results, tournament.done)
+        print(f"interrupted, progress saved to {checkpoint} (run again with --resume)", file=sys.stderr)
+        return 1
+    print(f"{played:,} games in {elapsed:.1f}s ({played / max(elapsed, 1e-9):,.0f} games/s)", file=sys.stderr)
+    tournament.report()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))